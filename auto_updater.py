@@ -1,53 +1,83 @@
-import requests
 import sys
 import os
+import asyncio
 import tempfile
 import subprocess
-from typing import Optional
+from typing import Optional, Tuple
 
 import logger_util
-from config import APP_VERSION, GITHUB_USER, GITHUB_REPO, ASSET_NAME
+from downloader import DownloadCancelled, DownloadError, ProgressCallback, RangeDownloader, fetch_manifest
+from config import APP_VERSION, GITHUB_USER, GITHUB_REPO, ASSET_NAME, MANIFEST_NAME, UPDATE_SEGMENTS
+
+# requests importowany dopiero przy sprawdzaniu aktualizacji — nie spowalnia startu GUI
 
 # ====== API ======
-def get_latest_release():
+def get_release_info() -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """(wersja, URL pliku EXE, URL manifestu z sumami albo None) najnowszego wydania."""
     try:
+        import requests
         url = f"https://api.github.com/repos/{GITHUB_USER}/{GITHUB_REPO}/releases/latest"
         logger_util.log_info("🔍 Sprawdzanie najnowszego wydania z GitHub...")
         r = requests.get(url, timeout=10)
         if r.status_code == 200:
             data = r.json()
             tag = data.get("tag_name", "")
-            asset_url = None
-            for asset in data.get("assets", []):
-                if asset.get("name") == ASSET_NAME:
-                    asset_url = asset.get("browser_download_url")
-                    break
+            urls = {asset.get("name"): asset.get("browser_download_url") for asset in data.get("assets", [])}
+            asset_url = urls.get(ASSET_NAME)
             if tag and asset_url:
                 logger_util.log_info(f"✅ Znaleziono wydanie: {tag}")
-                return tag.lstrip("v"), asset_url
+                return tag.lstrip("v"), asset_url, urls.get(MANIFEST_NAME)
             logger_util.log_warning("⚠ Brak oczekiwanego assetu w releasie.")
         else:
             logger_util.log_error(f"Nieprawidłowy kod HTTP: {r.status_code}")
     except Exception as e:
         logger_util.log_error(f"[get_latest_release] Błąd: {e}")
-    return None, None
+    return None, None, None
+
+def get_latest_release():
+    version, asset_url, _ = get_release_info()
+    return version, asset_url
+
+def _update_path() -> str:
+    # stała ścieżka — przerwane pobieranie (.part) jest wznawiane przy następnej próbie
+    return os.path.join(tempfile.gettempdir(), f"{os.path.splitext(ASSET_NAME)[0]}_new.exe")
 
-def download_new_version(url) -> Optional[str]:
+def download_new_version(url, manifest_url: Optional[str] = None,
+                         progress_cb: Optional[ProgressCallback] = None,
+                         downloader: Optional[RangeDownloader] = None) -> Optional[str]:
+    """
+    Pobiera aktualizację (wznawialnie, UPDATE_SEGMENTS równoległych zakresów) i sprawdza ją
+    sumą SHA-256 z manifestu wydania. Bez manifestu sprawdzany jest tylko rozmiar.
+    downloader — gotowy RangeDownloader (np. z GUI, żeby móc go przerwać); wtedy url i progress_cb są pomijane.
+    """
     try:
-        temp_exe = os.path.join(tempfile.gettempdir(), f"{os.path.splitext(ASSET_NAME)[0]}_new.exe")
-        logger_util.log_info(f"⬇️ Pobieranie nowej wersji z: {url}")
-        with requests.get(url, stream=True, timeout=60) as r:
-            r.raise_for_status()
-            with open(temp_exe, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-        logger_util.log_info("✅ Plik aktualizacji zapisany.")
-        return temp_exe
+        if downloader is None:
+            downloader = make_update_downloader(url, manifest_url, progress_cb)
+        logger_util.log_info(f"⬇️ Pobieranie nowej wersji z: {downloader.url}")
+        path = downloader.run()
+        logger_util.log_info("✅ Plik aktualizacji zapisany i zweryfikowany.")
+        return path
+    except DownloadCancelled:
+        logger_util.log_info("⏹ Pobieranie aktualizacji przerwane — zostanie wznowione przy następnej próbie.")
+        return None
     except Exception as e:
         logger_util.log_error(f"[download_new_version] Błąd: {e}")
         return None
 
+def make_update_downloader(url, manifest_url: Optional[str] = None,
+                           progress_cb: Optional[ProgressCallback] = None) -> RangeDownloader:
+    """RangeDownloader aktualizacji; suma i rozmiar z manifestu (blokujące — wołać w wątku)."""
+    sha256 = size = None
+    if manifest_url:
+        found = fetch_manifest(manifest_url, ASSET_NAME)
+        if found is None:
+            raise DownloadError(f"Brak {ASSET_NAME} w manifeście {MANIFEST_NAME}")
+        sha256, size = found
+    else:
+        logger_util.log_warning(f"⚠ Wydanie bez {MANIFEST_NAME} — sprawdzany będzie tylko rozmiar pliku.")
+    return RangeDownloader(url, _update_path(), sha256=sha256, size=size,
+                           segments=UPDATE_SEGMENTS, progress_cb=progress_cb)
+
 def launch_updater_bat(current_exe: str, new_exe: str):
     """
     Zamienia uruchomione EXE po zamknięciu procesu i restartuje aplikację.
@@ -89,7 +119,7 @@ def _current_binary_path() -> str:
 def check_for_update_console():
     try:
         logger_util.log_info("🧪 Sprawdzanie dostępności aktualizacji...")
-        latest_version, download_url = get_latest_release()
+        latest_version, download_url, manifest_url = get_release_info()
         if not latest_version or latest_version == APP_VERSION:
             logger_util.log_info("🆗 Brak nowej wersji lub już aktualna.")
             return
@@ -100,7 +130,11 @@ def check_for_update_console():
             logger_util.log_info("Aktualizacja pominięta przez użytkownika.")
             return
 
-        new_exe = download_new_version(download_url)
+        def _progress(done, total):
+            print(f"\r⬇️ {done // 1024} / {total // 1024 if total else '?'} KB", end="", flush=True)
+
+        new_exe = download_new_version(download_url, manifest_url, _progress)
+        print()
         if new_exe:
             print("✅ Aktualizacja pobrana. Trwa restart…")
             launch_updater_bat(_current_binary_path(), new_exe)
@@ -109,33 +143,95 @@ def check_for_update_console():
     except Exception as e:
         logger_util.log_error(f"[check_for_update_console] Błąd: {e}")
 
+def _ask_install_gui(parent, latest_version: str) -> bool:
+    from PySide6.QtWidgets import QMessageBox
+    ret = QMessageBox.question(
+        parent, "Aktualizacja dostępna",
+        f"Nowa wersja: {latest_version}\nTwoja wersja: {APP_VERSION}\n\nZainstalować teraz?",
+        QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes
+    )
+    if ret != QMessageBox.Yes:
+        logger_util.log_info("Aktualizacja pominięta przez użytkownika (GUI).")
+        return False
+    return True
+
+
+def _install_gui(parent, new_exe: Optional[str]):
+    from PySide6.QtWidgets import QMessageBox
+    if new_exe:
+        QMessageBox.information(parent, "Aktualizacja", "Pobrano nową wersję. Aplikacja uruchomi się ponownie.")
+        launch_updater_bat(_current_binary_path(), new_exe)
+    else:
+        QMessageBox.critical(parent, "Aktualizacja", "Nie udało się pobrać aktualizacji. Szczegóły w logach.")
+
+
 def check_for_update_gui(parent=None, ask=True):
     """
     Wersja do GUI (PySide6). Jeśli ask=True, pokaże pytanie.
+    Blokuje wątek GUI na czas zapytań — w oknie używaj check_for_update_gui_async.
     """
     try:
-        from PySide6.QtWidgets import QMessageBox
         logger_util.log_info("🧪 (GUI) Sprawdzanie aktualizacji…")
-        latest_version, download_url = get_latest_release()
+        latest_version, download_url, manifest_url = get_release_info()
         if not latest_version or latest_version == APP_VERSION:
             logger_util.log_info("🆗 Brak nowej wersji lub już aktualna.")
             return
+        if ask and not _ask_install_gui(parent, latest_version):
+            return
+        _install_gui(parent, download_new_version(download_url, manifest_url))
+    except Exception as e:
+        logger_util.log_error(f"[check_for_update_gui] Błąd: {e}")
 
-        if ask:
-            ret = QMessageBox.question(
-                parent, "Aktualizacja dostępna",
-                f"Nowa wersja: {latest_version}\nTwoja wersja: {APP_VERSION}\n\nZainstalować teraz?",
-                QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes
-            )
-            if ret != QMessageBox.Yes:
-                logger_util.log_info("Aktualizacja pominięta przez użytkownika (GUI).")
-                return
-
-        new_exe = download_new_version(download_url)
-        if new_exe:
-            QMessageBox.information(parent, "Aktualizacja", "Pobrano nową wersję. Aplikacja uruchomi się ponownie.")
-            launch_updater_bat(_current_binary_path(), new_exe)
-        else:
-            QMessageBox.critical(parent, "Aktualizacja", "Nie udało się pobrać aktualizacji. Szczegóły w logach.")
+
+async def check_for_update_gui_async(parent=None, ask=True):
+    """
+    Jak check_for_update_gui, ale zapytanie do GitHub i pobieranie idą w wątku w tle
+    (asyncio.to_thread), a pętla zdarzeń Qt (qasync) działa dalej — okno nie zamarza.
+    Postęp pobierania w QProgressDialog; „Anuluj” przerywa pobieranie, a pobrane części
+    zostają i są wznawiane przy następnym sprawdzeniu aktualizacji.
+    """
+    try:
+        logger_util.log_info("🧪 (GUI) Sprawdzanie aktualizacji w tle…")
+        latest_version, download_url, manifest_url = await asyncio.to_thread(get_release_info)
+        if not latest_version or latest_version == APP_VERSION:
+            logger_util.log_info("🆗 Brak nowej wersji lub już aktualna.")
+            return
+        if ask and not _ask_install_gui(parent, latest_version):
+            return
+
+        from PySide6.QtWidgets import QProgressDialog
+        dialog = QProgressDialog("Pobieranie aktualizacji…", "Anuluj", 0, 0, parent)
+        dialog.setWindowTitle("Aktualizacja")
+        dialog.setMinimumDuration(0)
+        loop = asyncio.get_running_loop()
+
+        def _show(done: int, total: Optional[int]):
+            # wątek GUI
+            if total:
+                dialog.setMaximum(1000)
+                dialog.setValue(min(1000, done * 1000 // total))
+            dialog.setLabelText(f"Pobieranie aktualizacji… {done / 2**20:.1f} / "
+                                f"{f'{total / 2**20:.1f}' if total else '?'} MB")
+
+        def _progress(done: int, total: Optional[int]):
+            # wątek pobierania
+            loop.call_soon_threadsafe(_show, done, total)
+
+        try:
+            downloader = await asyncio.to_thread(make_update_downloader, download_url, manifest_url, _progress)
+        except Exception as e:
+            logger_util.log_error(f"[check_for_update_gui_async] Błąd manifestu: {e}")
+            _install_gui(parent, None)
+            return
+        dialog.canceled.connect(downloader.cancel)
+        dialog.show()
+        try:
+            new_exe = await asyncio.to_thread(download_new_version, None, downloader=downloader)
+        finally:
+            dialog.canceled.disconnect(downloader.cancel)
+            dialog.close()
+        if new_exe is None and downloader.cancelled:
+            return
+        _install_gui(parent, new_exe)
     except Exception as e:
-        logger_util.log_error(f"[check_for_update_gui] Błąd: {e}")
\ No newline at end of file
+        logger_util.log_error(f"[check_for_update_gui_async] Błąd: {e}")
@@ -0,0 +1,314 @@
+import sys
+import json
+import signal
+import asyncio
+import aiohttp
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import logger_util
+from collector_core import (new_session, stream_city, make_details_fetcher, finish_details, record_run_totals,
+                            start_plan, tracks_term_yield, use_two_phase)
+from metrics import RunMetrics
+from progress import ProgressTracker, ProgressSnapshot, format_progress
+from run_control import RunControl, is_cancelled
+from place_details import DEFAULT_DETAILS_CONCURRENCY
+from pipeline import Pipeline, SaveCallback, DEFAULT_FLUSH_ROWS, DEFAULT_FLUSH_SECONDS
+from sinks import Sink, ExcelSink, make_sinks
+from request_scheduler import RequestScheduler, DEFAULT_MAX_CONCURRENCY, DEFAULT_QPS
+from pagination import PageTokenPacer
+from geocode_cache import GeocodeCache
+from response_cache import ResponseCache
+from run_journal import RunJournal
+from term_planner import TermPlanner, TermPlan
+from key_pool import KeyPool
+from tiling import DEFAULT_MIN_TILE_M
+
+
+DEFAULT_CITY_CONCURRENCY = 4  # ile miast jednocześnie (zapytania i tak ogranicza scheduler)
+
+
+@dataclass
+class BatchResult:
+    total: int = 0              # wszystkie znalezione (z duplikatami)
+    unique: int = 0             # po dedup między wszystkimi miastami
+    added: int = 0              # dopisane do pierwszego wyjścia
+    per_city: List[Tuple[str, int, int]] = field(default_factory=list)  # (miasto, promień_m, znalezione)
+    failed: List[str] = field(default_factory=list)                     # miasta bez współrzędnych
+    unsaved: List[Tuple[str, int]] = field(default_factory=list)        # (miasto, promień_m) z nieudanym zapisem (dziennik zostaje)
+
+
+async def run_batch(jobs: Sequence[Tuple[str, int]],
+                    api_key: str,
+                    categories: Iterable[str],
+                    filename: str = "firmy.xlsx",
+                    log_cb: Optional[Callable[[str], None]] = None,
+                    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                    qps: float = DEFAULT_QPS,
+                    city_concurrency: int = DEFAULT_CITY_CONCURRENCY,
+                    geocode_cache: Optional[GeocodeCache] = None,
+                    response_cache: Optional[ResponseCache] = None,
+                    tiling: bool = False,
+                    min_tile_m: int = DEFAULT_MIN_TILE_M,
+                    shard_by: Optional[str] = None,
+                    sinks: Optional[List[Sink]] = None,
+                    flush_rows: int = DEFAULT_FLUSH_ROWS,
+                    flush_seconds: float = DEFAULT_FLUSH_SECONDS,
+                    resume: bool = False,
+                    journal: Optional[RunJournal] = None,
+                    two_phase: bool = False,
+                    details_concurrency: int = DEFAULT_DETAILS_CONCURRENCY,
+                    metrics: Optional[RunMetrics] = None,
+                    save_cb: Optional[SaveCallback] = None,
+                    progress_cb: Optional[Callable[[ProgressSnapshot], None]] = None,
+                    progress_interval: float = 5.0,
+                    control: Optional[RunControl] = None,
+                    planner: Optional[TermPlanner] = None,
+                    key_pool: Optional[KeyPool] = None) -> BatchResult:
+    """
+    Przetwarza listę (miasto, promień_m) na jednej sesji HTTP i jednym budżecie zapytań
+    (wspólny RequestScheduler), deduplikuje przyrostowo między wszystkimi miastami
+    i zapisuje partiami w trakcie batcha (jeden Pipeline: co flush_rows rekordów / flush_seconds).
+    shard_by="month"/"city" — zapis append-only do shardów (przy "city" jedna część na miasto).
+    sinks — lista wyjść; domyślnie sam Excel (`filename`).
+    resume=True — miasta przerwane w poprzednim przebiegu są wznawiane z dziennika (jak w run_collection).
+    two_phase=True — tanie wyszukiwanie samych ID, Place Details tylko dla nowych firm (jak w run_collection).
+    metrics — RunMetrics dla całego batcha; save_cb — zdarzenia zapisu (zapis idzie w osobnym wątku).
+    progress_cb — postęp całego batcha (ProgressSnapshot) co progress_interval sekund; mianownik
+    obejmuje szacunek zapytań dla miast jeszcze nierozpoczętych.
+    control — pauza/przerwanie (RunControl); po cancel() pobrane strony są zapisywane, a nieukończone
+    miasta zostają w dzienniku do wznowienia (--resume).
+    planner — planer fraz (jak w run_collection), osobny plan dla każdego miasta; w trybie dwufazowym
+    statystyki nie są aktualizowane (tracks_term_yield).
+    key_pool — pula kluczy API (jak w run_collection); przepustowość batcha to suma limitów QPS kluczy.
+    """
+    log = log_cb or logger_util.log_info
+    categories = list(categories)
+    result = BatchResult()
+    if key_pool is not None and control is None:
+        control = RunControl()
+    scheduler = RequestScheduler(max_concurrency=max_concurrency, qps=qps, metrics=metrics, control=control,
+                                 keys=key_pool)
+    pacer = PageTokenPacer()
+    city_slots = asyncio.Semaphore(max(1, city_concurrency))
+    owned_sinks: List[Sink] = []  # domyślne wyjście tworzone tutaj — zamykane po zapisie (indeks SQLite)
+    if sinks is None:
+        sinks = owned_sinks = [ExcelSink(filename, shard_by)]
+    two_phase = use_two_phase(two_phase, sinks, log_cb)
+    pipeline = Pipeline(sinks, flush_rows=flush_rows, flush_seconds=flush_seconds, metrics=metrics,
+                        save_cb=save_cb, term_yield=tracks_term_yield(planner, two_phase))
+    done: List[Tuple[str, int]] = []
+    journal = journal if journal is not None else RunJournal()
+    for city, radius_m in jobs:
+        if not resume:
+            journal.discard(city, radius_m)
+        elif journal.has_city(city, radius_m):
+            log(f"⏯ Wznawiam przerwany przebieg: {city} ({radius_m // 1000} km)")
+
+    progress = ProgressTracker(progress_cb, progress_interval) if progress_cb is not None else None
+    if progress is not None:
+        progress.expect_cities(len(jobs))
+    details = None
+    plans: Dict[Tuple[str, int], Optional[TermPlan]] = {
+        job: start_plan(planner, job[0], categories, metrics) for job in dict.fromkeys(jobs)}
+    for job, plan in plans.items():
+        if plan is not None and pipeline.term_yield is not None:
+            pipeline.term_yield.set_order(job, plan.terms)
+
+    async def _one(session: aiohttp.ClientSession, city: str, radius_m: int) -> None:
+        async with city_slots:
+            found = await stream_city(session, api_key, city, radius_m, categories,
+                                      scheduler, pacer, pipeline.put, progress, log_cb,
+                                      geocode_cache, response_cache, tiling, min_tile_m, journal, details,
+                                      plans[(city, radius_m)])
+        if not found:
+            result.failed.append(city)
+            return
+        done.append((city, radius_m))
+
+    async def _all(session: aiohttp.ClientSession) -> None:
+        await asyncio.gather(*(_one(session, city, radius_m) for city, radius_m in jobs))
+
+    try:
+        async with new_session() as session:
+            if two_phase:
+                details = make_details_fetcher(session, api_key, scheduler, sinks, details_concurrency, log_cb,
+                                               progress, response_cache)
+            fetch = _all(session)
+            if control is not None:
+                fetch = control.attach(asyncio.ensure_future(fetch))
+            try:
+                await pipeline.run(fetch, on_produced=progress.finish if progress is not None else None)
+            except asyncio.CancelledError:
+                if not is_cancelled(control):
+                    raise
+                log(f"⏹ Przerwano batch — zapisano dotychczasowe wyniki, nieukończone miasta "
+                    f"({len(jobs) - len(done) - len(result.failed)}) można wznowić z --resume")
+            if details is not None:
+                finish_details(details, sinks)
+    finally:
+        for sink in owned_sinks:
+            sink.close()
+    if metrics is not None:
+        record_run_totals(metrics, pipeline, pacer, response_cache)
+    if key_pool is not None:
+        key_pool.save()
+        log(key_pool.summary())
+    # wyniki zapisane — stan ukończonych miast nie jest już potrzebny (poza miastami z nieudanym zapisem)
+    result.unsaved = sorted(pipeline.failed_cities)
+    if result.unsaved:
+        unsaved = ", ".join(f"{city} ({radius_m // 1000} km)" for city, radius_m in result.unsaved)
+        log(f"❌ Nie udało się zapisać części wyników: {unsaved} — dziennik tych miast zostaje, "
+            f"zamknij plik wyników i uruchom ponownie z --resume")
+    for city, radius_m in done:
+        if (city, radius_m) in pipeline.failed_cities:
+            continue
+        journal.discard(city, radius_m)
+        plan = plans[(city, radius_m)]
+        if plan is not None and pipeline.term_yield is not None:
+            planner.record(plan, *pipeline.term_yield.for_city((city, radius_m)))
+    if pipeline.term_yield is not None:
+        planner.save()
+
+    result.total = pipeline.total
+    result.unique = pipeline.unique
+    result.added = pipeline.added
+    result.per_city = [(city, radius_m, pipeline.city_totals.get((city, radius_m), 0)) for city, radius_m in done]
+    for city, radius_m, found in result.per_city:
+        log(f"🏙 {city} ({radius_m // 1000} km): znaleziono {found}, "
+            f"nowych w batchu {pipeline.city_unique.get((city, radius_m), 0)}")
+    log(f"✅ Batch: {len(jobs)} miast, znaleziono {result.total}, unikalne {result.unique}, "
+        f"zapisano {result.added}, zapytań {scheduler.requests_sent}")
+    return result
+
+
+def parse_jobs(lines: Iterable[str], default_radius_km: int) -> List[Tuple[str, int]]:
+    """
+    Linie w formacie `Miasto` lub `Miasto;promień_km` (także `Miasto:promień_km`).
+    Puste linie i komentarze (#) są pomijane.
+    """
+    jobs: List[Tuple[str, int]] = []
+    for raw in lines:
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        city, radius_km = line, default_radius_km
+        for sep in (";", ":"):
+            if sep in line:
+                city, _, r = line.rpartition(sep)
+                radius_km = int(r.strip())
+                break
+        if not (0 < radius_km <= 50):
+            raise ValueError(f"Promień musi być w zakresie 1–50 km: {line}")
+        jobs.append((city.strip(), radius_km * 1000))
+    return jobs
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Wsadowe (bez GUI) zbieranie firm dla wielu miast")
+    parser.add_argument("cities", nargs="*", help="Miasta: `Warszawa` lub `Warszawa:20` (km)")
+    parser.add_argument("-f", "--file", help="Plik z miastami, po jednym w linii (`Miasto;km`)")
+    parser.add_argument("-r", "--radius", type=int, default=10, help="Domyślny promień [km]")
+    parser.add_argument("-o", "--output", default="firmy.xlsx", help="Plik Excela")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--categories", default="categories.json")
+    parser.add_argument("--tiling", action="store_true", help="Adaptacyjny podział na kafle")
+    parser.add_argument("--replay", action="store_true", help="Tylko z cache odpowiedzi (bez sieci)")
+    parser.add_argument("--shard-by", choices=["month", "city"],
+                        help="Zapis append-only do katalogu shardów zamiast do jednego pliku")
+    parser.add_argument("--sinks", help="Wyjścia po przecinku: excel,csv,parquet,sqlite (domyślnie excel)")
+    parser.add_argument("--city-concurrency", type=int, default=DEFAULT_CITY_CONCURRENCY)
+    parser.add_argument("--two-phase", action="store_true",
+                        help="Najpierw same ID, pełne dane tylko dla nowych firm")
+    parser.add_argument("--metrics", metavar="KATALOG",
+                        help="Eksport metryk przebiegu (last_run.json i last_run.prom)")
+    parser.add_argument("--resume", action="store_true", help="Wznów przerwany przebieg z dziennika")
+    parser.add_argument("--plan-terms", action="store_true",
+                        help="Planer fraz: pomijaj/przycinaj frazy, które w tym mieście prawie zawsze dublują inne")
+    parser.add_argument("--flush-rows", type=int, default=DEFAULT_FLUSH_ROWS,
+                        help="Zapis partiami co tyle nowych rekordów")
+    parser.add_argument("--progress", type=float, default=10.0, metavar="SEKUNDY",
+                        help="Linia postępu (zapytania, ETA) co tyle sekund; 0 wyłącza")
+    args = parser.parse_args(argv)
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    with open(args.categories, "r", encoding="utf-8") as f:
+        categories = json.load(f).get("categories", [])
+
+    lines = list(args.cities)
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            lines.extend(f.read().splitlines())
+    jobs = parse_jobs(lines, args.radius)
+    if not jobs or not categories:
+        parser.error("Brak miast lub kategorii.")
+
+    ttl_h = float(config.get("RESPONSE_CACHE_TTL_H", 6))
+    response_cache = None
+    if ttl_h > 0 or args.replay:
+        response_cache = ResponseCache(ttl_seconds=ttl_h * 3600, replay=args.replay)
+
+    shard_by = args.shard_by or config.get("SHARD_BY")
+    sink_names = args.sinks.split(",") if args.sinks else config.get("SINKS", ["excel"])
+    sinks = make_sinks([n.strip() for n in sink_names], args.output, shard_by)
+
+    metrics = RunMetrics() if args.metrics else None
+    control = RunControl()
+    qps = float(config.get("QPS", DEFAULT_QPS))
+    key_pool = KeyPool.from_config(config, qps)
+    api_key = config.get("API_KEY") or (key_pool.primary if key_pool is not None else None)
+    if not api_key:
+        parser.error("Brak API_KEY/API_KEYS w konfiguracji.")
+
+    async def _run() -> BatchResult:
+        # pierwszy Ctrl+C: przerwanie z zapisem pobranych stron; drugi — zwykły KeyboardInterrupt
+        loop = asyncio.get_running_loop()
+
+        def _interrupt() -> None:
+            print("⏹ Przerywam — zapisuję pobrane wyniki (ponowny Ctrl+C kończy natychmiast)")
+            loop.remove_signal_handler(signal.SIGINT)
+            control.cancel()
+
+        try:
+            loop.add_signal_handler(signal.SIGINT, _interrupt)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows — bez obsługi sygnałów w pętli zdarzeń
+        return await run_batch(
+            jobs, api_key, categories,
+            filename=args.output,
+            log_cb=print,
+            max_concurrency=int(config.get("MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+            qps=qps,
+            city_concurrency=args.city_concurrency,
+            response_cache=response_cache,
+            tiling=args.tiling or bool(config.get("TILING", False)),
+            shard_by=shard_by,
+            sinks=sinks,
+            flush_rows=args.flush_rows,
+            flush_seconds=float(config.get("FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS)),
+            resume=args.resume,
+            two_phase=args.two_phase or bool(config.get("TWO_PHASE", False)),
+            metrics=metrics,
+            progress_cb=(lambda snap: print(format_progress(snap))) if args.progress > 0 else None,
+            progress_interval=args.progress,
+            control=control,
+            planner=TermPlanner(prune=args.plan_terms or bool(config.get("TERM_PLANNER", False))),
+            key_pool=key_pool,
+        )
+
+    result = asyncio.run(_run())
+    if metrics is not None:
+        metrics.export(args.metrics)
+        print(metrics.summary())
+    for sink in sinks:
+        sink.close()
+    if result.failed:
+        print(f"⚠ Brak współrzędnych: {', '.join(result.failed)}")
+    return 0 if not result.failed and not result.unsaved else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
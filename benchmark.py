@@ -0,0 +1,488 @@
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import socket
+import asyncio
+import tempfile
+import subprocess
+from typing import Any, Dict, List, Optional, Sequence
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+
+
+# ===== Parametry domyślne =====
+DEFAULT_PLACES = 10_000
+DEFAULT_CATEGORIES = 20
+DEFAULT_RADIUS_KM = 10
+DEFAULT_LATENCY_MS = 50.0
+DEFAULT_JITTER_MS = 20.0
+DEFAULT_SAVE_SIZES = (1_000, 10_000, 50_000)
+DEFAULT_SAVE_BATCH = 1_000
+DEFAULT_TOLERANCE = 0.2         # dopuszczalne pogorszenie względem wyników bazowych (20%)
+RESUME_TIMEOUT = 120.0          # [s] wznowienie przerwanego przebiegu musi się zmieścić w tym czasie
+CENTER = {"lat": 52.2297, "lng": 21.0122}
+PAGE_SIZE = 20
+MAX_RESULTS = 60                # limit wyników na zapytanie (jak w Places API)
+
+
+# ===== Syntetyczny zbiór firm =====
+class SyntheticPlaces:
+    """
+    n firm rozłożonych równomiernie w kwadracie wokół CENTER, każda w jednej z `categories` kategorii.
+    Dane trzymane kolumnowo (numpy), rekordy JSON budowane dopiero przy odpowiedzi — 1M firm to ~20 MB.
+    """
+
+    def __init__(self, n: int, categories: int, radius_m: float, seed: int = 0, website_ratio: float = 0.9):
+        rng = np.random.default_rng(seed)
+        dlat = radius_m / 111_320
+        dlng = radius_m / (111_320 * math.cos(math.radians(CENTER["lat"])))
+        self.n = n
+        self.categories = max(1, categories)
+        self.lat = CENTER["lat"] + rng.uniform(-dlat, dlat, n)
+        self.lng = CENTER["lng"] + rng.uniform(-dlng, dlng, n)
+        self.has_website = rng.random(n) < website_ratio
+        cat = rng.integers(0, self.categories, n)
+        # indeksy posortowane po kategorii — wyszukiwanie przegląda tylko jedną kategorię
+        self._order = np.argsort(cat, kind="stable")
+        self._starts = np.searchsorted(cat[self._order], np.arange(self.categories + 1))
+
+    def category_of(self, term: str) -> int:
+        return zlib.crc32(term.encode("utf-8")) % self.categories
+
+    def search(self, term: str, low: Dict[str, float], high: Dict[str, float]) -> np.ndarray:
+        c = self.category_of(term)
+        idx = self._order[self._starts[c]:self._starts[c + 1]]
+        lat, lng = self.lat[idx], self.lng[idx]
+        inside = ((lat >= low["latitude"]) & (lat <= high["latitude"])
+                  & (lng >= low["longitude"]) & (lng <= high["longitude"]))
+        return idx[inside]
+
+    def place(self, i: int, full: bool = True) -> Dict[str, Any]:
+        i = int(i)
+        return synthetic_place(i, bool(self.has_website[i])) if full else {"id": f"bench{i:07d}"}
+
+
+def synthetic_place(i: int, has_website: bool = True) -> Dict[str, Any]:
+    """Rekord firmy nr i w formacie Places API (numer telefonu i ID unikalne dla i)."""
+    digits = f"{500_000_000 + i:09d}"
+    place = {
+        "id": f"bench{i:07d}",
+        "displayName": {"text": f"Firma {i}"},
+        "formattedAddress": f"ul. Testowa {i % 200 + 1}, 00-{i % 1000:03d} Warszawa",
+        "internationalPhoneNumber": f"+48 {digits[:3]} {digits[3:6]} {digits[6:]}",
+    }
+    if has_website:
+        place["websiteUri"] = f"https://firma{i}.pl/"
+    return place
+
+
+def synthetic_rows(start: int, count: int, term: str = "benchmark") -> List[List[str]]:
+    """Wiersze w formacie collector_core (do pomiaru zapisu)."""
+    rows = []
+    for i in range(start, start + count):
+        p = synthetic_place(i)
+        rows.append([term, p["websiteUri"], p["displayName"]["text"], p["formattedAddress"],
+                     p["internationalPhoneNumber"], p["id"]])
+    return rows
+
+
+# ===== Lokalny zamiennik Geocoding/Places API =====
+class FakeGoogleServer:
+    """
+    Serwer aiohttp udający geocode/json, v1/places:searchText (z pageToken) i v1/places/{id}.
+    latency_ms/jitter_ms — opóźnienie odpowiedzi; rate_429 — odsetek odpowiedzi 429;
+    token_delay — ile sekund nowy pageToken zwraca 400 INVALID_ARGUMENT.
+    """
+
+    def __init__(self, dataset: SyntheticPlaces, latency_ms: float = DEFAULT_LATENCY_MS,
+                 jitter_ms: float = DEFAULT_JITTER_MS, rate_429: float = 0.0,
+                 token_delay: float = 0.0, seed: int = 0):
+        self.dataset = dataset
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.token_delay = token_delay
+        self._rng = random.Random(seed)
+        self._tokens: Dict[str, tuple] = {}
+
+    async def _delay(self) -> None:
+        ms = max(0.0, self._rng.gauss(self.latency_ms, self.jitter_ms))
+        await asyncio.sleep(ms / 1000)
+
+    def _throttled(self) -> Optional[web.Response]:
+        if self.rate_429 and self._rng.random() < self.rate_429:
+            return web.json_response({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}},
+                                     status=429, headers={"Retry-After": "1"})
+        return None
+
+    async def geocode(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return self._throttled() or web.json_response(
+            {"status": "OK", "results": [{"geometry": {"location": CENTER}}]})
+
+    async def search(self, request: web.Request) -> web.Response:
+        await self._delay()
+        throttled = self._throttled()
+        if throttled:
+            return throttled
+        body = await request.json()
+        full = "places.internationalPhoneNumber" in request.headers.get("X-Goog-FieldMask", "")
+        token = body.get("pageToken")
+        if token:
+            state = self._tokens.get(token)
+            if state is None or time.monotonic() - state[2] < self.token_delay:
+                return web.json_response({"error": {"code": 400, "status": "INVALID_ARGUMENT"}}, status=400)
+            hits, offset, _ = state
+        else:
+            rect = body["locationRestriction"]["rectangle"]
+            hits, offset = self.dataset.search(body["textQuery"], rect["low"], rect["high"])[:MAX_RESULTS], 0
+        page = hits[offset:offset + PAGE_SIZE]
+        data: Dict[str, Any] = {"places": [self.dataset.place(i, full) for i in page]} if len(page) else {}
+        if offset + PAGE_SIZE < len(hits):
+            next_token = f"t{len(self._tokens)}"
+            self._tokens[next_token] = (hits, offset + PAGE_SIZE, time.monotonic())
+            data["nextPageToken"] = next_token
+        return web.json_response(data)
+
+    async def details(self, request: web.Request) -> web.Response:
+        await self._delay()
+        throttled = self._throttled()
+        if throttled:
+            return throttled
+        place_id = request.match_info["place_id"]
+        try:
+            i = int(place_id.removeprefix("bench"))
+        except ValueError:
+            i = -1
+        if not 0 <= i < self.dataset.n:
+            return web.json_response({"error": {"code": 404, "status": "NOT_FOUND"}}, status=404)
+        return web.json_response(self.dataset.place(i))
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/maps/api/geocode/json", self.geocode)
+        app.router.add_post("/v1/places:searchText", self.search)
+        app.router.add_get("/v1/places/{place_id}", self.details)
+        return app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args) -> subprocess.Popen:
+    """Serwer w osobnym procesie — jego pamięć i CPU nie zaburzają pomiarów klienta."""
+    cmd = [sys.executable, os.path.abspath(__file__), "serve", "--port", str(args.port),
+           "--places", str(args.places), "--categories", str(args.categories),
+           "--radius", str(args.radius), "--latency-ms", str(args.latency_ms),
+           "--jitter-ms", str(args.jitter_ms), "--rate-429", str(args.rate_429),
+           "--token-delay", str(args.token_delay), "--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("Serwer benchmarku zakończył się przy starcie")
+        try:
+            with socket.create_connection(("127.0.0.1", args.port), timeout=0.2):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("Serwer benchmarku nie wystartował w 60 s")
+
+
+def point_to(base_url: str) -> None:
+    """Przekierowuje adresy API kolektora na lokalny serwer."""
+    import collector_core
+    import place_details
+    collector_core.GEOCODE_URL = f"{base_url}/maps/api/geocode/json"
+    collector_core.PLACES_SEARCH_URL = f"{base_url}/v1/places:searchText"
+    place_details.PLACE_DETAILS_URL = base_url + "/v1/places/{place_id}"
+
+
+# ===== Pomiary =====
+class RequestTimings:
+    """Czasy zapytań z aiohttp.TraceConfig (od wysłania do nagłówków odpowiedzi) i statusy."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Dict[int, int] = {}
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_request_start.append(self._start)
+        self.trace_config.on_request_end.append(self._end)
+
+    async def _start(self, session, ctx, params) -> None:
+        ctx.started = time.perf_counter()
+
+    async def _end(self, session, ctx, params) -> None:
+        self.latencies.append(time.perf_counter() - ctx.started)
+        status = params.response.status
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    return float(np.percentile(values, p)) if len(values) else 0.0
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Szczytowe zużycie pamięci procesu (resource.getrusage; brak na Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+async def bench_collection(args, workdir: str) -> Dict[str, Any]:
+    import collector_core
+    from geocode_cache import GeocodeCache
+    from run_journal import RunJournal
+    from sinks import ExcelSink
+
+    timings = RequestTimings()
+    collector_core.TRACE_CONFIGS.append(timings.trace_config)
+    sink = ExcelSink(os.path.join(workdir, "firmy.xlsx"))
+    categories = [f"kategoria {i}" for i in range(args.categories)]
+    started = time.perf_counter()
+    try:
+        total, unique, added = await collector_core.run_collection(
+            "Benchmark", args.radius * 1000, "benchmark-key", categories,
+            max_concurrency=args.concurrency, qps=args.qps,
+            geocode_cache=GeocodeCache(os.path.join(workdir, "geocode_cache.json")),
+            tiling=args.tiling, sinks=[sink],
+            journal=RunJournal(os.path.join(workdir, "run_journal.jsonl")),
+            two_phase=args.two_phase,
+        )
+    finally:
+        collector_core.TRACE_CONFIGS.remove(timings.trace_config)
+        sink.close()
+    elapsed = time.perf_counter() - started
+    requests = len(timings.latencies)
+    return {
+        "seconds": round(elapsed, 3),
+        "requests": requests,
+        "requests_per_s": round(requests / elapsed, 1) if elapsed else 0.0,
+        "places": total,
+        "places_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+        "unique": unique,
+        "added": added,
+        "latency_p50_ms": round(percentile(timings.latencies, 50) * 1000, 1),
+        "latency_p99_ms": round(percentile(timings.latencies, 99) * 1000, 1),
+        "status_429": timings.statuses.get(429, 0),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def bench_resume(args, workdir: str) -> Dict[str, Any]:
+    """
+    Przerwanie przebiegu w trakcie paginacji (RunControl.cancel po pierwszych stronach)
+    i wznowienie z dziennika (resume=True): wznowienie kontynuuje paginację od zapisanych tokenów,
+    musi się zakończyć w RESUME_TIMEOUT i dać ten sam zbiór firm co przebieg bez przerwy.
+    """
+    import collector_core
+    from geocode_cache import GeocodeCache
+    from run_journal import RunJournal
+    from run_control import RunControl
+    from sinks import CsvSink
+
+    categories = [f"kategoria {i}" for i in range(args.categories)]
+    journal_path = os.path.join(workdir, "resume_journal.jsonl")
+    control = RunControl()
+
+    def _cancel_after_first_pages(snap) -> None:
+        if snap.done["page"] >= len(categories):
+            control.cancel()
+
+    def _run(**kwargs):
+        return collector_core.run_collection(
+            "Benchmark", args.radius * 1000, "benchmark-key", categories,
+            max_concurrency=args.concurrency, qps=args.qps,
+            geocode_cache=GeocodeCache(os.path.join(workdir, "resume_geocode.json")),
+            tiling=args.tiling, sinks=[CsvSink(os.path.join(workdir, "resume.csv"))],
+            journal=RunJournal(journal_path), two_phase=args.two_phase, **kwargs)
+
+    await _run(progress_cb=_cancel_after_first_pages, control=control)
+    with open(journal_path, "r", encoding="utf-8") as f:
+        journaled = sum(1 for _ in f)
+    started = time.perf_counter()
+    try:
+        total, unique, _ = await asyncio.wait_for(_run(resume=True), RESUME_TIMEOUT)
+        timed_out = False
+    except asyncio.TimeoutError:
+        total = unique = 0
+        timed_out = True
+    return {
+        "journal_pages": journaled,
+        "seconds": round(time.perf_counter() - started, 3),
+        "places": total,
+        "unique": unique,
+        "timed_out": timed_out,
+    }
+
+
+def bench_saves(args, workdir: str) -> List[Dict[str, Any]]:
+    """Czas zapisu jednego wsadu save_batch wierszy do skoroszytu rosnącego do kolejnych rozmiarów."""
+    from excel_saver import save_to_excel
+
+    path = os.path.join(workdir, "save_bench.xlsx")
+    results = []
+    rows_in_book = 0
+    for size in sorted(args.save_sizes):
+        fill = size - rows_in_book
+        if fill > 0:
+            save_to_excel(synthetic_rows(rows_in_book, fill), filename=path)
+            rows_in_book += fill
+        started = time.perf_counter()
+        save_to_excel(synthetic_rows(rows_in_book, args.save_batch), filename=path)
+        seconds = time.perf_counter() - started
+        rows_in_book += args.save_batch
+        results.append({"workbook_rows": size, "batch": args.save_batch, "seconds": round(seconds, 3)})
+    return results
+
+
+# ===== Porównanie z wynikami bazowymi =====
+# metryka -> True, jeśli większa wartość jest lepsza
+_COMPARED = {"places_per_s": True, "requests_per_s": True, "latency_p99_ms": False, "peak_rss_mb": False}
+
+
+def regressions(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    found = []
+    cur, base = result.get("collection", {}), baseline.get("collection", {})
+    for key, higher_is_better in _COMPARED.items():
+        a, b = cur.get(key), base.get(key)
+        if not a or not b:
+            continue
+        worse = a < b * (1 - tolerance) if higher_is_better else a > b * (1 + tolerance)
+        if worse:
+            found.append(f"{key}: {a} (bazowo {b})")
+    base_saves = {s["workbook_rows"]: s["seconds"] for s in baseline.get("saves", [])}
+    for s in result.get("saves", []):
+        b = base_saves.get(s["workbook_rows"])
+        if b and s["seconds"] > b * (1 + tolerance):
+            found.append(f"zapis przy {s['workbook_rows']} wierszach: {s['seconds']} s (bazowo {b} s)")
+    return found
+
+
+def resume_problems(result: Dict[str, Any]) -> List[str]:
+    """Błędy sprawdzenia wznowienia: limit czasu albo inny zbiór firm niż w przebiegu bez przerwy."""
+    r, c = result.get("resume"), result.get("collection")
+    if not r:
+        return []
+    if r["timed_out"]:
+        return [f"wznowienie nie skończyło się w {RESUME_TIMEOUT:.0f} s"]
+    if c and r["unique"] != c["unique"]:
+        return [f"wznowienie dało {r['unique']} unikalnych firm, przebieg bez przerwy {c['unique']}"]
+    return []
+
+
+def report(result: Dict[str, Any]) -> None:
+    c = result.get("collection")
+    if c:
+        print(f"Zbieranie: {c['seconds']} s, {c['requests']} zapytań ({c['requests_per_s']}/s), "
+              f"{c['places']} firm ({c['places_per_s']}/s), unikalne {c['unique']}, zapisane {c['added']}")
+        print(f"  opóźnienie p50 {c['latency_p50_ms']} ms, p99 {c['latency_p99_ms']} ms, "
+              f"429: {c['status_429']}, szczyt RSS: {c['peak_rss_mb']} MB")
+    r = result.get("resume")
+    if r:
+        state = "PRZEKROCZONY LIMIT CZASU" if r["timed_out"] else f"{r['seconds']} s"
+        print(f"Wznowienie po przerwaniu ({r['journal_pages']} stron w dzienniku): {state}, "
+              f"unikalne {r['unique']}")
+    for s in result.get("saves", []):
+        print(f"Zapis {s['batch']} wierszy do skoroszytu z {s['workbook_rows']} wierszami: {s['seconds']} s")
+    if result.get("peak_rss_mb") is not None:
+        print(f"Szczyt RSS całości: {result['peak_rss_mb']:.0f} MB")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark offline (lokalny zamiennik Geocoding/Places API)")
+    sub = parser.add_subparsers(dest="cmd")
+    for name in ("run", "serve"):
+        p = sub.add_parser(name)
+        p.add_argument("--places", type=int, default=DEFAULT_PLACES, help="Liczba firm w zbiorze (1k–1M)")
+        p.add_argument("--categories", type=int, default=DEFAULT_CATEGORIES)
+        p.add_argument("--radius", type=int, default=DEFAULT_RADIUS_KM, help="Promień [km]")
+        p.add_argument("--latency-ms", type=float, default=DEFAULT_LATENCY_MS)
+        p.add_argument("--jitter-ms", type=float, default=DEFAULT_JITTER_MS)
+        p.add_argument("--rate-429", type=float, default=0.0, help="Odsetek odpowiedzi 429 (0–1)")
+        p.add_argument("--token-delay", type=float, default=0.0, help="Czas aktywacji pageToken [s]")
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--port", type=int, default=0)
+    run = sub.choices["run"]
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--qps", type=float, default=0, help="Limit zapytań/s (0 = bez limitu)")
+    run.add_argument("--tiling", action="store_true")
+    run.add_argument("--two-phase", action="store_true")
+    run.add_argument("--save-sizes", type=lambda s: [int(x) for x in s.split(",")],
+                     default=list(DEFAULT_SAVE_SIZES), help="Rozmiary skoroszytu do pomiaru zapisu")
+    run.add_argument("--save-batch", type=int, default=DEFAULT_SAVE_BATCH)
+    run.add_argument("--skip-collection", action="store_true")
+    run.add_argument("--skip-saves", action="store_true")
+    run.add_argument("--resume-check", action="store_true",
+                     help="Przerwij przebieg w trakcie paginacji i sprawdź wznowienie z dziennika")
+    run.add_argument("--json", help="Zapisz wyniki do pliku JSON")
+    run.add_argument("--baseline", help="Plik JSON z wynikami bazowymi — pogorszenie kończy się kodem 1")
+    run.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "serve":
+        import logging
+        # zapytania anulowane przez klienta (--resume-check) to oczekiwane zerwane połączenia
+        logging.getLogger("aiohttp.server").setLevel(logging.CRITICAL)
+        dataset = SyntheticPlaces(args.places, args.categories, args.radius * 1000, args.seed)
+        server = FakeGoogleServer(dataset, args.latency_ms, args.jitter_ms, args.rate_429,
+                                  args.token_delay, args.seed)
+        web.run_app(server.app(), host="127.0.0.1", port=args.port, print=None, access_log=None)
+        return 0
+    if args.cmd != "run":
+        parser.print_help()
+        return 2
+
+    result: Dict[str, Any] = {"params": {k: v for k, v in vars(args).items()
+                                         if k not in ("json", "baseline", "cmd")}}
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        if not args.skip_collection or args.resume_check:
+            args.port = args.port or _free_port()
+            server = start_server(args)
+            try:
+                point_to(f"http://127.0.0.1:{args.port}")
+                if not args.skip_collection:
+                    result["collection"] = asyncio.run(bench_collection(args, workdir))
+                if args.resume_check:
+                    result["resume"] = asyncio.run(bench_resume(args, workdir))
+            finally:
+                server.terminate()
+                server.wait()
+        if not args.skip_saves:
+            result["saves"] = bench_saves(args, workdir)
+    result["peak_rss_mb"] = peak_rss_mb()
+    report(result)
+
+    failed = resume_problems(result)
+    for line in failed:
+        print(f"❌ {line}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            found = regressions(result, json.load(f), args.tolerance)
+        for line in found:
+            print(f"⚠ Regresja: {line}")
+        return 1 if found or failed else 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,35 @@
 import math
+import time
 import asyncio
 import aiohttp
-from typing import Callable, Iterable, Optional, Dict, Any, List, Tuple
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
 import logger_util
-from excel_saver import save_to_excel
+from sinks import Sink, ExcelSink
+from pipeline import Pipeline, SaveCallback, DEFAULT_FLUSH_ROWS, DEFAULT_FLUSH_SECONDS
+from request_scheduler import RequestScheduler, DEFAULT_MAX_CONCURRENCY, DEFAULT_QPS
+from pagination import PageTokenPacer, PageTokenExpired, is_token_not_ready
+from geocode_cache import GeocodeCache, default_cache
+from response_cache import ResponseCache, cache_key
+from tiling import DEFAULT_MIN_TILE_M, split_bounds, intersects_circle, tile_size_m, is_saturated
+from run_journal import RunJournal, CityJournal, rect_key
+from place_details import PlaceDetailsFetcher, PLACES_ID_FIELD_MASK, DEFAULT_DETAILS_CONCURRENCY
+from phone_index import PhoneIndex
+from metrics import RunMetrics
+from progress import ProgressTracker, ProgressSnapshot, GEOCODE, PAGE, TILE
+from run_control import RunControl, is_cancelled
+from term_planner import TermPlanner, TermPlan
+from key_pool import KeyPool
 
 
-# ===== Pomocnicze =====
-def _norm_phone(s: str) -> str:
-    """Zwraca numer złożony wyłącznie z cyfr (do porównań)."""
-    return ''.join(ch for ch in str(s) if ch.isdigit())
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+PLACES_SEARCH_URL = "https://places.googleapis.com/v1/places:searchText"
+PLACES_FIELD_MASK = (
+    "places.id,places.displayName,places.formattedAddress,places.googleMapsUri,"
+    "places.internationalPhoneNumber,places.websiteUri,nextPageToken"
+)
 
 
+# ===== Pomocnicze =====
 def calculate_bounds(lat: float, lng: float, radius_m: int) -> Dict[str, Dict[str, float]]:
     try:
         delta_lat = radius_m / 111000
@@ -29,23 +47,48 @@ def calculate_bounds(lat: float, lng: float, radius_m: int) -> Dict[str, Dict[st
 
 
 # ===== Sieć =====
+# Dodatkowe aiohttp.TraceConfig dla sesji przebiegu (pomiary czasów zapytań, np. benchmark.py)
+TRACE_CONFIGS: List[aiohttp.TraceConfig] = []
+
+
+def new_session() -> aiohttp.ClientSession:
+    """Sesja HTTP przebiegu (z zarejestrowanymi TRACE_CONFIGS)."""
+    return aiohttp.ClientSession(trace_configs=list(TRACE_CONFIGS) or None)
+
+
 async def get_city_coordinates(session: aiohttp.ClientSession, api_key: str, city_name: str,
-                               log_cb: Optional[Callable[[str], None]] = None) -> Optional[Dict[str, float]]:
+                               log_cb: Optional[Callable[[str], None]] = None,
+                               scheduler: Optional[RequestScheduler] = None,
+                               cache: Optional[GeocodeCache] = None,
+                               offline: bool = False) -> Optional[Dict[str, float]]:
     try:
-        base_url = "https://maps.googleapis.com/maps/api/geocode/json"
+        if cache is not None:
+            cached = cache.get(city_name)
+            if cached:
+                logger_util.log_info(f"📌 Współrzędne z cache: {city_name}")
+                return cached
+        if offline:
+            (log_cb or logger_util.log_warning)(f"⚠ Tryb offline: brak współrzędnych w cache dla: {city_name}")
+            return None
+
         params = {"address": city_name, "key": api_key}
 
-        async with session.get(base_url, params=params) as response:
-            if response.status != 200:
-                text = await response.text()
-                msg = f"❌ Błąd API geocode ({response.status}): {text}"
-                (log_cb or logger_util.log_error)(msg)
-                return None
-            data = await response.json()
+        scheduler = scheduler or RequestScheduler()
+        status, _, data = await scheduler.request(session, "GET", GEOCODE_URL, label="geocode", params=params)
+        if status != 200:
+            msg = f"❌ Błąd API geocode ({status}): {data}"
+            (log_cb or logger_util.log_error)(msg)
+            return None
+        if not isinstance(data, dict):
+            (log_cb or logger_util.log_error)(f"❌ Nieoczekiwana odpowiedź geocode: {data}")
+            return None
 
         if "results" in data and len(data["results"]) > 0:
             loc = data["results"][0]["geometry"]["location"]
-            return {"lat": loc["lat"], "lng": loc["lng"]}
+            coords = {"lat": loc["lat"], "lng": loc["lng"]}
+            if cache is not None:
+                cache.put(city_name, coords)
+            return coords
 
         (log_cb or logger_util.log_warning)(f"⚠ Nie znaleziono współrzędnych dla: {city_name}")
         return None
@@ -54,129 +97,614 @@ async def get_city_coordinates(session: aiohttp.ClientSession, api_key: str, cit
         return None
 
 
-async def fetch_places(session: aiohttp.ClientSession,
-                       api_key: str,
-                       term: str,
-                       location: Dict[str, float],
-                       radius_m: int,
-                       progress_cb: Optional[Callable[[], None]] = None,
-                       log_cb: Optional[Callable[[str], None]] = None) -> List[List[str]]:
-    places_data: List[List[str]] = []
-    next_page_token: Optional[str] = None
-    first_request = True
-    bounds = calculate_bounds(location["lat"], location["lng"], radius_m)
+async def fetch_rect_pages(session: aiohttp.ClientSession,
+                           api_key: str,
+                           term: str,
+                           bounds: Dict[str, Dict[str, float]],
+                           progress: Optional[ProgressTracker] = None,
+                           log_cb: Optional[Callable[[str], None]] = None,
+                           scheduler: Optional[RequestScheduler] = None,
+                           pacer: Optional[PageTokenPacer] = None,
+                           cache: Optional[ResponseCache] = None,
+                           page_token: Optional[str] = None,
+                           details: Optional[PlaceDetailsFetcher] = None,
+                           max_pages: Optional[int] = None
+                           ) -> AsyncIterator[Tuple[List[List[str]], int, Optional[str]]]:
+    """
+    Asynchroniczny generator stron wyników dla frazy w prostokącie.
+    Każda strona to (firmy z telefonem i stroną, liczba_wszystkich_wyników_na_stronie,
+    token_następnej_strony) — suma drugiej wartości służy do wykrycia nasycenia limitu 60 wyników.
+    page_token — kontynuacja paginacji od zapisanego tokenu (wznowienie z dziennika).
+    details — tryb dwufazowy: wyszukiwanie tylko z maską places.id, pełne dane (Place Details)
+    wyłącznie dla firm nieznanych w magazynie.
+    progress — każda strona jest planowana przed zapytaniem (kolejna — gdy przyjdzie nextPageToken)
+    i wycofywana, jeśli paginacja się urwie.
+    max_pages — najwyżej tyle stron (fraza przycięta przez planer fraz); None — pełna paginacja.
+    """
+    scheduler = scheduler or RequestScheduler()
+    pacer = pacer or PageTokenPacer()
+    field_mask = PLACES_ID_FIELD_MASK if details is not None else PLACES_FIELD_MASK
+    next_page_token: Optional[str] = page_token
+    # token z dziennika wydano w poprzednim przebiegu — czas liczymy od wznowienia
+    # (nie od 0.0, co zatrułoby oszacowanie pacera czasem pracy systemu), a jego obserwacji
+    # nie wliczamy do oszacowania
+    token_issued_at = time.monotonic()
+    resumed_token = page_token is not None
+    sent_at = token_issued_at
+
+    def mark_sent(t: float) -> None:
+        # chwila wysłania ostatniej próby — pacer uczy się od wydania tokenu do wysłania,
+        # bez czekania w kolejce schedulera i czasu odpowiedzi
+        nonlocal sent_at
+        sent_at = t
+    pages = 0
+    if progress is not None:
+        progress.plan(PAGE)
+    page_planned = True
 
-    while True:
-        if next_page_token and not first_request:
-            # wymagane przez Places API przy pageToken
-            await asyncio.sleep(5)
-
-        params: Dict[str, Any] = {
-            "textQuery": term,
-            "locationRestriction": {
-                "rectangle": {
-                    "low": bounds["low"],
-                    "high": bounds["high"]
+    try:
+        while True:
+            params: Dict[str, Any] = {
+                "textQuery": term,
+                "locationRestriction": {
+                    "rectangle": {
+                        "low": bounds["low"],
+                        "high": bounds["high"]
+                    }
                 }
             }
-        }
-        if next_page_token:
-            params["pageToken"] = next_page_token
-
-        headers = {
-            "Content-Type": "application/json",
-            "X-Goog-Api-Key": api_key,
-            "X-Goog-FieldMask": (
-                "places.id,places.displayName,places.formattedAddress,places.googleMapsUri,"
-                "places.internationalPhoneNumber,places.websiteUri,nextPageToken"
-            ),
-        }
+            if next_page_token:
+                params["pageToken"] = next_page_token
+
+            headers = {
+                "Content-Type": "application/json",
+                "X-Goog-Api-Key": api_key,
+                "X-Goog-FieldMask": field_mask,
+            }
 
-        try:
-            async with session.post("https://places.googleapis.com/v1/places:searchText",
-                                    json=params, headers=headers) as response:
-                if response.status != 200:
-                    text = await response.text()
-                    (log_cb or logger_util.log_error)(f"❌ Błąd zapytania [{term}] ({response.status}): {text}")
-                    return places_data
-
-                if response.content_type != "application/json":
-                    text = await response.text()
-                    (log_cb or logger_util.log_error)(f"❌ Nieoczekiwany typ odpowiedzi: {response.content_type}, treść: {text}")
-                    return places_data
-
-                data = await response.json()
-        except Exception as e:
-            (log_cb or logger_util.log_error)(f"❌ Wyjątek w fetch_places [{term}]: {e}")
-            return places_data
-
-        if "places" in data:
-            for place in data["places"]:
+            key = cache_key(params, field_mask) if cache is not None else None
+            data = cache.get(key) if cache is not None else None
+            probe = 0
+            if data is None:
+                if cache is not None and cache.replay:
+                    (log_cb or logger_util.log_warning)(f"⚠ Tryb replay: brak odpowiedzi w cache [{term}]")
+                    return
+
+                if next_page_token and not resumed_token:
+                    # token zwykle nie jest aktywny od razu — czekamy wg oszacowania pacera
+                    # (bez zajmowania slotu schedulera, więc idą w tym czasie inne kategorie);
+                    # token z dziennika jest zwykle już aktywny — ewentualnie dociągną go próby
+                    await pacer.wait_ready(token_issued_at)
+
+                try:
+                    while True:
+                        # limity równoległości/QPS i ponowienia 429/5xx obsługuje scheduler
+                        status, content_type, data = await scheduler.request(
+                            session, "POST", PLACES_SEARCH_URL, label="search",
+                            json=params, headers=headers, on_sent=mark_sent
+                        )
+                        if not (next_page_token and is_token_not_ready(status, data)):
+                            break
+                        if resumed_token:
+                            # token z dziennika dawno jest aktywny — INVALID_ARGUMENT znaczy, że wygasł
+                            raise PageTokenExpired(term)
+                        # token jeszcze nieaktywny — krótka, rosnąca przerwa i kolejna próba
+                        if not await pacer.wait_probe(token_issued_at, probe):
+                            (log_cb or logger_util.log_warning)(f"⚠ pageToken nie aktywował się [{term}] — pomijam dalsze strony")
+                            return
+                        probe += 1
+
+                    if status != 200:
+                        (log_cb or logger_util.log_error)(f"❌ Błąd zapytania [{term}] ({status}): {data}")
+                        return
+
+                    if content_type != "application/json":
+                        (log_cb or logger_util.log_error)(f"❌ Nieoczekiwany typ odpowiedzi: {content_type}, treść: {data}")
+                        return
+                except PageTokenExpired:
+                    raise
+                except Exception as e:
+                    (log_cb or logger_util.log_error)(f"❌ Wyjątek w fetch_places [{term}]: {e}")
+                    return
+
+                if cache is not None:
+                    cache.put(key, data)
+                if next_page_token and not resumed_token:
+                    pacer.observe(token_issued_at, sent_at, not_ready=probe > 0)
+            if progress is not None:
+                progress.done(PAGE)
+            page_planned = False
+
+            next_page_token = data.get("nextPageToken")
+            resumed_token = False
+            if next_page_token:
+                token_issued_at = time.monotonic()
+
+            page_rows: List[List[str]] = []
+            places = data.get("places") or []
+            raw_count = len(places)
+            if details is not None:
+                places = await details([p.get("id", "") for p in places])
+            for place in places:
                 website = place.get("websiteUri")
                 phone_number = place.get("internationalPhoneNumber")
                 if not phone_number or not website:
                     continue
 
-                places_data.append([
+                page_rows.append([
                     term,
                     website,
                     place["displayName"]["text"] if "displayName" in place else "Brak nazwy",
                     place.get("formattedAddress", "Brak adresu"),
-                    phone_number
+                    phone_number,
+                    place.get("id", "")
                 ])
-                if progress_cb:
-                    progress_cb()
 
-        next_page_token = data.get("nextPageToken")
-        if not next_page_token:
-            break
-        first_request = False
+            if scheduler.metrics is not None:
+                scheduler.metrics.page(term, raw_count, len(page_rows), raw_count - len(places))
+            if progress is not None:
+                progress.found(len(page_rows))
+            pages += 1
+            yield page_rows, raw_count, next_page_token
+            if not next_page_token or (max_pages is not None and pages >= max_pages):
+                break
+            if progress is not None:
+                progress.plan(PAGE)
+            page_planned = True
+    finally:
+        # paginacja urwała się (błąd, replay bez odpowiedzi, przerwanie) — zaplanowana strona nie przyjdzie
+        if page_planned and progress is not None:
+            progress.drop(PAGE)
+
+
+async def fetch_rect(session: aiohttp.ClientSession,
+                     api_key: str,
+                     term: str,
+                     bounds: Dict[str, Dict[str, float]],
+                     progress: Optional[ProgressTracker] = None,
+                     log_cb: Optional[Callable[[str], None]] = None,
+                     scheduler: Optional[RequestScheduler] = None,
+                     pacer: Optional[PageTokenPacer] = None,
+                     cache: Optional[ResponseCache] = None) -> Tuple[List[List[str]], int]:
+    """
+    Pobiera wszystkie strony wyników dla frazy w prostokącie.
+    Zwraca (firmy z telefonem i stroną, liczba_wszystkich_wyników) — druga wartość
+    służy do wykrycia nasycenia limitu 60 wyników.
+    """
+    places_data: List[List[str]] = []
+    raw_count = 0
+    async for rows, raw, _ in fetch_rect_pages(session, api_key, term, bounds, progress, log_cb,
+                                               scheduler, pacer, cache):
+        places_data.extend(rows)
+        raw_count += raw
+    return places_data, raw_count
+
+
+async def fetch_places(session: aiohttp.ClientSession,
+                       api_key: str,
+                       term: str,
+                       location: Dict[str, float],
+                       radius_m: int,
+                       progress: Optional[ProgressTracker] = None,
+                       log_cb: Optional[Callable[[str], None]] = None,
+                       scheduler: Optional[RequestScheduler] = None,
+                       pacer: Optional[PageTokenPacer] = None,
+                       cache: Optional[ResponseCache] = None) -> List[List[str]]:
+    bounds = calculate_bounds(location["lat"], location["lng"], radius_m)
+    places_data, _ = await fetch_rect(session, api_key, term, bounds, progress, log_cb,
+                                      scheduler, pacer, cache)
+    return places_data
+
 
+async def crawl_term(session: aiohttp.ClientSession,
+                     api_key: str,
+                     term: str,
+                     location: Dict[str, float],
+                     radius_m: int,
+                     on_page: Callable[[List[List[str]]], Awaitable[None]],
+                     progress: Optional[ProgressTracker] = None,
+                     log_cb: Optional[Callable[[str], None]] = None,
+                     scheduler: Optional[RequestScheduler] = None,
+                     pacer: Optional[PageTokenPacer] = None,
+                     cache: Optional[ResponseCache] = None,
+                     tiling: bool = False,
+                     min_tile_m: int = DEFAULT_MIN_TILE_M,
+                     journal: Optional[CityJournal] = None,
+                     details: Optional[PlaceDetailsFetcher] = None,
+                     plan: Optional[TermPlan] = None) -> None:
+    """
+    Przechodzi wszystkie strony frazy w obszarze i przekazuje każdą niepustą stronę do on_page,
+    gdy tylko przyjdzie (bez gromadzenia wyników). Przy tiling=True prostokąt, który wyczerpał
+    limit wyników, jest dzielony na 4 kafle (rekurencyjnie, do min_tile_m); kafle leżące
+    w całości poza kołem o promieniu radius_m są pomijane.
+    journal — dziennik przebiegu: strony już w nim zapisane są odtwarzane bez zapytań,
+    a paginacja jest kontynuowana od zapisanego tokenu; każda nowa strona jest dopisywana.
+    details — pobieranie dwufazowe (patrz fetch_rect_pages).
+    progress — strony (także odtworzone z dziennika) i kafle powstałe z podziału.
+    plan — plan fraz miasta (TermPlan): fraza przycięta idzie z limitem stron i bez kafli,
+    a każda strona jest liczona jako koszt frazy.
+    """
+    scheduler = scheduler or RequestScheduler()
+    pacer = pacer or PageTokenPacer()
+    max_pages = plan.max_pages(term) if plan is not None else None
+    tiling = tiling and max_pages is None
+
+    async def _rect(bounds: Dict[str, Dict[str, float]]) -> None:
+        raw_count = 0
+        rect = rect_key(bounds)
+        records = journal.pages(term, rect) if journal is not None else []
+        for record in records:
+            raw_count += record.raw
+            if progress is not None:
+                # strona z dziennika — wykonana w poprzednim przebiegu
+                progress.done(PAGE)
+                progress.found(len(record.rows))
+            if plan is not None:
+                plan.count_page(term)
+            if record.rows:
+                await on_page(record.rows)
+
+        # brak wpisów — od pierwszej strony; ostatni wpis z tokenem — kontynuacja paginacji
+        next_token = records[-1].next_token if records else None
+        done_pages = len(records)
+        while (done_pages == 0 or next_token) and (max_pages is None or done_pages < max_pages):
+            remaining = max_pages - done_pages if max_pages is not None else None
+            try:
+                async for rows, raw, token in fetch_rect_pages(session, api_key, term, bounds, progress, log_cb,
+                                                               scheduler, pacer, cache, next_token, details,
+                                                               remaining):
+                    raw_count += raw
+                    if plan is not None:
+                        plan.count_page(term)
+                    if journal is not None:
+                        journal.record(term, rect, rows, raw, token)
+                    if rows:
+                        await on_page(rows)
+                break
+            except PageTokenExpired:
+                # token z dziennika wygasł — prostokąt od pierwszej strony (strony z dziennika już
+                # przeszły przez dedup, więc powtórzone firmy odpadną)
+                (log_cb or logger_util.log_warning)(
+                    f"⚠ Token strony z dziennika wygasł [{term}] — pobieram prostokąt od pierwszej strony")
+                if journal is not None:
+                    journal.reset(term, rect)
+                next_token, done_pages, raw_count = None, 0, 0
+        if not tiling or not is_saturated(raw_count) or tile_size_m(bounds) / 2 < min_tile_m:
+            return
+        children = [b for b in split_bounds(bounds)
+                    if intersects_circle(b, location["lat"], location["lng"], radius_m)]
+        if progress is not None:
+            progress.plan(TILE, len(children))
+        await asyncio.gather(*(_tile(b) for b in children))
+
+    async def _tile(bounds: Dict[str, Dict[str, float]]) -> None:
+        await _rect(bounds)
+        if progress is not None:
+            progress.done(TILE)
+
+    await _rect(calculate_bounds(location["lat"], location["lng"], radius_m))
+
+
+async def fetch_places_tiled(session: aiohttp.ClientSession,
+                             api_key: str,
+                             term: str,
+                             location: Dict[str, float],
+                             radius_m: int,
+                             progress: Optional[ProgressTracker] = None,
+                             log_cb: Optional[Callable[[str], None]] = None,
+                             scheduler: Optional[RequestScheduler] = None,
+                             pacer: Optional[PageTokenPacer] = None,
+                             cache: Optional[ResponseCache] = None,
+                             min_tile_m: int = DEFAULT_MIN_TILE_M) -> List[List[str]]:
+    """
+    Jak fetch_places, ale z adaptacyjnym podziałem na kafle (crawl_term, tiling=True).
+    Duplikaty między kaflami usuwa dedup.
+    """
+    places_data: List[List[str]] = []
+
+    async def _collect(rows: List[List[str]]) -> None:
+        places_data.extend(rows)
+
+    await crawl_term(session, api_key, term, location, radius_m, _collect, progress, log_cb,
+                     scheduler, pacer, cache, tiling=True, min_tile_m=min_tile_m)
     return places_data
 
 
 # ===== Orkiestracja =====
+def _store_index(sinks: Iterable[Sink]) -> Optional[PhoneIndex]:
+    """Indeks pierwszego wyjścia Excel — tu trafiają ID odrzucone w pobieraniu dwufazowym."""
+    for sink in sinks:
+        if isinstance(sink, ExcelSink):
+            return sink.index()
+    return None
+
+
+def _history_store(sinks: Iterable[Sink]) -> Optional[Sink]:
+    """Pierwsze wyjście pamiętające zapisane firmy — magazyn znanych place ID dla pobierania dwufazowego."""
+    return next((sink for sink in sinks if sink.keeps_history), None)
+
+
+def use_two_phase(two_phase: bool, sinks: Iterable[Sink], log_cb: Optional[Callable[[str], None]] = None) -> bool:
+    """
+    Pobieranie dwufazowe oszczędza zapytania tylko wtedy, gdy któreś wyjście pamięta zapisane firmy
+    (Sink.keeps_history); bez niego Place Details szłyby dla każdej firmy — tryb jest wtedy wyłączany.
+    """
+    if two_phase and _history_store(sinks) is None:
+        (log_cb or logger_util.log_warning)(
+            "⚠ Tryb dwufazowy wymaga wyjścia pamiętającego zapisane firmy — wyszukiwanie jednofazowe")
+        return False
+    return two_phase
+
+
+def make_details_fetcher(session: aiohttp.ClientSession,
+                         api_key: str,
+                         scheduler: RequestScheduler,
+                         sinks: Iterable[Sink],
+                         concurrency: int = DEFAULT_DETAILS_CONCURRENCY,
+                         log_cb: Optional[Callable[[str], None]] = None,
+                         progress: Optional[ProgressTracker] = None,
+                         cache: Optional[ResponseCache] = None) -> PlaceDetailsFetcher:
+    index = _store_index(sinks)
+    if index is not None:
+        index.ensure_fresh()  # skoroszyt zmieniony poza aplikacją albo indeks z wcześniejszej wersji
+    store = _history_store(sinks)
+    known = store.known_place_ids if store is not None else None
+    return PlaceDetailsFetcher(session, api_key, scheduler, known, concurrency, log_cb, progress, cache)
+
+
+def record_run_totals(metrics: RunMetrics, pipeline: Pipeline, pacer: PageTokenPacer,
+                      response_cache: Optional[ResponseCache] = None) -> None:
+    """Podsumowanie przebiegu w metrykach (znalezione/unikalne/zapisane, próby tokenów, cache)."""
+    metrics.incr("places_found", pipeline.total)
+    metrics.incr("places_unique", pipeline.unique)
+    metrics.incr("places_saved", pipeline.added)
+    metrics.incr("page_token_probes", pacer.probes)
+    if response_cache is not None:
+        metrics.incr("response_cache_hits", response_cache.hits)
+        metrics.incr("response_cache_misses", response_cache.misses)
+    metrics.finish()
+
+
+def finish_details(details: PlaceDetailsFetcher, sinks: Iterable[Sink]) -> None:
+    """Zapamiętuje ID odrzucone przez filtr (brak telefonu/strony), żeby nie pobierać ich ponownie."""
+    index = _store_index(sinks)
+    if index is not None and details.skipped:
+        index.record_skipped(details.skipped)
+    metrics = details.scheduler.metrics
+    if metrics is not None:
+        metrics.incr("details_fetched", details.fetched)
+        metrics.incr("details_known", details.known_hits)
+        metrics.incr("details_skipped", len(details.skipped))
+    logger_util.log_info(f"🔎 Dwufazowo: Place Details dla {details.fetched} firm, "
+                         f"pominięto znanych {details.known_hits}, odrzuconych {len(details.skipped)}")
+
+
+def start_plan(planner: Optional[TermPlanner], city_name: str, categories: Iterable[str],
+               metrics: Optional[RunMetrics] = None) -> Optional[TermPlan]:
+    """Plan fraz miasta z podsumowaniem w logu (i szacowaną oszczędnością w metrykach)."""
+    if planner is None:
+        return None
+    plan = planner.plan(city_name, categories)
+    if planner.prune:
+        logger_util.log_info(plan.summary())
+    elif plan.expected_saved >= 1:
+        logger_util.log_info(f"🧭 Planer fraz [{city_name}] mógłby oszczędzić ~{plan.expected_saved:.0f} zapytań "
+                             f"(TERM_PLANNER)")
+    if metrics is not None and planner.prune:
+        metrics.incr("planner_terms_skipped", len(plan.skipped))
+        metrics.incr("planner_terms_reduced", len(plan.reduced))
+        metrics.incr("planner_requests_saved_est", round(plan.expected_saved))
+    return plan
+
+
+def tracks_term_yield(planner: Optional[TermPlanner], two_phase: bool) -> bool:
+    """
+    Czy przebieg zbiera wydajność fraz dla planera. W trybie dwufazowym nie: Place Details wracają
+    tylko dla ID, których nie zażądała wcześniej inna fraza ani nie ma ich w skoroszycie, więc
+    TermYield nie widziałby duplikatów między frazami i zawyżałby wydajność krańcową.
+    Plan (kolejność, przycinanie) korzysta wtedy ze statystyk zebranych wcześniej.
+    """
+    if planner is None:
+        return False
+    if two_phase:
+        logger_util.log_info("🧭 Tryb dwufazowy — planer fraz korzysta z dotychczasowych statystyk, "
+                             "bez ich aktualizacji")
+        return False
+    return True
+
+
+async def stream_city(session: aiohttp.ClientSession,
+                      api_key: str,
+                      city_name: str,
+                      radius_m: int,
+                      categories: Iterable[str],
+                      scheduler: RequestScheduler,
+                      pacer: PageTokenPacer,
+                      on_page: Callable[[str, int, List[List[str]]], Awaitable[None]],
+                      progress: Optional[ProgressTracker] = None,
+                      log_cb: Optional[Callable[[str], None]] = None,
+                      geocode_cache: Optional[GeocodeCache] = None,
+                      response_cache: Optional[ResponseCache] = None,
+                      tiling: bool = False,
+                      min_tile_m: int = DEFAULT_MIN_TILE_M,
+                      journal: Optional[RunJournal] = None,
+                      details: Optional[PlaceDetailsFetcher] = None,
+                      plan: Optional[TermPlan] = None) -> bool:
+    """
+    Pobiera firmy dla jednego miasta na współdzielonej sesji i schedulerze; każda strona
+    wyników trafia od razu do on_page(miasto, promień_m, wiersze) (np. Pipeline.put).
+    journal — dziennik przebiegu (ukończone strony są odtwarzane, nowe dopisywane).
+    details — pobieranie dwufazowe (wspólny PlaceDetailsFetcher dla całego przebiegu).
+    progress — wspólny ProgressTracker (miasta, geokodowanie, strony, kafle, Place Details).
+    plan — plan fraz miasta (TermPlanner.plan): zamiast categories idą plan.terms, w jego kolejności.
+    Zwraca False, gdy nie udało się ustalić współrzędnych.
+    """
+    if progress is not None:
+        progress.city_started()
+        progress.plan(GEOCODE)
+    try:
+        replay = response_cache is not None and response_cache.replay
+        location = await get_city_coordinates(session, api_key, city_name, log_cb, scheduler,
+                                              geocode_cache or default_cache(), offline=replay)
+        if progress is not None:
+            progress.done(GEOCODE)
+        if not location:
+            return False
+
+        async def _page(rows: List[List[str]]) -> None:
+            await on_page(city_name, radius_m, rows)
+
+        city_journal = journal.for_city(city_name, radius_m) if journal is not None else None
+        terms = plan.terms if plan is not None else categories
+        await asyncio.gather(*(
+            crawl_term(session, api_key, term, location, radius_m, _page, progress, log_cb,
+                       scheduler, pacer, response_cache, tiling, min_tile_m, city_journal, details, plan)
+            for term in terms
+        ))
+        return True
+    finally:
+        if progress is not None:
+            progress.city_finished()
+
+
 async def run_collection(city_name: str,
                          radius_m: int,
                          api_key: str,
                          categories: Iterable[str],
-                         progress_cb: Optional[Callable[[], None]] = None,
-                         log_cb: Optional[Callable[[str], None]] = None) -> Tuple[int, int, int]:
+                         progress_cb: Optional[Callable[[ProgressSnapshot], None]] = None,
+                         log_cb: Optional[Callable[[str], None]] = None,
+                         max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                         qps: float = DEFAULT_QPS,
+                         geocode_cache: Optional[GeocodeCache] = None,
+                         response_cache: Optional[ResponseCache] = None,
+                         tiling: bool = False,
+                         min_tile_m: int = DEFAULT_MIN_TILE_M,
+                         shard_by: Optional[str] = None,
+                         sinks: Optional[List[Sink]] = None,
+                         flush_rows: int = DEFAULT_FLUSH_ROWS,
+                         flush_seconds: float = DEFAULT_FLUSH_SECONDS,
+                         resume: bool = False,
+                         journal: Optional[RunJournal] = None,
+                         two_phase: bool = False,
+                         details_concurrency: int = DEFAULT_DETAILS_CONCURRENCY,
+                         metrics: Optional[RunMetrics] = None,
+                         save_cb: Optional[SaveCallback] = None,
+                         fetch_done_cb: Optional[Callable[[], None]] = None,
+                         control: Optional[RunControl] = None,
+                         planner: Optional[TermPlanner] = None,
+                         key_pool: Optional[KeyPool] = None) -> Tuple[int, int, int]:
     """
-    Zbiera firmy dla zadanych kategorii, deduplikuje WYŁĄCZNIE po numerze (znormalizowanym),
+    Zbiera firmy dla zadanych kategorii, deduplikuje (telefon/place ID/domena — dedup_places),
     zapisuje do Excela.
-    Zwraca (liczba_znalezionych, liczba_po_dedup, dodane_do_excela).
+    Wszystkie zapytania idą przez jeden RequestScheduler (limit równoległości + QPS);
+    kolejne strony planuje wspólny PageTokenPacer, a czas oczekiwania na token
+    wypełniają pierwsze strony pozostałych kategorii.
+    Strony wyników płyną strumieniowo przez Pipeline: dedup przyrostowy i zapis partiami
+    (co flush_rows rekordów lub flush_seconds sekund), więc wyniki trafiają na dysk w trakcie
+    przebiegu, a pamięć nie rośnie z liczbą kategorii/kafli.
+    Współrzędne miasta bierze z geocode_cache (domyślnie wspólny cache na dysku).
+    Z response_cache (jeśli podany) serwowane są powtarzalne odpowiedzi places:searchText;
+    w trybie replay cały przebieg idzie wyłącznie z cache, bez sieci.
+    tiling=True — obszar dzielony adaptacyjnie na kafle, gdy fraza wyczerpie limit 60 wyników.
+    shard_by="month"/"city" — zapis append-only do katalogu shardów zamiast przepisywania firmy.xlsx.
+    sinks — lista wyjść (Excel/CSV/Parquet/SQLite); domyślnie sam Excel.
+    Każda ukończona strona trafia do dziennika przebiegu (journal, domyślnie run_journal.jsonl).
+    resume=True — kontynuacja przerwanego przebiegu tego miasta i promienia: strony z dziennika
+    są odtwarzane bez zapytań (zapisane już firmy odrzuca dedup z historią), paginacja rusza
+    od zapisanego tokenu. Bez resume stan miasta w dzienniku jest czyszczony na starcie.
+    Po zapisaniu wyników stan miasta jest usuwany z dziennika.
+    two_phase=True — wyszukiwanie z samą maską places.id, a Place Details (max details_concurrency
+    naraz) tylko dla ID nieobecnych w indeksie skoroszytu; ponowny przebieg po znanym mieście
+    kosztuje głównie tanie zapytania o ID.
+    metrics — RunMetrics wypełniany w trakcie przebiegu (czasy zapytań/dedup/zapisu, liczniki per kategoria).
+    progress_cb — postęp liczony w zapytaniach (ProgressSnapshot: zaplanowane/wykonane strony, kafle,
+    Place Details, przepustowość, ETA), najwyżej kilka razy na sekundę.
+    Zapis idzie w osobnym wątku (pipeline.SAVE_EXECUTOR), więc pętla zdarzeń (GUI) nie zamarza;
+    save_cb dostaje zdarzenia ("start", rekordy) / ("done", dopisane), fetch_done_cb — koniec pobierania
+    (można już startować kolejne miasto, jego zapisy ustawią się w kolejce za bieżącym).
+    control — pauza/przerwanie (RunControl): po cancel() zapytania w toku są anulowane, a to,
+    co już pobrano, przechodzi przez dedup i zapis; stan miasta zostaje w dzienniku do wznowienia.
+    planner — planer fraz (TermPlanner): kolejność wg wydajności z poprzednich przebiegów w tym mieście,
+    przycinanie/pomijanie fraz dublujących inne; po ukończonym przebiegu zapisuje nowe statystyki
+    (poza trybem dwufazowym — tracks_term_yield).
+    key_pool — pula kluczy API (KeyPool): zapytania rozkładane na klucze wg zapasu, 403/429 przełącza
+    na inny klucz, a po wyczerpaniu wszystkich przebieg jest przerywany jak przez Stop (api_key jest
+    wtedy tylko domyślnym kluczem w nagłówkach, podmienianym przez scheduler).
+    Zwraca (liczba_znalezionych, liczba_po_dedup, dodane_w_pierwszym_wyjściu).
     """
+    owned_sinks: List[Sink] = []  # domyślne wyjście tworzone tutaj — zamykane na końcu (indeks SQLite)
     try:
-        async with aiohttp.ClientSession() as session:
-            location = await get_city_coordinates(session, api_key, city_name, log_cb)
-            if not location:
+        if key_pool is not None and control is None:
+            control = RunControl()  # wyczerpanie puli kluczy przerywa przebieg z zapisem wyników
+        scheduler = RequestScheduler(max_concurrency=max_concurrency, qps=qps, metrics=metrics, control=control,
+                                     keys=key_pool)
+        pacer = PageTokenPacer()
+        if sinks is None:
+            sinks = owned_sinks = [ExcelSink(shard_by=shard_by)]
+        two_phase = use_two_phase(two_phase, sinks, log_cb)
+        pipeline = Pipeline(sinks, flush_rows=flush_rows, flush_seconds=flush_seconds, metrics=metrics,
+                            save_cb=save_cb, term_yield=tracks_term_yield(planner, two_phase))
+        progress = ProgressTracker(progress_cb) if progress_cb is not None else None
+        journal = journal if journal is not None else RunJournal()
+        if not resume:
+            journal.discard(city_name, radius_m)
+        elif journal.has_city(city_name, radius_m):
+            (log_cb or logger_util.log_info)(f"⏯ Wznawiam przerwany przebieg: {city_name} ({radius_m // 1000} km)")
+        plan = start_plan(planner, city_name, categories, metrics)
+        if plan is not None and pipeline.term_yield is not None:
+            pipeline.term_yield.set_order((city_name, radius_m), plan.terms)
+
+        def _produced() -> None:
+            if progress is not None:
+                progress.finish()
+            if fetch_done_cb is not None:
+                fetch_done_cb()
+
+        async with new_session() as session:
+            details = make_details_fetcher(session, api_key, scheduler, sinks, details_concurrency,
+                                           log_cb, progress, response_cache) if two_phase else None
+            fetch = stream_city(
+                session, api_key, city_name, radius_m, categories, scheduler, pacer, pipeline.put,
+                progress, log_cb, geocode_cache, response_cache, tiling, min_tile_m, journal, details, plan
+            )
+            if control is not None:
+                fetch = control.attach(asyncio.ensure_future(fetch))
+            try:
+                found = await pipeline.run(fetch, on_produced=_produced)
+            except asyncio.CancelledError:
+                if not is_cancelled(control):
+                    raise
+                found = None  # przerwane przez użytkownika — pobrane strony są już zapisane
+            if details is not None:
+                finish_details(details, sinks)
+            if metrics is not None:
+                record_run_totals(metrics, pipeline, pacer, response_cache)
+            if key_pool is not None:
+                key_pool.save()
+                logger_util.log_info(key_pool.summary())
+            if pipeline.failed_cities:
+                # pobrane strony zostają w dzienniku — po zamknięciu pliku wznowienie zapisze je ponownie
+                (log_cb or logger_util.log_error)(
+                    f"❌ Nie udało się zapisać części wyników: {city_name} — dziennik przebiegu zostaje, "
+                    f"zamknij plik wyników (np. w Excelu) i wznów wyszukiwanie")
+                return (pipeline.total, pipeline.unique, pipeline.added)
+            if found is None:
+                (log_cb or logger_util.log_warning)(
+                    f"⏹ Przerwano: {city_name} — zapisano dotychczasowe wyniki, przebieg można wznowić")
+                return (pipeline.total, pipeline.unique, pipeline.added)
+            if not found:
                 return (0, 0, 0)
+        journal.discard(city_name, radius_m)
+        if plan is not None and pipeline.term_yield is not None:
+            planner.record(plan, *pipeline.term_yield.for_city((city_name, radius_m)))
+            planner.save()
 
-            tasks = [
-                fetch_places(session, api_key, term, location, radius_m, progress_cb, log_cb)
-                for term in categories
-            ]
-            results = await asyncio.gather(*tasks)
-
-        # Spłaszcz
-        places_data = [p for batch in results for p in batch]
-
-        # Dedup tylko po numerze (znormalizowanym)
-        seen = set()
-        deduped: List[List[str]] = []
-        for term, website, name, addr, phone in places_data:
-            k = _norm_phone(phone)
-            if k in seen:
-                continue
-            seen.add(k)
-            deduped.append([term, website, name, addr, phone])
-
-        # Zapis i zwrot licznika dodanych
-        added = save_to_excel(deduped)
         # UWAGA: nie logujemy tutaj nic do GUI — GUI wyświetli jedną linię podsumowania.
-        return (len(places_data), len(deduped), added)
+        return (pipeline.total, pipeline.unique, pipeline.added)
 
     except Exception as e:
         (log_cb or logger_util.log_error)(f"❌ Błąd w run_collection: {e}")
-        return (0, 0, 0)
\ No newline at end of file
+        return (0, 0, 0)
+    finally:
+        for sink in owned_sinks:
+            sink.close()
\ No newline at end of file
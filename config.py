@@ -2,3 +2,5 @@ APP_VERSION = "0.0.12"
 GITHUB_USER = "milar2001"
 GITHUB_REPO = "company_collector"
 ASSET_NAME = "SzukajkaFirm.exe"  # nazwa pliku w releasie
+MANIFEST_NAME = "SHA256SUMS"     # manifest wydania z sumami SHA-256 (format sha256sum albo JSON)
+UPDATE_SEGMENTS = 4              # równoległe zakresy przy pobieraniu aktualizacji (1 — jeden strumień)
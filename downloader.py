@@ -0,0 +1,405 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional, Tuple
+
+import logger_util
+
+
+# ===== Domyślne parametry =====
+DEFAULT_CHUNK_SIZE = 256 * 1024
+DEFAULT_RETRIES = 8             # ponowienia na segment (zerwane połączenie, timeout, 5xx)
+DEFAULT_TIMEOUT = 30            # [s] na połączenie / odczyt
+DEFAULT_BACKOFF_MAX = 30.0      # [s]
+MIN_SEGMENT_BYTES = 1024 * 1024  # mniejszych plików nie dzielimy na segmenty
+PROGRESS_INTERVAL = 0.1         # [s] najczęściej tyle razy na sekundę wołany jest progress_cb
+
+ProgressCallback = Callable[[int, Optional[int]], None]  # (pobrane_bajty, rozmiar albo None)
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadCancelled(DownloadError):
+    pass
+
+
+class _SegmentAborted(Exception):
+    """Segment zatrzymany, bo inny segment zakończył się błędem (nie przez użytkownika)."""
+
+
+def sha256_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def parse_manifest(text: str, name: str) -> Optional[Tuple[str, Optional[int]]]:
+    """
+    Suma SHA-256 (i opcjonalnie rozmiar) pliku `name` z manifestu wydania. Obsługiwane formaty:
+    JSON {"files": {"<nazwa>": {"sha256": "...", "size": N}}} (albo bez klucza "files")
+    oraz wynik `sha256sum` — linie "<hex>  <nazwa>".
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        entry = (data.get("files") or data).get(name)
+        if isinstance(entry, dict) and entry.get("sha256"):
+            size = entry.get("size")
+            return entry["sha256"].lower(), int(size) if size is not None else None
+        return None
+    for line in text.splitlines():
+        m = re.match(r"^([0-9a-fA-F]{64})\s+\*?(.+?)\s*$", line)
+        if m and os.path.basename(m.group(2)) == name:
+            return m.group(1).lower(), None
+    return None
+
+
+class RangeDownloader:
+    """
+    Pobieranie dużego pliku odporne na zerwane połączenia:
+    - dane trafiają do <dest>.part (przy segmentach: <dest>.part<i>); ponowna próba — także
+      po restarcie aplikacji — wznawia od miejsca przerwania nagłówkiem Range,
+    - segments > 1 — równoległe zakresy bajtów (gdy serwer obsługuje Range i zna rozmiar),
+    - gotowy plik jest sprawdzany (rozmiar, SHA-256 z manifestu) i dopiero wtedy trafia pod `dest`;
+      plik niezgodny jest usuwany, nigdy nie podmienia poprzedniego,
+    - progress_cb(pobrane, rozmiar) z wątku pobierania, cancel() z dowolnego wątku
+      (pobrane części zostają do wznowienia).
+    Blokujące (requests) — w GUI uruchamiać przez asyncio.to_thread.
+    """
+
+    def __init__(self, url: str, dest: str,
+                 sha256: Optional[str] = None,
+                 size: Optional[int] = None,
+                 segments: int = 1,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 retries: int = DEFAULT_RETRIES,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 progress_cb: Optional[ProgressCallback] = None,
+                 session=None):
+        import requests
+        self.url = url
+        self.dest = dest
+        self.sha256 = sha256.lower() if sha256 else None
+        self.size = size
+        self.segments = max(1, segments)
+        self.chunk_size = chunk_size
+        self.retries = max(0, retries)
+        self.timeout = timeout
+        self.progress_cb = progress_cb
+        self.session = session or requests.Session()
+        self.total: Optional[int] = None
+        self.done = 0
+        self.resumed_from = 0
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()    # cancel() użytkownika
+        self._abort = threading.Event()     # zatrzymanie segmentów (cancel() albo błąd innego segmentu)
+        self._last_progress = 0.0
+
+    # ----- sterowanie -----
+    def cancel(self) -> None:
+        self._cancel.set()
+        self._abort.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def part_path(self) -> str:
+        return self.dest + ".part"
+
+    def _meta_path(self) -> str:
+        return self.dest + ".part.json"
+
+    def _segment_path(self, i: int, count: int) -> str:
+        return self.part_path if count == 1 else f"{self.part_path}{i}"
+
+    # ----- postęp -----
+    def _advance(self, n: int, force: bool = False) -> None:
+        with self._lock:
+            self.done += n
+            done = self.done
+        if self.progress_cb is None:
+            return
+        now = time.monotonic()
+        if force or now - self._last_progress >= PROGRESS_INTERVAL:
+            self._last_progress = now
+            try:
+                self.progress_cb(done, self.total)
+            except Exception as e:
+                logger_util.log_warning(f"⚠ Błąd progress_cb pobierania: {e}")
+
+    # ----- rozpoznanie serwera -----
+    def _probe(self) -> Tuple[Optional[int], bool]:
+        """(rozmiar albo None, czy serwer obsługuje Range)."""
+        try:
+            r = self.session.head(self.url, allow_redirects=True, timeout=self.timeout)
+            if r.status_code < 400:
+                length = r.headers.get("Content-Length")
+                ranges = r.headers.get("Accept-Ranges", "").lower() == "bytes"
+                return (int(length) if length and length.isdigit() else None), ranges
+        except Exception as e:
+            logger_util.log_warning(f"⚠ HEAD {self.url} nieudany: {e}")
+        return None, False
+
+    def _plan(self, total: Optional[int], ranges: bool) -> List[Tuple[int, Optional[int]]]:
+        """Zakresy [start, koniec] (koniec włącznie, None — do końca pliku)."""
+        count = self.segments
+        if not ranges or not total or total < MIN_SEGMENT_BYTES * 2:
+            count = 1
+        count = min(count, max(1, (total or 0) // MIN_SEGMENT_BYTES))
+        if count == 1:
+            return [(0, total - 1 if total else None)]
+        step = total // count
+        return [(i * step, (i + 1) * step - 1 if i < count - 1 else total - 1) for i in range(count)]
+
+    def _prepare_parts(self, plan: List[Tuple[int, Optional[int]]]) -> None:
+        """Stan poprzedniej próby jest używany tylko dla tego samego URL, rozmiaru i podziału."""
+        meta = {"url": self.url, "size": self.total, "segments": len(plan), "sha256": self.sha256}
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                old = json.load(f)
+        except (OSError, ValueError):
+            old = None
+        if old != meta:
+            self._remove_parts(max(len(plan), (old or {}).get("segments") or 1))
+        with open(self._meta_path(), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def _remove_parts(self, count: int) -> None:
+        paths = [self.part_path] + [f"{self.part_path}{i}" for i in range(count)]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _stop(self) -> Exception:
+        if self._cancel.is_set():
+            return DownloadCancelled("Pobieranie przerwane")
+        return _SegmentAborted()
+
+    # ----- pobieranie -----
+    def _fetch(self, path: str, start: int, end: Optional[int], single: bool) -> None:
+        expected = end - start + 1 if end is not None else None
+        attempt = 0
+        while True:
+            have = os.path.getsize(path) if os.path.exists(path) else 0
+            if expected is not None and have >= expected:
+                return
+            headers = {}
+            if start + have > 0 or end is not None:
+                headers["Range"] = f"bytes={start + have}-{end if end is not None else ''}"
+            try:
+                with self.session.get(self.url, headers=headers, stream=True,
+                                      timeout=self.timeout, allow_redirects=True) as r:
+                    if r.status_code == 200 and "Range" in headers:
+                        # serwer zignorował Range — przy jednym strumieniu zaczynamy od nowa
+                        if not single or start != 0:
+                            raise DownloadError("Serwer nie obsługuje zapytań Range")
+                        self._advance(-have)
+                        have = 0
+                        mode = "wb"
+                    elif r.status_code == 416 and expected is None and have > 0:
+                        return  # plik pobrany w całości w poprzedniej próbie
+                    else:
+                        mode = "ab"
+                    if r.status_code >= 500 or r.status_code == 429:
+                        raise IOError(f"HTTP {r.status_code}")
+                    if r.status_code >= 400:
+                        raise DownloadError(f"HTTP {r.status_code} dla {self.url}")
+                    with open(path, mode) as f:
+                        for chunk in r.iter_content(chunk_size=self.chunk_size):
+                            if self._abort.is_set():
+                                raise self._stop()
+                            if chunk:
+                                f.write(chunk)
+                                self._advance(len(chunk))
+                have = os.path.getsize(path)
+                if expected is None or have >= expected:
+                    return
+                raise IOError(f"połączenie zamknięte po {have}/{expected} B")
+            except (DownloadError, _SegmentAborted):
+                raise
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise DownloadError(f"Nie udało się pobrać {self.url}: {e}") from e
+                delay = random.uniform(0, min(DEFAULT_BACKOFF_MAX, 0.5 * (2 ** attempt)))
+                attempt += 1
+                logger_util.log_warning(f"⏳ Pobieranie przerwane ({e}) — wznowienie {attempt}/{self.retries} za {delay:.1f}s")
+                if self._abort.wait(delay):
+                    raise self._stop()
+
+    def _verify(self, path: str) -> None:
+        size = os.path.getsize(path)
+        expected_size = self.size or self.total
+        if expected_size is not None and size != expected_size:
+            raise DownloadError(f"Niepełny plik: {size} B zamiast {expected_size} B")
+        if self.sha256:
+            digest = sha256_file(path)
+            if digest != self.sha256:
+                raise DownloadError(f"Niezgodna suma SHA-256: {digest} (oczekiwano {self.sha256})")
+
+    def run(self) -> str:
+        """Pobiera (lub wznawia) plik, weryfikuje i zwraca ścieżkę `dest`. Błędy: DownloadError."""
+        total, ranges = self._probe()
+        if self.size is not None and total is not None and total != self.size:
+            raise DownloadError(f"Rozmiar na serwerze ({total} B) różni się od manifestu ({self.size} B)")
+        self.total = total if total is not None else self.size
+        plan = self._plan(self.total, ranges)
+        self._prepare_parts(plan)
+        paths = [self._segment_path(i, len(plan)) for i in range(len(plan))]
+        self.done = self.resumed_from = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+        if self.resumed_from:
+            logger_util.log_info(f"⏯ Wznawiam pobieranie od {self.resumed_from} B: {self.url}")
+        self._advance(0, force=True)
+
+        if len(plan) == 1:
+            self._fetch(paths[0], plan[0][0], plan[0][1], single=True)
+        else:
+            with ThreadPoolExecutor(max_workers=len(plan), thread_name_prefix="download") as pool:
+                futures = [pool.submit(self._fetch, path, start, end, False)
+                           for path, (start, end) in zip(paths, plan)]
+                done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+                if any(f.exception() is not None for f in done):
+                    # pozostałe segmenty kończą się, części zostają do wznowienia; cancelled zostaje
+                    # False — to błąd pobierania, nie przerwanie przez użytkownika
+                    self._abort.set()
+                    wait(futures)
+                    errors = [f.exception() for f in futures if f.exception() is not None]
+                    raise next((e for e in errors if not isinstance(e, _SegmentAborted)), errors[0])
+            with open(self.part_path, "wb") as out:
+                for path in paths:
+                    with open(path, "rb") as f:
+                        while True:
+                            block = f.read(1024 * 1024)
+                            if not block:
+                                break
+                            out.write(block)
+            for path in paths:
+                os.remove(path)
+        self._advance(0, force=True)
+
+        try:
+            self._verify(self.part_path)
+        except DownloadError:
+            self._remove_parts(len(plan))  # uszkodzony plik — następna próba od zera
+            os.remove(self._meta_path())
+            raise
+        os.replace(self.part_path, self.dest)
+        os.remove(self._meta_path())
+        return self.dest
+
+
+def fetch_manifest(url: str, name: str, timeout: float = DEFAULT_TIMEOUT,
+                   session=None) -> Optional[Tuple[str, Optional[int]]]:
+    """Pobiera manifest wydania i zwraca (sha256, rozmiar) dla pliku `name` (None — brak wpisu)."""
+    import requests
+    r = (session or requests).get(url, timeout=timeout)
+    r.raise_for_status()
+    return parse_manifest(r.text, name)
+
+
+# ===== Lokalny serwer testowy (Range, zrywanie połączeń) =====
+def make_test_server(root: str, port: int = 0, drop_after: int = 0, ranges: bool = True):
+    """
+    Zamiennik serwera wydań do testów: serwuje pliki z `root` z obsługą HEAD i Range.
+    drop_after > 0 — każda odpowiedź urywa się po tylu bajtach (symulacja słabego łącza).
+    Zwraca ThreadingHTTPServer (server_address[1] — port); uruchomienie: serve_forever().
+    """
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=root, **kwargs)
+
+        def log_message(self, format, *args):
+            pass
+
+        def _range(self, size: int) -> Optional[Tuple[int, int]]:
+            m = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+            if not ranges or not m:
+                return None
+            start = int(m.group(1))
+            end = int(m.group(2)) if m.group(2) else size - 1
+            return start, min(end, size - 1)
+
+        def _send(self, body: bool) -> None:
+            path = self.translate_path(self.path)
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            size = os.path.getsize(path)
+            rng = self._range(size)
+            if rng and rng[0] >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            start, end = rng or (0, size - 1)
+            self.send_response(206 if rng else 200)
+            self.send_header("Content-Length", str(end - start + 1))
+            if ranges:
+                self.send_header("Accept-Ranges", "bytes")
+            if rng:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if not body:
+                return
+            limit = drop_after or (end - start + 1)
+            with open(path, "rb") as f:
+                f.seek(start)
+                self.wfile.write(f.read(min(limit, end - start + 1)))
+            if drop_after:
+                self.close_connection = True
+
+        def do_HEAD(self):
+            self._send(body=False)
+
+        def do_GET(self):
+            self._send(body=True)
+
+    return ThreadingHTTPServer(("127.0.0.1", port), Handler)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Wznawialne pobieranie z weryfikacją SHA-256")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_get = sub.add_parser("get", help="Pobierz plik (wznawia przerwane pobieranie)")
+    p_get.add_argument("url")
+    p_get.add_argument("dest")
+    p_get.add_argument("--sha256")
+    p_get.add_argument("--manifest", help="URL manifestu wydania (JSON albo sha256sum)")
+    p_get.add_argument("--segments", type=int, default=1)
+    p_serve = sub.add_parser("serve", help="Lokalny serwer testowy z Range")
+    p_serve.add_argument("root", nargs="?", default=".")
+    p_serve.add_argument("--port", type=int, default=8765)
+    p_serve.add_argument("--drop-after", type=int, default=0, help="Urywaj odpowiedzi po tylu bajtach")
+    p_serve.add_argument("--no-ranges", action="store_true")
+    args = parser.parse_args()
+
+    if args.cmd == "serve":
+        server = make_test_server(args.root, args.port, args.drop_after, not args.no_ranges)
+        print(f"Serwer testowy: http://127.0.0.1:{server.server_address[1]}/ ({os.path.abspath(args.root)})")
+        server.serve_forever()
+    else:
+        sha, size = args.sha256, None
+        if args.manifest:
+            found = fetch_manifest(args.manifest, os.path.basename(args.dest))
+            if found is None:
+                raise SystemExit("Brak pliku w manifeście")
+            sha, size = found
+        d = RangeDownloader(args.url, args.dest, sha, size, args.segments,
+                            progress_cb=lambda done, total: print(f"\r{done}/{total or '?'} B", end=""))
+        print("\n✅ " + d.run())
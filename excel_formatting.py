@@ -0,0 +1,82 @@
+import re
+from typing import Iterable, List, Sequence
+
+from openpyxl.utils import get_column_letter
+from openpyxl.styles import PatternFill
+from openpyxl.worksheet.datavalidation import DataValidation
+from openpyxl.formatting.formatting import ConditionalFormattingList
+from openpyxl.formatting.rule import FormulaRule
+
+
+REJECT_COLUMN = "H"
+REJECT_CHOICES = '"TAK,NIE"'
+RED_FILL = PatternFill(start_color="FF9999", end_color="FF9999", fill_type="solid")
+
+# reguły "wiersz na czerwono, gdy H=TAK" — zarówno stare (per wiersz), jak i zakresowe
+_REJECT_FORMULA = re.compile(r'^\$H\d+="TAK"$')
+
+
+def _is_reject_rule(rule) -> bool:
+    return any(_REJECT_FORMULA.match(str(f)) for f in (rule.formula or []))
+
+
+def apply_reject_rule(sheet, last_row: int) -> None:
+    """
+    Jedna reguła formatowania warunkowego na cały zakres A2:G<last_row>.
+    Wcześniejsze reguły tego typu (także tysiące reguł per wiersz ze starszych wersji)
+    są usuwane — przy kolejnym zapisie zakres jest po prostu rozszerzany.
+    """
+    if last_row < 2:
+        return
+    old = sheet.conditional_formatting
+    fresh = ConditionalFormattingList()
+    for cf in old:
+        for rule in cf.rules:
+            if not _is_reject_rule(rule):
+                fresh.add(str(cf.sqref), rule)
+    fresh.add(f"A2:G{last_row}", FormulaRule(formula=[f'${REJECT_COLUMN}2="TAK"'], fill=RED_FILL))
+    sheet.conditional_formatting = fresh
+
+
+def apply_reject_validation(sheet, last_row: int) -> None:
+    """Jedna walidacja listy TAK/NIE na zakres H2:H<last_row> (zastępuje wcześniejsze)."""
+    if last_row < 2:
+        return
+    validations = sheet.data_validations.dataValidation
+    validations[:] = [dv for dv in validations if dv.formula1 != REJECT_CHOICES]
+    dv = DataValidation(type="list", formula1=REJECT_CHOICES, allow_blank=True)
+    dv.add(f"{REJECT_COLUMN}2:{REJECT_COLUMN}{last_row}")
+    validations.append(dv)
+
+
+def batch_widths(rows: Iterable[Sequence], header: Sequence = ()) -> List[int]:
+    """Maksymalna długość tekstu w każdej kolumnie — liczona wyłącznie z nowych wierszy (+ nagłówka)."""
+    widths: List[int] = [len(str(h)) if h else 0 for h in header]
+    for row in rows:
+        if len(row) > len(widths):
+            widths.extend([0] * (len(row) - len(widths)))
+        for j, v in enumerate(row):
+            if v:
+                widths[j] = max(widths[j], len(str(v)))
+    return widths
+
+
+def apply_widths(sheet, widths: Sequence[int], grow_only: bool = True) -> None:
+    """
+    Szerokości z nowego wsadu (+2) — bez skanowania całego arkusza.
+    grow_only=True: kolumna tylko się poszerza (arkusz ma już wcześniejsze wiersze).
+    """
+    for j, w in enumerate(widths, start=1):
+        if not w:
+            continue
+        dim = sheet.column_dimensions[get_column_letter(j)]
+        if not grow_only or w + 2 > (dim.width or 0):
+            dim.width = w + 2
+
+
+def finish_sheet(sheet, last_row: int, widths: Sequence[int], grow_only: bool = True) -> None:
+    """Formatowanie po dopisaniu wierszy: reguła, walidacja, szerokości, autofiltr."""
+    apply_reject_rule(sheet, last_row)
+    apply_reject_validation(sheet, last_row)
+    apply_widths(sheet, widths, grow_only)
+    sheet.auto_filter.ref = f"A1:{REJECT_COLUMN}{max(1, last_row)}"
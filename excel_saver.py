@@ -1,17 +1,45 @@
 import pandas as pd
 import os
+import json
 from openpyxl import load_workbook, Workbook
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import PatternFill
-from openpyxl.worksheet.datavalidation import DataValidation
-from openpyxl.formatting.rule import FormulaRule
+from openpyxl.cell import WriteOnlyCell
 from datetime import datetime
 import logger_util
+from phone_index import PhoneIndex
+from excel_formatting import finish_sheet, batch_widths
+from normalization import entity_keys, resolve_entities, first_of_each_entity
 
 
-def _norm_phone(s: str) -> str:
-    """Zwraca numer złożony wyłącznie z cyfr (do porównań)."""
-    return ''.join(ch for ch in str(s) if ch.isdigit())
+HEADER = ["Branża", "Strona WWW", "Nazwa Firmy", "", "Adres", "", "Numer Telefonu", "Odrzucić?"]
+
+
+def _prepare_new_rows(new_data, index: PhoneIndex) -> pd.DataFrame:
+    """Ramka nowych rekordów po dedup we wsadzie i względem historii (indeksu)."""
+    # Ramka z nowymi danymi (6. kolumna — place ID — jest opcjonalna)
+    rows = [list(r) + [""] * (6 - len(r)) for r in new_data]
+    new_df = pd.DataFrame(rows, columns=["Branża", "Strona WWW", "Nazwa Firmy", "Adres", "Numer Telefonu", "__PlaceId__"])
+    new_df["Strona WWW"] = new_df["Strona WWW"].fillna("Brak strony")
+    new_df["Numer Telefonu"] = new_df["Numer Telefonu"].astype(str)
+    new_df["__PlaceId__"] = new_df["__PlaceId__"].fillna("").astype(str)
+    phones, place_ids, domains = entity_keys(new_df["Numer Telefonu"], new_df["__PlaceId__"], new_df["Strona WWW"])
+    new_df["__PhoneNorm__"] = phones.to_numpy()
+    new_df["__Domain__"] = domains.to_numpy()
+
+    # 1) Usuń duplikaty w bieżącym wsadzie (wspólny telefon, place ID lub domena — union-find)
+    new_df = new_df[first_of_each_entity(resolve_entities([phones, place_ids, domains]))]
+
+    # 2) Usuń rekordy, które już są w historii (po którymkolwiek kluczu) — O(wsad)
+    known_phones = index.known_phones(new_df["__PhoneNorm__"])
+    known_ids = index.known_place_ids(new_df["__PlaceId__"])
+    known_domains = index.known_domains(new_df["__Domain__"])
+    new_unique_df = new_df[~new_df["__PhoneNorm__"].isin(known_phones)
+                           & ~new_df["__PlaceId__"].isin(known_ids)
+                           & ~new_df["__Domain__"].isin(known_domains)].copy()
+
+    # 3) Nowe rekordy nie mają jeszcze decyzji (numery z pliku odpadły w kroku 2)
+    new_unique_df["Odrzucić?"] = ""
+
+    return new_unique_df
 
 
 def save_to_excel(new_data, filename="firmy.xlsx"):
@@ -27,63 +55,23 @@ def save_to_excel(new_data, filename="firmy.xlsx"):
     # Pobierz lub utwórz arkusz dzisiejszy
     if today in book.sheetnames:
         sheet = book[today]
-        try:
-            existing_df = pd.read_excel(filename, sheet_name=today)
-            # Upewnij się, że kolumny istnieją
-            if "Numer Telefonu" not in existing_df.columns:
-                existing_df["Numer Telefonu"] = ""
-            if "Odrzucić?" not in existing_df.columns:
-                existing_df["Odrzucić?"] = ""
-            existing_df["__PhoneNorm__"] = existing_df["Numer Telefonu"].astype(str).apply(_norm_phone)
-            existing_decisions = existing_df.set_index("__PhoneNorm__")["Odrzucić?"].to_dict()
-        except Exception:
-            existing_df = pd.DataFrame(columns=["Branża", "Strona WWW", "Nazwa Firmy", "Adres", "Numer Telefonu", "Odrzucić?"])
-            existing_decisions = {}
     else:
         sheet = book.create_sheet(title=today)
-        sheet.append(["Branża", "Strona WWW", "Nazwa Firmy", "", "Adres", "", "Numer Telefonu", "Odrzucić?"])
-        existing_df = pd.DataFrame(columns=["Branża", "Strona WWW", "Nazwa Firmy", "Adres", "Numer Telefonu", "Odrzucić?"])
-        existing_decisions = {}
-
-    # Zbiór WSZYSTKICH numerów z pliku (znormalizowanych)
-    all_existing_numbers = set()
-    for sheet_name in book.sheetnames:
-        try:
-            df = pd.read_excel(filename, sheet_name=sheet_name)
-            if "Numer Telefonu" in df.columns:
-                all_existing_numbers.update(
-                    df["Numer Telefonu"].dropna().astype(str).apply(_norm_phone).tolist()
-                )
-        except Exception:
-            continue
-
-    # Ramka z nowymi danymi
-    new_df = pd.DataFrame(new_data, columns=["Branża", "Strona WWW", "Nazwa Firmy", "Adres", "Numer Telefonu"])
-    new_df["Strona WWW"] = new_df["Strona WWW"].fillna("Brak strony")
-    new_df["Numer Telefonu"] = new_df["Numer Telefonu"].astype(str)
-    new_df["__PhoneNorm__"] = new_df["Numer Telefonu"].apply(_norm_phone)
-
-    # 1) Usuń duplikaty w bieżącym wsadzie po numerze
-    new_df = new_df.drop_duplicates(subset="__PhoneNorm__", keep="first")
-
-    # 2) Usuń rekordy, które już są w pliku (po znormalizowanym numerze)
-    new_unique_df = new_df[~new_df["__PhoneNorm__"].isin(all_existing_numbers)].copy()
-
-    # 3) Przenieś wcześniejsze decyzje po kluczu znormalizowanym
-    new_unique_df["Odrzucić?"] = new_unique_df["__PhoneNorm__"].map(existing_decisions).fillna("")
+        sheet.append(HEADER)
 
-    # Walidacja TAK/NIE
-    existing_validation = DataValidation(type="list", formula1='"TAK,NIE"', allow_blank=True)
-    sheet.add_data_validation(existing_validation)
+    # Indeks numerów/ID z całej historii (sidecar SQLite) — zamiast czytać każdy arkusz pandasem
+    index = PhoneIndex(filename)
+    index.ensure_fresh()
 
-    # Formatowanie warunkowe – wiersz na czerwono, gdy H=="TAK"
-    red_fill = PatternFill(start_color="FF9999", end_color="FF9999", fill_type="solid")
+    new_unique_df = _prepare_new_rows(new_data, index)
 
     # Od której linii dopisujemy
     start_row = sheet.max_row + 1
+    fresh_sheet = start_row == 2  # tylko nagłówek
 
     # Zapis bez kolumny pomocniczej
-    for i, (_, r) in enumerate(new_unique_df.iterrows(), start=start_row):
+    written = []
+    for i, r in enumerate(new_unique_df.to_dict("records"), start=start_row):
         sheet[f"A{i}"] = r["Branża"]
         if r["Strona WWW"] == "Brak strony":
             sheet[f"B{i}"] = "Brak strony"
@@ -94,28 +82,136 @@ def save_to_excel(new_data, filename="firmy.xlsx"):
         sheet[f"E{i}"] = r["Adres"]
         sheet[f"G{i}"] = r["Numer Telefonu"]
         sheet[f"H{i}"] = r["Odrzucić?"]
+        written.append([sheet[f"{c}{i}"].value for c in "ABCDEFGH"])
 
-        # walidacja listy
-        existing_validation.add(sheet[f"H{i}"])
-
-        # reguła formatowania dla tego wiersza
-        formula = f'$H{i}="TAK"'
-        rule = FormulaRule(formula=[formula], fill=red_fill)
-        sheet.conditional_formatting.add(f"A{i}:G{i}", rule)
-
-    # Dostosowanie szerokości kolumn
-    for col in sheet.columns:
-        max_len = 0
-        col_letter = get_column_letter(col[0].column)
-        for cell in col:
-            if cell.value:
-                max_len = max(max_len, len(str(cell.value)))
-        sheet.column_dimensions[col_letter].width = max_len + 2
-
-    # Filtrowanie
-    sheet.auto_filter.ref = sheet.dimensions
+    # Jedna reguła/walidacja na zakres + szerokości liczone tylko z nowego wsadu
+    last_row = start_row + len(written) - 1
+    finish_sheet(sheet, max(last_row, sheet.max_row), batch_widths(written, HEADER if fresh_sheet else ()),
+                 grow_only=not fresh_sheet)
 
     book.save(filename)
+    # indeks aktualizujemy dopiero po udanym zapisie skoroszytu
+    index.record(new_unique_df["__PhoneNorm__"], new_unique_df["__PlaceId__"], new_unique_df["__Domain__"])
+    index.close()
     logger_util.log_info(f"✅ Dodano {len(new_unique_df)} nowych rekordów do {filename}.")
     # print(f"✅ Dodano {len(new_unique_df)} nowych rekordów do {filename}.")  # wyciszone w GUI
-    return len(new_unique_df)
\ No newline at end of file
+    return len(new_unique_df)
+
+
+# ===== Zapis shardowany (append-only) =====
+MANIFEST_FILE = "manifest.json"
+DEFAULT_PART_ROWS = 20000  # tyle wierszy w części sharda, potem zaczyna się nowa
+
+
+def shard_for(shard_by: str = "month", city: str = "") -> str:
+    """Klucz sharda: 'month' → RRRR-MM, 'city' → nazwa miasta (bezpieczna dla systemu plików)."""
+    if shard_by == "city" and city:
+        safe = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in city.strip())
+        return safe or "bez_nazwy"
+    return datetime.today().strftime('%Y-%m')
+
+
+def _load_manifest(directory: str) -> dict:
+    path = os.path.join(directory, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"parts": []}
+
+
+def _save_manifest(directory: str, manifest: dict) -> None:
+    path = os.path.join(directory, MANIFEST_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def shard_index(directory: str) -> PhoneIndex:
+    """Wspólny indeks numerów dla wszystkich części (znacznik świeżości = manifest)."""
+    def _parts():
+        return [os.path.join(directory, p["file"]) for p in _load_manifest(directory)["parts"]]
+    return PhoneIndex(os.path.join(directory, MANIFEST_FILE), sources=_parts)
+
+
+def _sharded_rows(new_unique_df: pd.DataFrame):
+    """Wiersze części (z komórką linku) i szerokości kolumn liczone z wsadu."""
+    rows = new_unique_df.to_dict("records")
+    widths = batch_widths(
+        ([rec["Branża"], "Kliknij tutaj" if rec["Strona WWW"] != "Brak strony" else "Brak strony",
+          rec["Nazwa Firmy"], None, rec["Adres"], None, rec["Numer Telefonu"], rec["Odrzucić?"]] for rec in rows),
+        HEADER
+    )
+    return rows, widths
+
+
+def save_sharded(new_data, directory="firmy", shard_key=None, part_rows=DEFAULT_PART_ROWS):
+    """
+    Zapis append-only do części <directory>/<shard>/<data>_<nr>.xlsx: wsad dopisywany jest do bieżącej
+    części sharda, dopóki ta ma mniej niż part_rows wierszy — potem zaczyna się nowa (pisana w trybie
+    write_only openpyxl). Czas i pamięć zależą od wsadu i rozmiaru części, nie od historii.
+    Listę części prowadzi <directory>/manifest.json; dedup z historią idzie przez wspólny indeks.
+    Zwraca liczbę dopisanych rekordów.
+    """
+    today = datetime.today().strftime('%Y-%m-%d')
+    shard = shard_key or shard_for("month")
+    os.makedirs(os.path.join(directory, shard), exist_ok=True)
+
+    index = shard_index(directory)
+    index.ensure_fresh()
+    new_unique_df = _prepare_new_rows(new_data, index)
+    if new_unique_df.empty:
+        index.close()
+        logger_util.log_info(f"✅ Brak nowych rekordów do zapisu w {directory}.")
+        return 0
+
+    manifest = _load_manifest(directory)
+    shard_parts = [p for p in manifest["parts"] if p["shard"] == shard]
+    n = len(new_unique_df)
+    rows, widths = _sharded_rows(new_unique_df)
+
+    current = shard_parts[-1] if shard_parts else None
+    if current is not None and (current["rows"] + n > part_rows
+                                or not os.path.exists(os.path.join(directory, current["file"]))):
+        current = None
+    if current is not None:
+        # dopisanie do bieżącej części — wczytujemy tylko ją (najwyżej part_rows wierszy)
+        path = os.path.join(directory, current["file"])
+        book = load_workbook(path)
+        sheet = book.worksheets[0]
+        start_row = sheet.max_row + 1
+        for i, rec in enumerate(rows, start=start_row):
+            sheet.append([rec["Branża"], "Brak strony", rec["Nazwa Firmy"], None, rec["Adres"], None,
+                          rec["Numer Telefonu"], rec["Odrzucić?"]])
+            if rec["Strona WWW"] != "Brak strony":
+                sheet[f"B{i}"].value = "Kliknij tutaj"
+                sheet[f"B{i}"].hyperlink = rec["Strona WWW"]
+        finish_sheet(sheet, start_row + n - 1, widths, grow_only=True)
+        current["rows"] += n
+    else:
+        rel = f"{shard}/{today}_{len(shard_parts) + 1:04d}.xlsx"
+        path = os.path.join(directory, rel)
+        book = Workbook(write_only=True)
+        sheet = book.create_sheet(title=today)
+        # W trybie write_only formatowanie trzeba zdefiniować przed zapisem wierszy
+        finish_sheet(sheet, n + 1, widths, grow_only=False)
+        sheet.append(HEADER)
+        for rec in rows:
+            link = WriteOnlyCell(sheet, value="Brak strony")
+            if rec["Strona WWW"] != "Brak strony":
+                link.value = "Kliknij tutaj"
+                link.hyperlink = rec["Strona WWW"]
+            sheet.append([rec["Branża"], link, rec["Nazwa Firmy"], None, rec["Adres"], None,
+                          rec["Numer Telefonu"], rec["Odrzucić?"]])
+        manifest["parts"].append({"file": rel, "shard": shard, "rows": n,
+                                  "created": datetime.now().isoformat(timespec="seconds")})
+
+    tmp = path + ".tmp"
+    book.save(tmp)
+    os.replace(tmp, path)
+    _save_manifest(directory, manifest)
+    # indeks aktualizujemy dopiero po zapisie części i manifestu
+    index.record(new_unique_df["__PhoneNorm__"], new_unique_df["__PlaceId__"], new_unique_df["__Domain__"])
+    index.close()
+    logger_util.log_info(f"✅ Dodano {n} nowych rekordów do {path}.")
+    return n
@@ -0,0 +1,159 @@
+import os
+import re
+import csv
+import json
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import logger_util
+
+
+DEFAULT_CACHE_FILE = "geocode_cache.json"
+DEFAULT_LRU_SIZE = 256
+
+
+def normalize_city(name: str) -> str:
+    """Klucz cache: NFC, małe litery, pojedyncze spacje, bez spacji wokół przecinków."""
+    s = unicodedata.normalize("NFC", str(name)).casefold().strip()
+    s = re.sub(r"\s+", " ", s)
+    return re.sub(r"\s*,\s*", ",", s)
+
+
+class GeocodeCache:
+    """
+    Trwały cache współrzędnych miast (plik JSON) z warstwą LRU w pamięci procesu.
+    ttl_seconds=None — wpisy nie wygasają (miasta się nie przesuwają).
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_FILE,
+                 ttl_seconds: Optional[float] = None,
+                 lru_size: int = DEFAULT_LRU_SIZE):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.lru_size = max(1, lru_size)
+        self._lru: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._disk: Optional[Dict[str, Dict[str, float]]] = None  # wczytywane leniwie
+
+    # ----- dysk -----
+    def _load(self) -> Dict[str, Dict[str, float]]:
+        if self._disk is None:
+            self._disk = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._disk = json.load(f)
+                except Exception as e:
+                    logger_util.log_warning(f"⚠ Nie udało się wczytać {self.path}: {e}")
+        return self._disk
+
+    def save(self) -> None:
+        """Zapis atomowy (plik tymczasowy + os.replace)."""
+        if self._disk is None:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._disk, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            logger_util.log_error(f"Błąd zapisu {self.path}: {e}")
+
+    # ----- API -----
+    def _expired(self, entry: Dict[str, float]) -> bool:
+        return self.ttl_seconds is not None and time.time() - entry.get("ts", 0) > self.ttl_seconds
+
+    def _remember(self, key: str, entry: Dict[str, float]) -> None:
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get(self, city_name: str) -> Optional[Dict[str, float]]:
+        key = normalize_city(city_name)
+        entry = self._lru.get(key)
+        if entry is None:
+            entry = self._load().get(key)
+        if entry is None or self._expired(entry):
+            self._lru.pop(key, None)
+            return None
+        self._remember(key, entry)
+        return {"lat": entry["lat"], "lng": entry["lng"]}
+
+    def put(self, city_name: str, coords: Dict[str, float], persist: bool = True) -> None:
+        key = normalize_city(city_name)
+        entry = {"lat": float(coords["lat"]), "lng": float(coords["lng"]), "ts": time.time()}
+        self._load()[key] = entry
+        self._remember(key, entry)
+        if persist:
+            self.save()
+
+    def import_entries(self, entries: Iterable[Tuple[str, float, float]]) -> int:
+        """Import znanych współrzędnych (offline). Zwraca liczbę zaimportowanych wpisów."""
+        n = 0
+        for city, lat, lng in entries:
+            self.put(city, {"lat": lat, "lng": lng}, persist=False)
+            n += 1
+        self.save()
+        return n
+
+    def import_file(self, path: str) -> int:
+        """
+        Import z pliku:
+        - .json: {"Warszawa": {"lat": .., "lng": ..}, ...} lub [{"city":.., "lat":.., "lng":..}, ...]
+        - .csv:  miasto;lat;lng (separator ; lub ,), opcjonalny nagłówek
+        """
+        if path.lower().endswith(".json"):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                rows = [(k, v["lat"], v["lng"]) for k, v in data.items()]
+            else:
+                rows = [(d["city"], d["lat"], d["lng"]) for d in data]
+            return self.import_entries(rows)
+
+        rows = []
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            sample = f.read(2048)
+            f.seek(0)
+            delimiter = ";" if sample.count(";") >= sample.count(",") else ","
+            for row in csv.reader(f, delimiter=delimiter):
+                if len(row) < 3:
+                    continue
+                try:
+                    rows.append((row[0], float(row[1]), float(row[2])))
+                except ValueError:
+                    continue  # nagłówek / śmieci
+        return self.import_entries(rows)
+
+
+_default_cache: Optional[GeocodeCache] = None
+
+
+def default_cache() -> GeocodeCache:
+    """Wspólna instancja na cały proces (LRU przetrwa między kolejnymi wyszukiwaniami w GUI)."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = GeocodeCache()
+    return _default_cache
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cache współrzędnych miast")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_imp = sub.add_parser("import", help="Importuj współrzędne z pliku CSV/JSON")
+    p_imp.add_argument("file")
+    p_imp.add_argument("--cache", default=DEFAULT_CACHE_FILE)
+    p_show = sub.add_parser("show", help="Pokaż współrzędne miasta z cache")
+    p_show.add_argument("city")
+    p_show.add_argument("--cache", default=DEFAULT_CACHE_FILE)
+    args = parser.parse_args()
+
+    cache = GeocodeCache(args.cache)
+    if args.cmd == "import":
+        print(f"Zaimportowano {cache.import_file(args.file)} wpisów do {args.cache}")
+    else:
+        print(cache.get(args.city) or "Brak w cache")
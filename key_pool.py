@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import logger_util
+from request_scheduler import TokenBucket, DEFAULT_QPS
+
+
+DEFAULT_STATE_FILE = "api_keys_state.json"
+DEFAULT_COOLDOWN = 60.0         # [s] przerwa dla klucza po 429 (bez Retry-After), rośnie przy kolejnych
+MAX_COOLDOWN = 900.0            # [s]
+SAVE_EVERY = 100                # zapis stanu co tyle zapytań (oprócz zapisu na koniec przebiegu)
+
+try:
+    from zoneinfo import ZoneInfo
+    _QUOTA_TZ = ZoneInfo("America/Los_Angeles")  # dzienne limity Google zerują się o północy czasu pacyficznego
+except Exception:
+    _QUOTA_TZ = timezone.utc
+
+
+class KeyPoolExhausted(Exception):
+    """Żaden klucz nie ma już dziennego limitu ani nie jest dostępny (403)."""
+
+
+def quota_day() -> str:
+    return datetime.now(_QUOTA_TZ).strftime("%Y-%m-%d")
+
+
+def fingerprint(key: str) -> str:
+    """Identyfikator klucza w logach i pliku stanu — bez zapisywania samego klucza."""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+
+
+class ApiKey:
+    """Klucz z własnym limitem QPS i dziennym limitem zapytań (None — bez limitu)."""
+
+    def __init__(self, key: str, qps: float = DEFAULT_QPS, daily_quota: Optional[int] = None):
+        self.key = key
+        self.id = fingerprint(key)
+        self.qps = qps
+        self.daily_quota = daily_quota
+        self.bucket = TokenBucket(qps) if qps and qps > 0 else None
+        self.day = quota_day()
+        self.used = 0                   # zapytania wysłane w bieżącej dobie limitu
+        self.disabled = False           # 403 — klucz wyłączony do końca doby
+        self.cooldown_until = 0.0       # time.monotonic(); po 429
+        self.strikes = 0                # kolejne 429 bez udanego zapytania
+
+    def roll_day(self, today: str) -> None:
+        if today != self.day:
+            self.day = today
+            self.used = 0
+            self.disabled = False
+
+    def remaining(self) -> float:
+        return float("inf") if self.daily_quota is None else self.daily_quota - self.used
+
+    def usable(self) -> bool:
+        return not self.disabled and self.remaining() > 0
+
+
+class KeyPool:
+    """
+    Pula kluczy API: każde zapytanie dostaje klucz z największym zapasem (pozostały dzienny
+    limit, potem najmniej użyty dziś), preferując klucze, które mają wolny żeton QPS.
+    429 — klucz odpoczywa (Retry-After albo rosnący cooldown), zapytanie idzie innym kluczem;
+    403 — klucz wyłączony do końca doby limitu (północ czasu pacyficznego).
+    Zużycie i wyłączenia są zapisywane w pliku stanu (odciski SHA-256, nie same klucze),
+    więc limit dzienny obowiązuje między uruchomieniami. Gdy żaden klucz nie ma już limitu —
+    KeyPoolExhausted (RequestScheduler przerywa wtedy przebieg przez RunControl).
+    """
+
+    def __init__(self, keys: Iterable[ApiKey], state_path: Optional[str] = DEFAULT_STATE_FILE):
+        self.keys: List[ApiKey] = list(keys)
+        if not self.keys:
+            raise ValueError("Pula kluczy API jest pusta")
+        self.state_path = state_path
+        self.failovers = 0
+        self._since_save = 0
+        self._load()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], default_qps: float = DEFAULT_QPS,
+                    state_path: Optional[str] = DEFAULT_STATE_FILE) -> Optional["KeyPool"]:
+        """
+        Pula z config.json: "API_KEYS": ["klucz", {"key": "...", "qps": 5, "daily_quota": 10000}].
+        None, gdy API_KEYS nie ma — zostaje pojedynczy API_KEY bez puli.
+        """
+        entries: List[Union[str, Dict[str, Any]]] = config.get("API_KEYS") or []
+        keys: List[ApiKey] = []
+        for entry in entries:
+            if isinstance(entry, str):
+                entry = {"key": entry}
+            quota = entry.get("daily_quota")
+            keys.append(ApiKey(entry["key"], float(entry.get("qps", default_qps)),
+                               int(quota) if quota is not None else None))
+        return cls(keys, state_path) if keys else None
+
+    @property
+    def primary(self) -> str:
+        return self.keys[0].key
+
+    @property
+    def total_qps(self) -> float:
+        return sum(k.qps for k in self.keys)
+
+    # ----- stan na dysku -----
+    def _load(self) -> None:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except Exception as e:
+            logger_util.log_warning(f"⚠ Nie udało się wczytać {self.state_path}: {e}")
+            return
+        today = quota_day()
+        for key in self.keys:
+            entry = state.get(key.id)
+            if entry and entry.get("day") == today:
+                key.used = int(entry.get("used", 0))
+                key.disabled = bool(entry.get("disabled", False))
+
+    def save(self) -> None:
+        """Zapis atomowy (plik tymczasowy + os.replace)."""
+        if not self.state_path:
+            return
+        self._since_save = 0
+        state = {k.id: {"day": k.day, "used": k.used, "disabled": k.disabled} for k in self.keys}
+        tmp = self.state_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f, indent=1)
+            os.replace(tmp, self.state_path)
+        except Exception as e:
+            logger_util.log_error(f"Błąd zapisu {self.state_path}: {e}")
+
+    # ----- wybór klucza -----
+    def _candidates(self) -> List[ApiKey]:
+        today = quota_day()
+        for key in self.keys:
+            key.roll_day(today)
+        usable = [k for k in self.keys if k.usable()]
+        if not usable:
+            self.save()
+            raise KeyPoolExhausted("Wszystkie klucze API wyczerpały dzienny limit lub są zablokowane (403)")
+        return usable
+
+    async def acquire(self) -> ApiKey:
+        """Klucz z największym zapasem; czeka na cooldown (429) i żeton QPS wybranego klucza."""
+        while True:
+            now = time.monotonic()
+            usable = self._candidates()
+            ready = [k for k in usable if k.cooldown_until <= now]
+            if not ready:
+                await asyncio.sleep(min(k.cooldown_until for k in usable) - now)
+                continue
+            with_token = [k for k in ready if k.bucket is None or k.bucket.ready()]
+            key = max(with_token or ready, key=lambda k: (k.remaining(), -k.used))
+            if key.bucket is not None:
+                await key.bucket.acquire()
+            if not key.usable() or key.cooldown_until > time.monotonic():
+                continue  # w trakcie czekania na żeton klucz dostał 403/429 albo wyczerpał limit
+            key.used += 1
+            self._since_save += 1
+            if self._since_save >= SAVE_EVERY:
+                self.save()
+            return key
+
+    def available(self, key: ApiKey) -> bool:
+        """Czy klucz wybrany przez acquire() nadal nadaje się do wysłania (403/429 w międzyczasie)."""
+        return not key.disabled and key.cooldown_until <= time.monotonic()
+
+    def release(self, key: ApiKey) -> None:
+        """Zwraca niewykorzystany przydział (zapytanie nie zostało wysłane tym kluczem)."""
+        key.used = max(0, key.used - 1)
+
+    def report(self, key: ApiKey, status: int, retry_after: Optional[float] = None) -> bool:
+        """
+        Wynik zapytania wysłanego kluczem. Zwraca True, gdy zapytanie należy powtórzyć innym
+        kluczem (403/429).
+        """
+        if status == 429:
+            key.strikes += 1
+            cooldown = min(MAX_COOLDOWN, DEFAULT_COOLDOWN * (2 ** (key.strikes - 1)))
+            if retry_after is not None:
+                cooldown = max(retry_after, 1.0)
+            key.cooldown_until = time.monotonic() + cooldown
+            self.failovers += 1
+            logger_util.log_warning(f"🔑 Klucz {key.id}: 429 — przerwa {cooldown:.0f}s, zapytania idą innymi kluczami")
+            return True
+        if status == 403:
+            key.disabled = True
+            self.failovers += 1
+            self.save()
+            logger_util.log_warning(f"🔑 Klucz {key.id}: 403 — wyłączony do końca doby limitu")
+            return True
+        if status < 400:
+            key.strikes = 0
+        return False
+
+    def summary(self) -> str:
+        parts = []
+        for k in self.keys:
+            quota = f"/{k.daily_quota}" if k.daily_quota is not None else ""
+            state = " (403)" if k.disabled else ""
+            parts.append(f"{k.id}: {k.used}{quota}{state}")
+        return "🔑 Klucze API dziś: " + ", ".join(parts)
@@ -1,13 +1,191 @@
+import os
+import json
+import queue
+import atexit
 import logging
+import threading
+from typing import List, Optional
+
+# ===== Domyślne parametry =====
+DEFAULT_LOG_FILE = "log.txt"
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024   # rotacja po 5 MB: log.txt → log.txt.1 → … → log.txt.<backups>
+DEFAULT_BACKUPS = 3
+DEFAULT_FLUSH_INTERVAL = 0.5          # [s] najdłuższy czas, przez jaki wpis czeka w buforze
+DEFAULT_BATCH_SIZE = 500              # maks. wpisów w jednym zapisie
+DEFAULT_QUEUE_SIZE = 100_000          # przy przepełnieniu wpisy są pomijane (i liczone), nie blokują
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+
+class _BatchWriter(threading.Thread):
+    """
+    Wątek zapisujący log: zbiera wpisy z kolejki i zapisuje je partiami (jeden write + flush
+    na partię), z rotacją pliku po przekroczeniu max_bytes. Formatowanie też odbywa się tutaj.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backups: int, json_lines: bool,
+                 flush_interval: float, batch_size: int, queue_size: int):
+        super().__init__(name="logger_util-writer", daemon=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = max(0, backups)
+        self.json_lines = json_lines
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.queue: "queue.Queue[Optional[logging.LogRecord]]" = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._formatter = logging.Formatter(LOG_FORMAT)
+        self._file = None
+
+    # ----- wątek wywołujący -----
+    def submit(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self, timeout: float = 5.0) -> None:
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.join(timeout)
+
+    # ----- wątek zapisu -----
+    def _format(self, record: logging.LogRecord) -> str:
+        if self.json_lines:
+            entry = {"ts": self._formatter.formatTime(record), "level": record.levelname,
+                     "logger": record.name, "msg": record.getMessage()}
+            if record.exc_text:
+                entry["exc"] = record.exc_text
+            return json.dumps(entry, ensure_ascii=False)
+        return self._formatter.format(record)
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")  # polskie znaki
+        return self._file
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._file = None
+        if self.backups == 0:
+            os.remove(self.path)
+            return
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _write(self, records: List[logging.LogRecord]) -> None:
+        lines = [self._format(r) for r in records]
+        if self.dropped:
+            lines.append(f"{self._formatter.formatTime(records[-1])} - WARNING - "
+                         f"Pominięto {self.dropped} wpisów (przepełniona kolejka logu)")
+            self.dropped = 0
+        f = self._open()
+        f.write("\n".join(lines) + "\n")
+        f.flush()
+        if self.max_bytes and f.tell() >= self.max_bytes:
+            self._rotate()
+
+    def run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch: List[logging.LogRecord] = []
+            item = first
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception:
+                    pass  # log nie może zatrzymać aplikacji
+        if self._file is not None:
+            self._file.close()
+
+
+class AsyncBatchHandler(logging.Handler):
+    """Handler logging: w wątku wywołującym tylko przygotowanie wpisu i put_nowait do kolejki."""
+
+    def __init__(self, writer: _BatchWriter):
+        super().__init__()
+        self.writer = writer
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            # treść i wyjątek liczone od razu (argumenty mogą się później zmienić), reszta w wątku zapisu
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self.writer.submit(record)
+        except Exception:
+            self.handleError(record)
+
+
+_writer: Optional[_BatchWriter] = None
+_handler: Optional[AsyncBatchHandler] = None
+_lock = threading.Lock()
+
+
+def configure(path: str = DEFAULT_LOG_FILE,
+              max_bytes: int = DEFAULT_MAX_BYTES,
+              backups: int = DEFAULT_BACKUPS,
+              json_lines: bool = False,
+              flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+              batch_size: int = DEFAULT_BATCH_SIZE,
+              queue_size: int = DEFAULT_QUEUE_SIZE,
+              level: int = logging.INFO) -> None:
+    """
+    (Re)konfiguruje log: handler na głównym loggerze przekazuje wpisy do wątku zapisu.
+    json_lines=True — każdy wpis jako obiekt JSON w osobnej linii (ts, level, logger, msg).
+    Wcześniejszy wątek zapisu jest domykany (wpisy z kolejki trafiają do pliku).
+    """
+    global _writer, _handler
+    with _lock:
+        root = logging.getLogger()
+        old_writer, old_handler = _writer, _handler
+        _writer = _BatchWriter(path, max_bytes, backups, json_lines, flush_interval, batch_size, queue_size)
+        _writer.start()
+        _handler = AsyncBatchHandler(_writer)
+        root.addHandler(_handler)
+        root.setLevel(level)
+        if old_handler is not None:
+            root.removeHandler(old_handler)
+        if old_writer is not None:
+            old_writer.stop()
+
+
+def shutdown(timeout: float = 5.0) -> None:
+    """Zapisuje zaległe wpisy i zatrzymuje wątek (wywoływane też przy wyjściu z programu)."""
+    global _writer, _handler
+    with _lock:
+        if _handler is not None:
+            logging.getLogger().removeHandler(_handler)
+        if _writer is not None:
+            _writer.stop(timeout)
+        _writer, _handler = None, None
+
+
+configure()
+atexit.register(shutdown)
 
-# Konfiguracja logowania do pliku z polskimi znakami
-logging.basicConfig(
-    filename="log.txt",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    filemode="a",
-    encoding="utf-8"  # Ważne: pozwala na zapis polskich znaków
-)
 
 def log_info(message: str):
     logging.info(message)
@@ -16,4 +194,4 @@ def log_warning(message: str):
     logging.warning(message)
 
 def log_error(message: str):
-    logging.error(message)
\ No newline at end of file
+    logging.error(message)
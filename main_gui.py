@@ -1,20 +1,38 @@
+import time
+
+_PROCESS_T0 = time.perf_counter()  # pomiar startu: od importu modułu do gotowości okna
+
 import sys
 import json
 import asyncio
 import html
+import importlib
+from collections import deque
 from datetime import datetime
 
-from PySide6.QtCore import Qt, Slot
+from PySide6.QtCore import Qt, Slot, QTimer
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QProgressBar, QMessageBox, QComboBox,
-    QTextEdit, QFrame
+    QFrame, QDialog, QPlainTextEdit
 )
 from qasync import QEventLoop, asyncSlot
 
 import logger_util
-from collector_core import run_collection
-from auto_updater import check_for_update_gui
+from metrics import RunMetrics
+from progress import ProgressSnapshot, format_eta
+from run_control import RunControl
+
+# Moduły z pandas/numpy/openpyxl/aiohttp (collector_core i zależności) i requests (auto_updater)
+# ładują się dopiero po pokazaniu okna, w wątku w tle (_finish_startup); aktualizacja sprawdzana asynchronicznie.
+BACKEND_MODULES = ("collector_core", "sinks", "response_cache", "run_journal")
+STARTUP_BUDGET_MS = 1000  # okno widoczne najpóźniej po tylu ms od startu (ostrzeżenie w logu, --startup-time)
+
+
+# Koszt odświeżania GUI niezależny od długości przebiegu: log to bufor pierścieniowy
+# (najstarsze linie są usuwane), wpisy i pasek postępu trafiają na ekran co UI_REFRESH_MS.
+LOG_MAX_LINES = 5000
+UI_REFRESH_MS = 100  # ~10 klatek/s
 
 
 # ------------------------- STYLES (QSS) -------------------------
@@ -88,7 +106,7 @@ QProgressBar::chunk {
     background-color: #22c55e; /* green-500 */
 }
 
-QTextEdit#LogView {
+QPlainTextEdit#LogView {
     color: #e5e7eb;
     background: #0b1220;
     border: 1px solid #1f2937;
@@ -144,6 +162,18 @@ class CompanyCollectorUI(QMainWindow):
         self.btn = QPushButton("Szukaj")
         self.btn.clicked.connect(self.on_start_clicked)
 
+        self.btn_pause = QPushButton("Pauza")
+        self.btn_pause.setEnabled(False)
+        self.btn_pause.clicked.connect(self.on_pause_clicked)
+
+        self.btn_stop = QPushButton("Stop")
+        self.btn_stop.setEnabled(False)
+        self.btn_stop.clicked.connect(self.on_stop_clicked)
+
+        self.btn_metrics = QPushButton("Metryki")
+        self.btn_metrics.setEnabled(False)
+        self.btn_metrics.clicked.connect(self.on_metrics_clicked)
+
         # grow
         row.addWidget(lbl_city)
         row.addWidget(self.city, 1)
@@ -152,6 +182,9 @@ class CompanyCollectorUI(QMainWindow):
         row.addWidget(self.radius_combo)
         row.addSpacing(12)
         row.addWidget(self.btn)
+        row.addWidget(self.btn_pause)
+        row.addWidget(self.btn_stop)
+        row.addWidget(self.btn_metrics)
 
         input_layout.addLayout(row)
 
@@ -178,10 +211,10 @@ class CompanyCollectorUI(QMainWindow):
         lbl_logs = QLabel("Log")
         logs_layout.addWidget(lbl_logs)
 
-        self.logs = QTextEdit()
+        self.logs = QPlainTextEdit()
         self.logs.setObjectName("LogView")
         self.logs.setReadOnly(True)
-        self.logs.setAcceptRichText(True)
+        self.logs.setMaximumBlockCount(LOG_MAX_LINES)
         logs_layout.addWidget(self.logs, 1)
 
         root_layout.addWidget(logs_card, 1)
@@ -191,10 +224,116 @@ class CompanyCollectorUI(QMainWindow):
         # ---------- CONFIG ----------
         self.API_KEY = ""
         self.SEARCH_CATEGORIES = []
+        self.MAX_CONCURRENCY = None  # domyślne z request_scheduler — ustawiane w _load_config
+        self.QPS = None
+        self.CACHE_TTL_H = 6.0
+        self.REPLAY = False
+        self.TILING = False
+        self.SHARD_BY = None
+        self.SINKS = ["excel"]
+        self.RESUME = False
+        self.TWO_PHASE = False
+        self.TERM_PLANNER = False
+        self.METRICS_DIR = "metrics"
+        self._last_metrics = None
+        self._sinks = None
+        self._response_cache = None
+        self._journal = None
+        self._planner = None
+        self._key_pool = None
+        self._run_id = 0
+        self._control = None  # RunControl przebiegu, który właśnie pobiera
+
+        # wpisy logu czekające na wyświetlenie i docelowa wartość paska — odświeżane timerem
+        self._pending_logs = deque(maxlen=LOG_MAX_LINES)
+        self._progress_value = 0
+        self._progress_text = "%p%"
+        self._ui_timer = QTimer(self)
+        self._ui_timer.setInterval(UI_REFRESH_MS)
+        self._ui_timer.timeout.connect(self._refresh_ui)
+        self._ui_timer.start()
+        self._current_city = ""
+        self._current_radius_km = 0
+
+        # apply styles
+        self.setStyleSheet(APP_QSS)
+
+        # konfiguracja, ciężkie importy i sprawdzenie aktualizacji — po pokazaniu okna
+        self.btn.setEnabled(False)
+        self.startup_ms = None  # (okno widoczne, gotowe do pracy) [ms]
+        self.ready = asyncio.Event()
+        self.check_updates = True
+        QTimer.singleShot(0, self._finish_startup)
+
+    # ------------------- STARTUP -------------------
+    @asyncSlot()
+    async def _finish_startup(self):
+        shown_ms = (time.perf_counter() - _PROCESS_T0) * 1000
+        try:
+            await asyncio.to_thread(lambda: [importlib.import_module(m) for m in BACKEND_MODULES])
+        except Exception as e:
+            self._log_error(f"Błąd ładowania modułów: {e}")
+        self._load_config()
+        ready_ms = (time.perf_counter() - _PROCESS_T0) * 1000
+        self.startup_ms = (shown_ms, ready_ms)
+        self.btn.setEnabled(True)
+        self.ready.set()
+        msg = f"Start: okno po {shown_ms:.0f} ms, gotowe po {ready_ms:.0f} ms."
+        if shown_ms > STARTUP_BUDGET_MS:
+            self._log_warn(msg + f" Przekroczono budżet {STARTUP_BUDGET_MS} ms.")
+        else:
+            logger_util.log_info(msg)
+        if self.check_updates:
+            from auto_updater import check_for_update_gui_async
+            await check_for_update_gui_async(parent=self, ask=True)
+
+    def _load_config(self):
+        from pipeline import DEFAULT_FLUSH_ROWS, DEFAULT_FLUSH_SECONDS
+        from request_scheduler import DEFAULT_MAX_CONCURRENCY, DEFAULT_QPS
+
+        self.MAX_CONCURRENCY = DEFAULT_MAX_CONCURRENCY
+        self.QPS = DEFAULT_QPS
+        self.FLUSH_ROWS = DEFAULT_FLUSH_ROWS
+        self.FLUSH_SECONDS = DEFAULT_FLUSH_SECONDS
         try:
             with open("config.json", "r", encoding="utf-8") as f:
                 config = json.load(f)
-            self.API_KEY = config["API_KEY"]
+            # opcjonalne limity zapytań (domyślne z request_scheduler)
+            self.MAX_CONCURRENCY = int(config.get("MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+            self.QPS = float(config.get("QPS", DEFAULT_QPS))
+            # pula kluczy: "API_KEYS": ["klucz", {"key": "...", "qps": 5, "daily_quota": 10000}];
+            # QPS jest wtedy limitem na klucz, a zużycie dzienne trafia do api_keys_state.json
+            from key_pool import KeyPool
+            self._key_pool = KeyPool.from_config(config, self.QPS)
+            self.API_KEY = config.get("API_KEY") or (self._key_pool.primary if self._key_pool else "")
+            # cache odpowiedzi Places (0 = wyłączony) i tryb replay (tylko z cache, bez sieci)
+            self.CACHE_TTL_H = float(config.get("RESPONSE_CACHE_TTL_H", 6))
+            self.REPLAY = bool(config.get("REPLAY", False))
+            # adaptacyjny podział obszaru na kafle przy nasyceniu limitu 60 wyników
+            self.TILING = bool(config.get("TILING", False))
+            # zapis append-only do katalogu shardów: "month" / "city" (brak = jeden plik firmy.xlsx)
+            self.SHARD_BY = config.get("SHARD_BY")
+            # wyjścia: excel, csv, parquet, sqlite
+            self.SINKS = list(config.get("SINKS", ["excel"]))
+            # zapis partiami w trakcie przebiegu: co tyle nowych rekordów / sekund
+            self.FLUSH_ROWS = int(config.get("FLUSH_ROWS", DEFAULT_FLUSH_ROWS))
+            self.FLUSH_SECONDS = float(config.get("FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS))
+            # niedokończony przebieg z dziennika run_journal.jsonl: true — wznawiany bez pytania,
+            # false — pytanie przed wznowieniem (stan starszy niż 15 min nie jest wznawiany)
+            self.RESUME = bool(config.get("RESUME", False))
+            # dwufazowo: wyszukiwanie samych ID, Place Details tylko dla firm spoza skoroszytu
+            self.TWO_PHASE = bool(config.get("TWO_PHASE", False))
+            # planer fraz: pomija/przycina frazy, które w danym mieście prawie zawsze dublują inne
+            self.TERM_PLANNER = bool(config.get("TERM_PLANNER", False))
+            # eksport metryk po każdym przebiegu (last_run.json / last_run.prom); "" = bez eksportu
+            self.METRICS_DIR = config.get("METRICS_DIR", "metrics")
+            # log.txt: rotacja wg rozmiaru, opcjonalnie wpisy jako JSON (jedna linia = jeden obiekt)
+            if any(k in config for k in ("LOG_MAX_MB", "LOG_BACKUPS", "LOG_JSON")):
+                logger_util.configure(
+                    max_bytes=int(float(config.get("LOG_MAX_MB", 5)) * 1024 * 1024),
+                    backups=int(config.get("LOG_BACKUPS", logger_util.DEFAULT_BACKUPS)),
+                    json_lines=bool(config.get("LOG_JSON", False)),
+                )
             self._log_info("Wczytano config.json.")
         except Exception as e:
             self._log_error(f"Błąd wczytywania config.json: {e}")
@@ -211,25 +350,28 @@ class CompanyCollectorUI(QMainWindow):
             self._log_error(f"Błąd wczytywania categories.json: {e}")
             QMessageBox.critical(self, "Błąd", f"Nie udało się wczytać categories.json:\n{e}")
 
-        # progress math
-        self._ticks = 0
-        self._expected_ticks = max(1, len(self.SEARCH_CATEGORIES) * 60)
-        self._current_city = ""
-        self._current_radius_km = 0
-
-        # apply styles
-        self.setStyleSheet(APP_QSS)
+    # ------------------- LOGGING (COLORED) -------------------
+    def _append_html(self, html_line: str):
+        """Queue rich HTML line for the next UI refresh."""
+        self._pending_logs.append(html_line)
 
-        # updater (GUI)
+    def _flush_logs(self):
+        if not self._pending_logs:
+            return
+        bar = self.logs.verticalScrollBar()
+        at_bottom = bar.value() >= bar.maximum()
+        self.logs.setUpdatesEnabled(False)
         try:
-            check_for_update_gui(parent=self, ask=True)
-        except Exception:
-            pass
+            while self._pending_logs:
+                self.logs.appendHtml(self._pending_logs.popleft())
+        finally:
+            self.logs.setUpdatesEnabled(True)
+        if at_bottom:
+            bar.setValue(bar.maximum())
 
-    # ------------------- LOGGING (COLORED) -------------------
-    def _append_html(self, html_line: str):
-        """Append rich HTML line to logs."""
-        self.logs.append(html_line)
+    def _clear_logs(self):
+        self._pending_logs.clear()
+        self.logs.clear()
 
     def _stamp(self) -> str:
         return datetime.now().strftime("%H:%M:%S")
@@ -266,10 +408,25 @@ class CompanyCollectorUI(QMainWindow):
         self._log(msg, color="#ef4444", bold=True, icon="❌")  # red-500
 
     # ------------------- PROGRESS -------------------
-    def _progress_tick(self):
-        self._ticks += 1
-        percent = min(100, int(self._ticks * 100 / self._expected_ticks))
+    def _on_progress(self, snap: ProgressSnapshot):
+        # tylko stan — pasek odświeża _refresh_ui; mianownik rośnie w trakcie, więc pasek nie cofa się
+        self._progress_value = max(self._progress_value, int(snap.fraction * 100))
+        self._progress_text = (f"%p% · zapytania {snap.completed}/{snap.planned} · "
+                               f"{snap.rate:.1f}/s · ETA {format_eta(snap.eta)}")
+
+    def _set_progress(self, percent: int, text: str = "%p%"):
+        self._progress_value = percent
+        self._progress_text = text
         self.progress.setValue(percent)
+        self.progress.setFormat(text)
+
+    @Slot()
+    def _refresh_ui(self):
+        self._flush_logs()
+        if self.progress.value() != self._progress_value:
+            self.progress.setValue(self._progress_value)
+        if self.progress.format() != self._progress_text:
+            self.progress.setFormat(self._progress_text)
 
     # ------------------- UI ACTIONS -------------------
     @Slot()
@@ -296,13 +453,12 @@ class CompanyCollectorUI(QMainWindow):
 
         # reset UI
         self.btn.setEnabled(False)
-        self._ticks = 0
-        self._expected_ticks = max(1, len(self.SEARCH_CATEGORIES) * 60)
         self.progress.setRange(0, 100)
-        self.progress.setValue(0)
-        self.logs.clear()
+        self._set_progress(0)
+        self._clear_logs()
         self._current_city = city
         self._current_radius_km = radius_km
+        self._run_id += 1
 
         # banner
         self._log_info(f"Start wyszukiwania — {city}, promień {radius_km} km")
@@ -310,41 +466,201 @@ class CompanyCollectorUI(QMainWindow):
         # run
         self.run(city, radius_m)
 
+    def _get_response_cache(self):
+        if self._response_cache is None and (self.CACHE_TTL_H > 0 or self.REPLAY):
+            from response_cache import ResponseCache
+            self._response_cache = ResponseCache(ttl_seconds=self.CACHE_TTL_H * 3600, replay=self.REPLAY)
+        return self._response_cache
+
+    def _get_sinks(self):
+        if self._sinks is None:
+            from sinks import make_sinks
+            self._sinks = make_sinks(self.SINKS, shard_by=self.SHARD_BY)
+        return self._sinks
+
+    def _get_journal(self):
+        # jeden dziennik na całą aplikację — przebiegi kolejnych miast mogą na siebie zachodzić
+        if self._journal is None:
+            from run_journal import RunJournal
+            self._journal = RunJournal()
+        return self._journal
+
+    def _get_planner(self):
+        # statystyki fraz (term_yield.json) zbierane zawsze poza TWO_PHASE; przycinanie tylko z TERM_PLANNER
+        if self._planner is None:
+            from term_planner import TermPlanner
+            self._planner = TermPlanner(prune=self.TERM_PLANNER)
+        return self._planner
+
+    def _should_resume(self, city_name: str, radius_m: int) -> bool:
+        journal = self._get_journal()
+        if not journal.has_city(city_name, radius_m):
+            return False
+        if self.RESUME:
+            return True
+        age_min = (time.time() - journal.updated_at(city_name, radius_m)) / 60
+        ret = QMessageBox.question(
+            self, "Wznowić wyszukiwanie?",
+            f"{city_name} ({radius_m // 1000} km): jest niedokończony przebieg sprzed {age_min:.0f} min.\n"
+            f"Wznowić go bez powtarzania zapytań? (Nie — wyszukiwanie od nowa)",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes
+        )
+        return ret == QMessageBox.Yes
+
     @asyncSlot(str, int)
     async def run(self, city_name: str, radius_m: int):
+        from collector_core import run_collection  # załadowany już w _finish_startup
+        resume = self._should_resume(city_name, radius_m)
+        metrics = RunMetrics()
+        run_id = self._run_id
+        control = RunControl()
+        self._set_control(control)
+        fetching = True
+
+        def on_fetch_done():
+            # pobieranie skończone — zapis leci w tle, można już szukać w kolejnym mieście
+            nonlocal fetching
+            fetching = False
+            self.btn.setEnabled(True)
+            if self._control is control:
+                self._set_control(None)
+
+        def on_progress(snap: ProgressSnapshot):
+            # pasek pokazuje tylko najnowsze wyszukiwanie
+            if run_id == self._run_id:
+                self._on_progress(snap)
+
+        def on_save(event: str, count: int):
+            if event == "start":
+                self._log_info(f"💾 {city_name}: zapis {count} rekordów…")
+            else:
+                self._log_info(f"💾 {city_name}: zapisano {count} nowych.")
+
         try:
             total, unique, added = await run_collection(
                 city_name=city_name,
                 radius_m=radius_m,
                 api_key=self.API_KEY,
                 categories=self.SEARCH_CATEGORIES,
-                progress_cb=self._progress_tick,
-                log_cb=None  # nic nie pushujemy z core do GUI
+                progress_cb=on_progress,
+                log_cb=None,  # nic nie pushujemy z core do GUI
+                max_concurrency=self.MAX_CONCURRENCY,
+                qps=self.QPS,
+                response_cache=self._get_response_cache(),
+                tiling=self.TILING,
+                shard_by=self.SHARD_BY,
+                sinks=self._get_sinks(),
+                flush_rows=self.FLUSH_ROWS,
+                flush_seconds=self.FLUSH_SECONDS,
+                resume=resume,
+                journal=self._get_journal(),
+                two_phase=self.TWO_PHASE,
+                metrics=metrics,
+                save_cb=on_save,
+                fetch_done_cb=on_fetch_done,
+                control=control,
+                planner=self._get_planner(),
+                key_pool=self._key_pool
             )
-            self.progress.setValue(100)
+            if run_id == self._run_id and not control.cancelled:
+                self._set_progress(100)
             # Jedna, wyraźna linia podsumowania
             self._log_success(
-                f"{self._current_city} ({self._current_radius_km} km): "
+                f"{city_name} ({radius_m // 1000} km){' — przerwano' if control.cancelled else ''}: "
                 f"znaleziono {total}, unikalne {unique}, zapisano {added}."
             )
         except Exception as e:
             self._log_error(f"Błąd: {e}")
             QMessageBox.critical(self, "Błąd", str(e))
         finally:
-            self.btn.setEnabled(True)
+            if fetching:
+                self.btn.setEnabled(True)
+                if self._control is control:
+                    self._set_control(None)
+            self._store_metrics(metrics)
+
+    def _set_control(self, control):
+        self._control = control
+        self.btn_pause.setEnabled(control is not None)
+        self.btn_pause.setText("Pauza")
+        self.btn_stop.setEnabled(control is not None)
+
+    @Slot()
+    def on_pause_clicked(self):
+        control = self._control
+        if control is None:
+            return
+        if control.paused:
+            control.resume()
+            self.btn_pause.setText("Pauza")
+            self._log_info("▶ Wznowiono wyszukiwanie.")
+        else:
+            control.pause()
+            self.btn_pause.setText("Wznów")
+            self._log_info("⏸ Wstrzymano — zapytania w toku kończą się, nowe czekają.")
+
+    @Slot()
+    def on_stop_clicked(self):
+        control = self._control
+        if control is None:
+            return
+        self.btn_pause.setEnabled(False)
+        self.btn_stop.setEnabled(False)
+        self._log_warn("⏹ Przerywam — zapisuję to, co już pobrano…")
+        control.cancel()
+
+    def _store_metrics(self, metrics: RunMetrics):
+        self._last_metrics = metrics
+        self.btn_metrics.setEnabled(True)
+        if self.METRICS_DIR:
+            try:
+                metrics.export(self.METRICS_DIR)
+            except Exception as e:
+                self._log_warn(f"Nie udało się zapisać metryk: {e}")
+
+    def on_metrics_clicked(self):
+        if self._last_metrics is None:
+            return
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Metryki ostatniego przebiegu")
+        dialog.resize(720, 520)
+        layout = QVBoxLayout(dialog)
+        view = QPlainTextEdit()
+        view.setObjectName("LogView")
+        view.setReadOnly(True)
+        view.setLineWrapMode(QPlainTextEdit.NoWrap)
+        view.setPlainText(self._last_metrics.summary())
+        layout.addWidget(view)
+        dialog.exec()
 
 
 def main():
+    # --startup-time: wypisuje czas startu i kończy (kod 1 po przekroczeniu STARTUP_BUDGET_MS)
+    measure_startup = "--startup-time" in sys.argv
     app = QApplication(sys.argv)
     loop = QEventLoop(app)
     asyncio.set_event_loop(loop)
 
     ui = CompanyCollectorUI()
+    ui.check_updates = not measure_startup
     ui.show()
 
+    exit_code = 0
+    if measure_startup:
+        async def _report_startup():
+            nonlocal exit_code
+            await ui.ready.wait()
+            shown_ms, ready_ms = ui.startup_ms
+            print(f"startup: okno {shown_ms:.0f} ms, gotowe {ready_ms:.0f} ms (budżet {STARTUP_BUDGET_MS} ms)")
+            exit_code = 0 if shown_ms <= STARTUP_BUDGET_MS else 1
+            loop.stop()
+
+        loop.create_task(_report_startup())
+
     with loop:
         loop.run_forever()
+    return exit_code
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+
+# górne granice kubełków histogramu [s] (jak domyślne kubełki klientów Prometheusa)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "company_collector"
+
+
+class Histogram:
+    """Histogram czasów z kubełkami (licznik, suma, maksimum i przybliżone kwantyle)."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # ostatni kubełek: +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Górna granica kubełka, w którym wypada kwantyl q (dla +Inf — maksimum)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"count": self.count, "sum": round(self.sum, 4), "max": round(self.max, 4),
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99),
+                "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts))}
+
+
+class CategoryStats:
+    __slots__ = ("pages", "places", "kept", "filtered", "known")
+
+    def __init__(self):
+        self.pages = 0       # odpowiedzi places:searchText
+        self.places = 0      # wszystkie firmy w odpowiedziach
+        self.kept = 0        # z telefonem i stroną
+        self.filtered = 0    # odrzucone: brak telefonu lub strony
+        self.known = 0       # tryb dwufazowy: bez danych z Place Details (znane, z innej frazy, błąd)
+
+
+class RunMetrics:
+    """
+    Pomiary jednego przebiegu: histogramy czasów (zapytania wg punktu API, dedup, zapis),
+    strony/firmy/odrzucone per kategoria, ponowienia, zapytania i trafienia cache.
+    Wypełniany przez RequestScheduler (zapytania), fetch_rect_pages (kategorie) i Pipeline
+    (dedup, zapis); eksport do JSON i formatu tekstowego Prometheusa.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.timings: Dict[str, Histogram] = {}
+        self.categories: Dict[str, CategoryStats] = {}
+        self.counters: Dict[str, float] = {}
+
+    # ----- zapis -----
+    def observe(self, name: str, seconds: float) -> None:
+        hist = self.timings.get(name)
+        if hist is None:
+            hist = self.timings[name] = Histogram()
+        hist.observe(seconds)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def page(self, term: str, places: int, kept: int, known: int = 0) -> None:
+        """known — firmy ze strony pominięte przez Place Details (nie trafiają do filtered)."""
+        stats = self.categories.get(term)
+        if stats is None:
+            stats = self.categories[term] = CategoryStats()
+        stats.pages += 1
+        stats.places += places
+        stats.kept += kept
+        stats.known += known
+        stats.filtered += places - known - kept
+
+    def finish(self) -> None:
+        self.finished = time.time()
+
+    # ----- eksport -----
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished or time.time()
+        return {
+            "started": self.started,
+            "seconds": round(end - self.started, 3),
+            "counters": dict(self.counters),
+            "timings": {k: h.to_dict() for k, h in self.timings.items()},
+            "categories": {t: {"pages": s.pages, "places": s.places, "kept": s.kept, "filtered": s.filtered,
+                               "known": s.known}
+                           for t, s in self.categories.items()},
+        }
+
+    def to_prometheus(self) -> str:
+        p = METRIC_PREFIX
+        lines: List[str] = [f"# TYPE {p}_run_seconds gauge",
+                            f"{p}_run_seconds {(self.finished or time.time()) - self.started:.3f}"]
+        for name, value in sorted(self.counters.items()):
+            lines += [f"# TYPE {p}_{name}_total counter", f"{p}_{name}_total {value:g}"]
+        if self.timings:
+            lines.append(f"# TYPE {p}_duration_seconds histogram")
+        for name, h in sorted(self.timings.items()):
+            cumulative = 0
+            for bound, c in zip([f"{b:g}" for b in h.buckets] + ["+Inf"], h.counts):
+                cumulative += c
+                lines.append(f'{p}_duration_seconds_bucket{{op="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{p}_duration_seconds_sum{{op="{name}"}} {h.sum:.6f}')
+            lines.append(f'{p}_duration_seconds_count{{op="{name}"}} {h.count}')
+        for field in CategoryStats.__slots__:
+            if self.categories:
+                lines.append(f"# TYPE {p}_category_{field}_total counter")
+            for term, s in sorted(self.categories.items()):
+                label = term.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{p}_category_{field}_total{{term="{label}"}} {getattr(s, field)}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Czytelne podsumowanie (GUI, log)."""
+        d = self.to_dict()
+        out = [f"Czas przebiegu: {d['seconds']} s"]
+        for name, value in sorted(self.counters.items()):
+            out.append(f"{name}: {value:g}")
+        if self.timings:
+            out.append("")
+            out.append(f"{'operacja':<12}{'liczba':>8}{'suma [s]':>10}{'p50 [s]':>9}{'p99 [s]':>9}{'max [s]':>9}")
+            for name, h in sorted(self.timings.items()):
+                out.append(f"{name:<12}{h.count:>8}{h.sum:>10.2f}{h.quantile(0.5):>9g}"
+                           f"{h.quantile(0.99):>9g}{h.max:>9.2f}")
+        if self.categories:
+            out.append("")
+            out.append(f"{'kategoria':<30}{'strony':>8}{'firmy':>8}{'z tel.+www':>11}{'odrzucone':>10}{'znane':>8}")
+            for term, s in sorted(self.categories.items(), key=lambda kv: -kv[1].places):
+                out.append(f"{term[:29]:<30}{s.pages:>8}{s.places:>8}{s.kept:>11}{s.filtered:>10}{s.known:>8}")
+        return "\n".join(out)
+
+    def export(self, directory: str, name: str = "last_run") -> None:
+        """Zapisuje <directory>/<name>.json i <name>.prom (format textfile collectora Prometheusa)."""
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, name + ".json"), "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+        tmp = os.path.join(directory, name + ".prom.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, os.path.join(directory, name + ".prom"))
+
+
+def maybe_span(metrics: Optional[RunMetrics], name: str):
+    """metrics.span(name) albo pusty kontekst, gdy pomiary są wyłączone."""
+    return metrics.span(name) if metrics is not None else nullcontext()
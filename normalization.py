@@ -0,0 +1,155 @@
+import re
+from typing import Iterable, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_COUNTRY_CODE = "48"
+# długość numeru krajowego (bez kierunkowego kraju) — numery tej długości bez "+"/"00" traktujemy jako krajowe
+NATIONAL_LENGTH = {"48": 9}
+
+# Domeny, które nie identyfikują firmy (profile społecznościowe, kreatory stron, katalogi)
+GENERIC_DOMAINS = frozenset({
+    "facebook.com", "m.facebook.com", "fb.com", "instagram.com", "linkedin.com", "twitter.com", "x.com",
+    "youtube.com", "tiktok.com", "google.com", "sites.google.com", "business.site", "g.page",
+    "linktr.ee", "allegro.pl", "olx.pl", "otomoto.pl", "booksy.com", "wa.me", "bit.ly",
+})
+
+_NON_DIGIT = re.compile(r"\D")
+
+
+# ===== Telefony =====
+def canonical_phone(s, country_code: str = DEFAULT_COUNTRY_CODE) -> str:
+    """
+    Numer w postaci cyfr E.164 (bez "+"): "+48 22 123 45 67", "0048221234567" i "22 123 45 67"
+    dają "48221234567". Pusty napis, gdy brak cyfr.
+    """
+    if s is None:
+        return ""
+    raw = str(s).strip()
+    digits = _NON_DIGIT.sub("", raw)
+    if not digits:
+        return ""
+    if raw.startswith("+"):
+        return digits
+    if raw.startswith("00"):
+        return digits[2:]
+    national = NATIONAL_LENGTH.get(country_code)
+    if national is not None and len(digits) == national:
+        return country_code + digits
+    return digits
+
+
+def canonical_phones(values, country_code: str = DEFAULT_COUNTRY_CODE) -> pd.Series:
+    """Wektorowa wersja canonical_phone dla całej kolumny (operacje .str pandas, bez pętli Pythona)."""
+    s = pd.Series(values, copy=False).fillna("").astype(str).str.strip()
+    digits = s.str.replace(_NON_DIGIT, "", regex=True)
+    plus = s.str.startswith("+")
+    double_zero = s.str.startswith("00")
+    digits = digits.where(~double_zero, digits.str[2:])
+    national = NATIONAL_LENGTH.get(country_code)
+    if national is not None:
+        is_national = ~plus & ~double_zero & (digits.str.len() == national)
+        digits = digits.where(~is_national, country_code + digits)
+    return digits
+
+
+# ===== Strony WWW =====
+def website_domain(url) -> str:
+    """Host strony bez "www." i portu, małymi literami. Pusty napis dla braku strony i domen ogólnych."""
+    if not url:
+        return ""
+    u = str(url).strip().lower()
+    if "://" not in u:
+        u = "http://" + u
+    try:
+        host = urlsplit(u).hostname or ""
+    except ValueError:
+        return ""
+    if host.startswith("www."):
+        host = host[4:]
+    if not host or "." not in host or host in GENERIC_DOMAINS:
+        return ""
+    return host
+
+
+def website_domains(values) -> pd.Series:
+    """Wektorowa wersja website_domain."""
+    s = pd.Series(values, copy=False).fillna("").astype(str).str.strip().str.lower()
+    host = s.str.replace(r"^[a-z][a-z0-9+.-]*://", "", regex=True)
+    host = host.str.replace(r"[/?#].*$", "", regex=True)
+    host = host.str.replace(r"^[^@]*@", "", regex=True).str.replace(r":\d+$", "", regex=True)
+    host = host.str.replace(r"^www\.", "", regex=True)
+    bad = ~host.str.contains(".", regex=False) | host.isin(GENERIC_DOMAINS) | (s == "brak strony")
+    return host.mask(bad, "")
+
+
+# ===== Rozpoznawanie tych samych firm =====
+def resolve_entities(keys: Sequence[Iterable]) -> np.ndarray:
+    """
+    Union-find po wielu kluczach naraz: rekordy dzielące KTÓRYKOLWIEK niepusty klucz
+    (telefon, place ID, domena) trafiają do jednej grupy — także przechodnio.
+    keys: lista kolumn tej samej długości. Zwraca etykietę grupy = indeks pierwszego rekordu grupy.
+    Implementacja wektorowa: propagacja minimalnej etykiety w grupach klucza + skracanie ścieżek
+    (labels = labels[labels]) aż do zbieżności — zwykle kilka przebiegów nawet dla milionów rekordów.
+    """
+    columns = [pd.Series(k, copy=False).fillna("").astype(str).to_numpy() for k in keys]
+    n = len(columns[0]) if columns else 0
+    labels = np.arange(n)
+    if n == 0:
+        return labels
+
+    groups = []
+    for col in columns:
+        codes, uniques = pd.factorize(col)
+        empty = np.flatnonzero(uniques == "")
+        valid = codes >= 0
+        if len(empty):
+            valid &= codes != empty[0]
+        idx = np.flatnonzero(valid)
+        if len(idx):
+            groups.append((idx, codes[idx], len(uniques)))
+
+    while True:
+        prev = labels
+        labels = labels.copy()
+        for idx, codes, n_codes in groups:
+            group_min = np.full(n_codes, n, dtype=labels.dtype)
+            np.minimum.at(group_min, codes, labels[idx])
+            labels[idx] = np.minimum(labels[idx], group_min[codes])
+        labels = labels[labels]
+        if np.array_equal(labels, prev):
+            return labels
+
+
+def entity_keys(phones, place_ids=None, websites=None,
+                country_code: str = DEFAULT_COUNTRY_CODE) -> List[pd.Series]:
+    """Kolumny kluczy (telefon E.164, place ID, domena) dla resolve_entities."""
+    keys = [canonical_phones(phones, country_code)]
+    if place_ids is not None:
+        keys.append(pd.Series(place_ids, copy=False).fillna("").astype(str))
+    if websites is not None:
+        keys.append(website_domains(websites))
+    return keys
+
+
+def first_of_each_entity(labels: np.ndarray) -> np.ndarray:
+    """Maska: True dla pierwszego rekordu każdej grupy (etykieta == własny indeks)."""
+    return labels == np.arange(len(labels))
+
+
+def row_keys(phone, place_id: Optional[str] = None, website: Optional[str] = None,
+             country_code: str = DEFAULT_COUNTRY_CODE) -> List[str]:
+    """Klucze jednego rekordu z prefiksem typu (p:/i:/d:) — do dedup przyrostowego na jednym zbiorze."""
+    keys = []
+    p = canonical_phone(phone, country_code)
+    if p:
+        keys.append("p:" + p)
+    if place_id:
+        keys.append("i:" + str(place_id))
+    d = website_domain(website)
+    if d:
+        keys.append("d:" + d)
+    return keys
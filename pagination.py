@@ -0,0 +1,84 @@
+import time
+import asyncio
+from typing import Any
+
+
+# ===== Domyślne parametry =====
+DEFAULT_INITIAL_DELAY = 2.0     # [s] startowe oszacowanie gotowości pageToken
+DEFAULT_MIN_DELAY = 0.2         # [s] dolna granica oszacowania
+DEFAULT_PROBE_DELAY = 0.5       # [s] pierwsza przerwa po INVALID_ARGUMENT
+DEFAULT_PROBE_FACTOR = 1.5
+DEFAULT_PROBE_MAX = 3.0         # [s] maks. przerwa między próbami
+DEFAULT_MAX_WAIT = 20.0         # [s] po tym czasie odpuszczamy dalsze strony
+
+
+class PageTokenExpired(Exception):
+    """Token wznowionej paginacji (z dziennika) został odrzucony — wygasł; prostokąt trzeba zacząć od nowa."""
+
+
+def is_token_not_ready(status: int, data: Any) -> bool:
+    """Places API zwraca 400 INVALID_ARGUMENT, gdy pageToken nie jest jeszcze aktywny."""
+    if status != 400:
+        return False
+    if isinstance(data, dict):
+        return (data.get("error") or {}).get("status") == "INVALID_ARGUMENT"
+    return "INVALID_ARGUMENT" in str(data)
+
+
+class PageTokenPacer:
+    """
+    Planuje zapytania o kolejne strony wyników.
+    Zamiast stałego sleep(5) czeka tyle, ile (wg dotychczasowych obserwacji) token potrzebuje,
+    by stać się aktywny, a przy INVALID_ARGUMENT ponawia z krótkim, rosnącym opóźnieniem.
+    Oszacowanie jest wspólne dla wszystkich kategorii w przebiegu (średnia krocząca).
+    Czekanie odbywa się poza slotem RequestSchedulera, więc w tym czasie idą
+    pierwsze strony innych kategorii.
+    """
+
+    def __init__(self,
+                 initial_delay: float = DEFAULT_INITIAL_DELAY,
+                 min_delay: float = DEFAULT_MIN_DELAY,
+                 probe_delay: float = DEFAULT_PROBE_DELAY,
+                 probe_factor: float = DEFAULT_PROBE_FACTOR,
+                 probe_max: float = DEFAULT_PROBE_MAX,
+                 max_wait: float = DEFAULT_MAX_WAIT,
+                 smoothing: float = 0.3):
+        self.estimate = initial_delay
+        self.min_delay = min_delay
+        self.probe_delay = probe_delay
+        self.probe_factor = probe_factor
+        self.probe_max = probe_max
+        self.max_wait = max_wait
+        self.smoothing = smoothing
+        self.probes = 0
+
+    async def wait_ready(self, issued_at: float) -> None:
+        """Czeka do przewidywanej chwili aktywacji tokenu wydanego w `issued_at` (time.monotonic)."""
+        wait = issued_at + self.estimate - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def wait_probe(self, issued_at: float, attempt: int) -> bool:
+        """
+        Przerwa przed kolejną próbą po INVALID_ARGUMENT.
+        Zwraca False, gdy przekroczono max_wait od wydania tokenu (token uznajemy za martwy).
+        """
+        delay = min(self.probe_max, self.probe_delay * (self.probe_factor ** attempt))
+        if time.monotonic() + delay - issued_at > self.max_wait:
+            return False
+        self.probes += 1
+        await asyncio.sleep(delay)
+        return True
+
+    def observe(self, issued_at: float, sent_at: float, not_ready: bool) -> None:
+        """
+        Aktualizuje oszacowanie po udanym zapytaniu wysłanym w `sent_at` (time.monotonic).
+        Mierzy od wydania tokenu do wysłania — czas odpowiedzi nie mówi nic o gotowości tokenu.
+        Jeśli token od razu działał — próbujemy trochę wcześniej (najwyżej od bieżącego oszacowania:
+        wysłanie opóźnione kolejką schedulera mówi tylko, że token był gotowy wcześniej);
+        jeśli trzeba było ponawiać — później.
+        """
+        elapsed = sent_at - issued_at
+        target = elapsed if not_ready else min(elapsed, self.estimate) * 0.8
+        self.estimate = max(self.min_delay,
+                            (1 - self.smoothing) * self.estimate + self.smoothing * target)
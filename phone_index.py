@@ -0,0 +1,209 @@
+import os
+import time
+import sqlite3
+import zipfile
+from xml.etree import ElementTree
+from typing import Callable, Iterable, List, Optional, Set
+
+import logger_util
+from normalization import canonical_phone, website_domains
+
+
+SCHEMA_VERSION = "3"  # 2: numery w postaci E.164 (normalization.canonical_phone); 3: place ID z numerem firmy
+PHONE_HEADER = "Numer Telefonu"
+_CHUNK = 500  # limit parametrów w zapytaniu IN (...)
+SKIPPED_TTL_DAYS = 90  # po tylu dniach firma bez telefonu/strony jest sprawdzana ponownie
+
+
+def index_path(workbook_path: str) -> str:
+    return workbook_path + ".index.sqlite"
+
+
+def hyperlink_targets(path: str) -> List[str]:
+    """
+    Adresy zewnętrznych hiperłączy ze wszystkich arkuszy pliku .xlsx (kolumna „Strona WWW” to
+    hiperłącza, których openpyxl w trybie read_only nie wczytuje) — wprost z relacji arkuszy.
+    """
+    targets: List[str] = []
+    with zipfile.ZipFile(path) as z:
+        for name in z.namelist():
+            if not (name.startswith("xl/worksheets/_rels/") and name.endswith(".rels")):
+                continue
+            for rel in ElementTree.fromstring(z.read(name)):
+                if rel.get("Type", "").endswith("/hyperlink") and rel.get("TargetMode") == "External":
+                    targets.append(rel.get("Target", ""))
+    return targets
+
+
+class PhoneIndex:
+    """
+    Indeks obok pliku Excela (<plik>.index.sqlite): numery (E.164), place ID i domeny stron
+    wszystkich zapisanych firm. Zastępuje wczytywanie całego skoroszytu przy każdym zapisie.
+    Indeks pamięta rozmiar i mtime skoroszytu z chwili ostatniego zapisu — jeśli plik
+    zmieniono poza aplikacją, numery i domeny są odbudowywane ze skoroszytu, a place ID
+    (których skoroszyt nie zawiera) zostają tylko dla numerów nadal obecnych w pliku.
+    """
+
+    def __init__(self, workbook_path: str, sources: Optional[Callable[[], List[str]]] = None):
+        # sources: pliki .xlsx do odbudowy (np. części shardów); domyślnie sam workbook_path
+        self.workbook_path = workbook_path
+        self.sources = sources
+        self.path = index_path(workbook_path)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS phones (norm TEXT PRIMARY KEY) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS place_ids (id TEXT PRIMARY KEY, norm TEXT) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS domains (domain TEXT PRIMARY KEY) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS skipped_ids (id TEXT PRIMARY KEY, ts INTEGER) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+        )
+        if "norm" not in {r[1] for r in self._conn.execute("PRAGMA table_info(place_ids)")}:
+            # indeks sprzed wersji 3 — ID bez numeru zostają przy odbudowie bez zmian
+            self._conn.execute("ALTER TABLE place_ids ADD COLUMN norm TEXT")
+        self._conn.commit()
+
+    # ----- meta -----
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, value))
+
+    def _workbook_stamp(self) -> str:
+        if not os.path.exists(self.workbook_path):
+            return "missing"
+        st = os.stat(self.workbook_path)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    def is_fresh(self) -> bool:
+        return (self._meta("schema") == SCHEMA_VERSION
+                and self._meta("workbook") == self._workbook_stamp())
+
+    def ensure_fresh(self) -> None:
+        if not self.is_fresh():
+            self.rebuild_from_workbook()
+
+    # ----- odbudowa -----
+    def rebuild_from_workbook(self) -> int:
+        """
+        Odtwarza numery ze wszystkich arkuszy (tryb read_only openpyxl) i domeny z hiperłączy
+        kolumny „Strona WWW”. Place ID nie ma w skoroszycie — zostają te, których numer nadal
+        jest w pliku (firmy usunięte ze skoroszytu znikają też z indeksu).
+        Zwraca liczbę numerów w indeksie.
+        """
+        norms: Set[str] = set()
+        domains: Set[str] = set()
+        paths = self.sources() if self.sources else [self.workbook_path]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            from openpyxl import load_workbook
+            logger_util.log_info(f"🔁 Odbudowa indeksu numerów z {path}")
+            book = load_workbook(path, read_only=True)
+            try:
+                for ws in book.worksheets:
+                    rows = ws.iter_rows(values_only=True)
+                    header = next(rows, None)
+                    if not header or PHONE_HEADER not in header:
+                        continue
+                    col = header.index(PHONE_HEADER)
+                    for row in rows:
+                        if col < len(row) and row[col] is not None:
+                            n = canonical_phone(row[col])
+                            if n:
+                                norms.add(n)
+            finally:
+                book.close()
+            try:
+                domains.update(d for d in website_domains(hyperlink_targets(path)) if d)
+            except (zipfile.BadZipFile, ElementTree.ParseError) as e:
+                logger_util.log_warning(f"⚠ Nie udało się odczytać hiperłączy z {path}: {e}")
+
+        with self._conn:
+            self._conn.execute("DELETE FROM phones")
+            self._conn.executemany("INSERT OR IGNORE INTO phones(norm) VALUES (?)", ((n,) for n in norms))
+            self._conn.execute("DELETE FROM domains")
+            self._conn.executemany("INSERT OR IGNORE INTO domains(domain) VALUES (?)", ((d,) for d in domains))
+            dropped = self._conn.execute(
+                "DELETE FROM place_ids WHERE norm IS NOT NULL AND norm NOT IN (SELECT norm FROM phones)").rowcount
+            legacy = self._conn.execute("SELECT COUNT(*) FROM place_ids WHERE norm IS NULL").fetchone()[0]
+            self._set_meta("schema", SCHEMA_VERSION)
+            self._set_meta("workbook", self._workbook_stamp())
+        if dropped:
+            logger_util.log_info(f"🔁 Usunięto z indeksu {dropped} place ID firm, których nie ma już w skoroszycie")
+        if legacy:
+            logger_util.log_warning(f"⚠ {legacy} place ID bez numeru (indeks sprzed wersji {SCHEMA_VERSION}) "
+                                    f"zostaje w indeksie — usuń {self.path}, aby je wyczyścić")
+        return len(norms)
+
+    # ----- zapytania -----
+    def _known(self, table: str, column: str, values: Iterable[str], where: str = "",
+               params: tuple = ()) -> Set[str]:
+        values = list({v for v in values if v})
+        found: Set[str] = set()
+        for i in range(0, len(values), _CHUNK):
+            chunk = values[i:i + _CHUNK]
+            q = f"SELECT {column} FROM {table} WHERE {column} IN ({','.join('?' * len(chunk))}){where}"
+            found.update(r[0] for r in self._conn.execute(q, chunk + list(params)))
+        return found
+
+    def known_phones(self, norms: Iterable[str]) -> Set[str]:
+        return self._known("phones", "norm", norms)
+
+    def known_place_ids(self, place_ids: Iterable[str]) -> Set[str]:
+        return self._known("place_ids", "id", place_ids)
+
+    def known_domains(self, domains: Iterable[str]) -> Set[str]:
+        return self._known("domains", "domain", domains)
+
+    def known_or_skipped(self, place_ids: Iterable[str]) -> Set[str]:
+        """Place ID zapisanych firm oraz niedawno odrzuconych (bez telefonu/strony) — do pobierania dwufazowego."""
+        place_ids = list(place_ids)
+        cutoff = int(time.time()) - SKIPPED_TTL_DAYS * 86400
+        return self.known_place_ids(place_ids) | self._known("skipped_ids", "id", place_ids, " AND ts >= ?", (cutoff,))
+
+    def record_skipped(self, place_ids: Iterable[str]) -> None:
+        """Firmy odrzucone przez filtr (brak telefonu lub strony) — nie zmienia znacznika skoroszytu."""
+        now = int(time.time())
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO skipped_ids(id, ts) VALUES (?, ?)",
+                                   ((p, now) for p in place_ids if p))
+
+    def record(self, norms: Iterable[str], place_ids: Iterable[str] = (), domains: Iterable[str] = ()) -> None:
+        """
+        Dopisuje numery/ID po udanym zapisie skoroszytu — w jednej transakcji razem
+        z nowym znacznikiem pliku (przy błędzie indeks zostaje nieaktualny i zostanie odbudowany).
+        place_ids — równoległe do norms (place ID zapamiętuje numer swojej firmy na potrzeby odbudowy).
+        """
+        norms = list(norms)
+        with self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO phones(norm) VALUES (?)",
+                                   ((n,) for n in norms if n))
+            self._conn.executemany("INSERT OR IGNORE INTO place_ids(id, norm) VALUES (?, ?)",
+                                   ((p, n or None) for p, n in zip(place_ids, norms) if p))
+            self._conn.executemany("INSERT OR IGNORE INTO domains(domain) VALUES (?)",
+                                   ((d,) for d in domains if d))
+            self._set_meta("schema", SCHEMA_VERSION)
+            self._set_meta("workbook", self._workbook_stamp())
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Indeks numerów telefonów dla pliku Excela")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_rebuild = sub.add_parser("rebuild", help="Odbuduj indeks ze skoroszytu (lub katalogu shardów)")
+    p_rebuild.add_argument("workbook", nargs="?", default="firmy.xlsx")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.workbook):
+        from excel_saver import shard_index
+        idx = shard_index(args.workbook)
+    else:
+        idx = PhoneIndex(args.workbook)
+    print(f"Zindeksowano {idx.rebuild_from_workbook()} numerów → {idx.path}")
+    idx.close()
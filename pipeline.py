@@ -0,0 +1,279 @@
+import time
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, TypeVar
+
+import logger_util
+from metrics import RunMetrics, maybe_span
+from normalization import row_keys
+from sinks import CityKey, Sink, write_grouped
+
+
+DEFAULT_QUEUE_SIZE = 256        # ile stron może czekać na dedup (backpressure dla pobierania)
+DEFAULT_FLUSH_ROWS = 1000       # zapis po tylu nowych (unikalnych) rekordach...
+DEFAULT_FLUSH_SECONDS = 60.0    # ...albo po tylu sekundach od poprzedniego zapisu
+
+T = TypeVar("T")
+
+# Jeden wątek zapisu dla całego procesu: zapis (wczytanie skoroszytu, dedup z historią, save)
+# nie blokuje pętli zdarzeń, a wyjścia nigdy nie są zapisywane równolegle — także gdy
+# przebieg kolejnego miasta startuje, zanim skończy się zapis poprzedniego.
+SAVE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="save")
+
+# zdarzenia zapisu dla save_cb: ("start", liczba_rekordów_we_wsadzie), ("done", dopisane)
+SaveCallback = Callable[[str, int], None]
+
+
+def dedup_places(places_data: Iterable[List[str]], seen: Optional[set] = None) -> List[List[str]]:
+    """
+    Dedup po telefonie (E.164), place ID i domenie strony: rekord, który dzieli którykolwiek
+    klucz z wcześniejszym, jest pomijany, a jego klucze dołączają do tej samej firmy.
+    Przekazany `seen` jest uzupełniany — pozwala deduplikować przyrostowo (strona po stronie,
+    miasto po mieście) w jednym przebiegu.
+    """
+    seen = set() if seen is None else seen
+    deduped: List[List[str]] = []
+    for row in places_data:
+        keys = row_keys(row[4], row[5] if len(row) > 5 else None, row[1])
+        duplicate = any(k in seen for k in keys)
+        seen.update(keys)
+        if not duplicate:
+            deduped.append(list(row))
+    return deduped
+
+
+class TermYield:
+    """
+    Wydajność krańcowa fraz (dla term_planner): dla każdej (miasto i promień, fraza) — ile firm znalazła
+    i ile z nich nie znalazła żadna fraza wyżej w kolejności planu (marginal — tyle by ubyło
+    bez tej frazy). Firma znaleziona przez kilka fraz liczy się tylko najwyższej z nich,
+    niezależnie od tego, która z równolegle pobieranych fraz dotarła do niej pierwsza.
+    Frazy spoza kolejności (set_order) są za wszystkimi, między sobą — w kolejności stron.
+    """
+
+    def __init__(self):
+        self.found: Dict[Tuple[CityKey, str], int] = {}
+        self.marginal: Dict[Tuple[CityKey, str], int] = {}
+        self._order: Dict[CityKey, Dict[str, int]] = {}
+        self._owners: Dict[Tuple[CityKey, str], List[str]] = {}  # (miasto, klucz firmy) -> [fraza]
+
+    def set_order(self, city: CityKey, terms: Sequence[str]) -> None:
+        self._order[city] = {t: i for i, t in enumerate(terms)}
+
+    def add(self, city: CityKey, rows: Iterable[List[str]]) -> None:
+        order = self._order.get(city, {})
+        last = len(order)
+        for row in rows:
+            term = row[0]
+            self.found[(city, term)] = self.found.get((city, term), 0) + 1
+            keys = row_keys(row[4], row[5] if len(row) > 5 else None, row[1])
+            owner = next((self._owners[(city, k)] for k in keys if (city, k) in self._owners), None)
+            if owner is None:
+                owner = [term]
+                self.marginal[(city, term)] = self.marginal.get((city, term), 0) + 1
+            elif order.get(term, last) < order.get(owner[0], last):
+                # ta sama firma z frazy wyżej w kolejności — przejmuje ją
+                self.marginal[(city, owner[0])] -= 1
+                self.marginal[(city, term)] = self.marginal.get((city, term), 0) + 1
+                owner[0] = term
+            for k in keys:
+                self._owners.setdefault((city, k), owner)
+
+    def for_city(self, city: CityKey) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """(znalezione, krańcowe) wg frazy dla (miasta, promienia)."""
+        return ({t: n for (c, t), n in self.found.items() if c == city},
+                {t: n for (c, t), n in self.marginal.items() if c == city})
+
+
+class BatchWriter:
+    """
+    Bufor nowych rekordów (osobno dla każdego miasta i promienia) zapisywany do wyjść partiami:
+    po flush_rows rekordach albo flush_seconds od poprzedniego zapisu.
+    Zapis idzie w wątku SAVE_EXECUTOR; w tym czasie pobieranie i dedup trwają dalej, a rekordy
+    zbierają się do następnego wsadu (naraz w toku jest co najwyżej jeden zapis).
+    save_cb — zdarzenia zapisu wywoływane w wątku pętli zdarzeń (bezpieczne dla GUI).
+    failed_cities — (miasto, promień) z rekordami, których nie udało się zapisać do któregoś wyjścia (np. plik
+    otwarty w Excelu): ich stan w dzienniku trzeba zachować do wznowienia.
+    """
+
+    def __init__(self, sinks: Sequence[Sink],
+                 flush_rows: int = DEFAULT_FLUSH_ROWS,
+                 flush_seconds: float = DEFAULT_FLUSH_SECONDS,
+                 metrics: Optional[RunMetrics] = None,
+                 save_cb: Optional[SaveCallback] = None,
+                 executor: Optional[Executor] = None):
+        self.sinks = sinks
+        self.metrics = metrics
+        self.save_cb = save_cb
+        self.executor = executor or SAVE_EXECUTOR
+        self.flush_rows = max(1, flush_rows)
+        self.flush_seconds = flush_seconds
+        self.added = 0
+        self.flushes = 0
+        self._buffer: Dict[CityKey, List[List[str]]] = {}
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._inflight: Optional[asyncio.Future] = None
+        self._inflight_cities: List[CityKey] = []
+        self.failed_cities: Set[CityKey] = set()
+
+    def add(self, city: CityKey, rows: List[List[str]]) -> None:
+        if rows:
+            self._buffer.setdefault(city, []).extend(rows)
+            self._pending += len(rows)
+
+    def due(self) -> bool:
+        return self._pending >= self.flush_rows or (
+            self._pending > 0 and time.monotonic() - self._last_flush >= self.flush_seconds)
+
+    def saving(self) -> bool:
+        return self._inflight is not None and not self._inflight.done()
+
+    def time_to_flush(self) -> Optional[float]:
+        """Sekundy do zapisu wymuszonego czasem (None — bufor pusty, nie ma na co czekać)."""
+        if not self._pending:
+            return None
+        remaining = max(0.0, self._last_flush + self.flush_seconds - time.monotonic())
+        # zapis w toku — sprawdzamy ponownie za chwilę zamiast kręcić się w pętli
+        return max(0.1, remaining) if self.saving() else remaining
+
+    def _notify(self, event: str, count: int) -> None:
+        if self.save_cb is not None:
+            try:
+                self.save_cb(event, count)
+            except Exception as e:
+                logger_util.log_warning(f"⚠ Błąd save_cb: {e}")
+
+    def _write(self, buffer: Dict[CityKey, List[List[str]]]) -> Tuple[int, Set[CityKey]]:
+        # wątek zapisu
+        failed: Set[CityKey] = set()
+        with maybe_span(self.metrics, "save"):
+            return write_grouped(self.sinks, buffer, self.metrics, failed), failed
+
+    async def _finish_inflight(self) -> None:
+        inflight, self._inflight = self._inflight, None
+        try:
+            added, failed = await inflight
+        except Exception as e:
+            logger_util.log_error(f"❌ Błąd zapisu wsadu: {e}")
+            added, failed = 0, set(self._inflight_cities)
+        self.failed_cities |= failed
+        self.added += added
+        self.flushes += 1
+        self._notify("done", added)
+
+    async def flush(self, wait: bool = False) -> None:
+        """
+        Przekazuje bufor do wątku zapisu. Gdy poprzedni zapis jeszcze trwa: wait=False — wraca
+        od razu (rekordy trafią do następnego, większego wsadu), wait=True — czeka na niego.
+        """
+        if self._inflight is not None:
+            if not self._inflight.done() and not wait:
+                return
+            await self._finish_inflight()
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        buffer, self._buffer, count, self._pending = self._buffer, {}, self._pending, 0
+        self._inflight_cities = [city for city, rows in buffer.items() if rows]
+        self._notify("start", count)
+        self._inflight = asyncio.get_running_loop().run_in_executor(self.executor, self._write, buffer)
+
+    async def drain(self) -> None:
+        """Zapisuje wszystko, co zostało w buforze, i czeka na koniec zapisu."""
+        await self.flush(wait=True)
+        if self._inflight is not None:
+            await self._finish_inflight()
+
+
+class Pipeline:
+    """
+    Strumień pobieranie → dedup → zapis. Producenci (zapytania) wkładają strony wyników
+    przez put(); jeden konsument deduplikuje je przyrostowo i oddaje do BatchWriter.
+    Kolejka jest ograniczona, więc przy wolnym zapisie pobieranie zwalnia zamiast gromadzić
+    wszystkie wyniki w pamięci. Po zakończeniu (także po błędzie) bufor jest zapisywany.
+    metrics — czasy dedup i zapisu (RunMetrics); save_cb — zdarzenia zapisu (patrz BatchWriter).
+    term_yield=True — liczy wydajność krańcową fraz (TermYield) dla planera fraz.
+    """
+
+    def __init__(self, sinks: Sequence[Sink],
+                 seen: Optional[set] = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 flush_rows: int = DEFAULT_FLUSH_ROWS,
+                 flush_seconds: float = DEFAULT_FLUSH_SECONDS,
+                 metrics: Optional[RunMetrics] = None,
+                 save_cb: Optional[SaveCallback] = None,
+                 term_yield: bool = False):
+        self.seen = set() if seen is None else seen
+        self.metrics = metrics
+        self.writer = BatchWriter(sinks, flush_rows, flush_seconds, metrics, save_cb)
+        self.total = 0
+        self.unique = 0
+        # wg (miasto, promień_m) — to samo miasto z innym promieniem liczy się osobno
+        self.city_totals: Dict[CityKey, int] = {}
+        self.city_unique: Dict[CityKey, int] = {}
+        self.term_yield = TermYield() if term_yield else None
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self._consumer: Optional[asyncio.Task] = None
+
+    @property
+    def added(self) -> int:
+        return self.writer.added
+
+    @property
+    def failed_cities(self) -> Set[CityKey]:
+        """(Miasto, promień) z nieudanym zapisem (patrz BatchWriter.failed_cities)."""
+        return self.writer.failed_cities
+
+    async def put(self, city: str, radius_m: int, rows: List[List[str]]) -> None:
+        """Strona wyników od producenta; czeka, gdy kolejka jest pełna."""
+        if self._consumer is not None and self._consumer.done():
+            self._consumer.result()  # konsument padł — przekaż błąd producentowi
+            raise RuntimeError("Pipeline został już zamknięty")
+        self.total += len(rows)
+        key = (city, radius_m)
+        self.city_totals[key] = self.city_totals.get(key, 0) + len(rows)
+        await self._queue.put((key, rows))
+
+    async def _consume(self) -> None:
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), self.writer.time_to_flush())
+                except asyncio.TimeoutError:
+                    await self.writer.flush()
+                    continue
+                if item is None:
+                    break
+                key, rows = item
+                with maybe_span(self.metrics, "dedup"):
+                    new_rows = dedup_places(rows, self.seen)
+                self.unique += len(new_rows)
+                self.city_unique[key] = self.city_unique.get(key, 0) + len(new_rows)
+                if self.term_yield is not None:
+                    self.term_yield.add(key, rows)
+                self.writer.add(key, new_rows)
+                if self.writer.due():
+                    await self.writer.flush()
+        finally:
+            try:
+                await self.writer.drain()
+            except Exception as e:
+                logger_util.log_error(f"❌ Błąd końcowego zapisu: {e}")
+                self.writer.failed_cities.update(self.city_totals)  # nie wiadomo, co zdążyło się zapisać
+
+    async def run(self, producer: Awaitable[T], on_produced: Optional[Callable[[], None]] = None) -> T:
+        """
+        Uruchamia konsumenta, czeka na producenta i domyka strumień (końcowy zapis bufora).
+        on_produced — wywoływane po zakończeniu pobierania, przed oczekiwaniem na ostatni zapis.
+        """
+        self._consumer = asyncio.create_task(self._consume())
+        try:
+            result = await producer
+            if on_produced is not None:
+                on_produced()
+            return result
+        finally:
+            if not self._consumer.done():
+                await self._queue.put(None)
+            await self._consumer
@@ -0,0 +1,98 @@
+import asyncio
+import aiohttp
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+import logger_util
+from progress import ProgressTracker, DETAILS
+from request_scheduler import RequestScheduler
+from response_cache import ResponseCache, details_cache_key
+
+
+PLACE_DETAILS_URL = "https://places.googleapis.com/v1/places/{place_id}"
+# faza 1: sam identyfikator (najtańsza jednostka rozliczeniowa, kilkadziesiąt bajtów na firmę)
+PLACES_ID_FIELD_MASK = "places.id,nextPageToken"
+# faza 2: pełne dane tylko dla nieznanych firm
+DETAILS_FIELD_MASK = "id,displayName,formattedAddress,googleMapsUri,internationalPhoneNumber,websiteUri"
+DEFAULT_DETAILS_CONCURRENCY = 4
+
+
+class PlaceDetailsFetcher:
+    """
+    Druga faza pobierania dwufazowego: dla ID z wyszukiwania (maska places.id) pobiera
+    Place Details wyłącznie dla firm spoza magazynu (known) i jeszcze niepobranych w tym przebiegu.
+    Równoległość ograniczona semaforem (oprócz limitów schedulera).
+    Firmy bez telefonu lub strony trafiają do `skipped` — zapisane w indeksie nie będą pobierane ponownie.
+    progress — każde zapytanie Place Details jest planowane po odfiltrowaniu znanych ID.
+    cache — odpowiedzi Place Details z cache odpowiedzi; w trybie replay brak wpisu oznacza
+    pominięcie firmy (bez zapytania sieciowego).
+    """
+
+    def __init__(self, session: aiohttp.ClientSession,
+                 api_key: str,
+                 scheduler: RequestScheduler,
+                 known: Optional[Callable[[List[str]], Set[str]]] = None,
+                 concurrency: int = DEFAULT_DETAILS_CONCURRENCY,
+                 log_cb: Optional[Callable[[str], None]] = None,
+                 progress: Optional[ProgressTracker] = None,
+                 cache: Optional[ResponseCache] = None):
+        self.session = session
+        self.api_key = api_key
+        self.scheduler = scheduler
+        self.known = known
+        self.log_cb = log_cb
+        self.progress = progress
+        self.cache = cache
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._requested: Set[str] = set()
+        self.skipped: List[str] = []
+        self.fetched = 0
+        self.known_hits = 0
+
+    async def _one(self, place_id: str) -> Optional[Dict[str, Any]]:
+        key = details_cache_key(place_id, DETAILS_FIELD_MASK) if self.cache is not None else None
+        data = self.cache.get(key) if self.cache is not None else None
+        if data is not None or (self.cache is not None and self.cache.replay):
+            if self.progress is not None:
+                self.progress.done(DETAILS)
+            if data is None:
+                (self.log_cb or logger_util.log_warning)(f"⚠ Tryb replay: brak Place Details w cache [{place_id}]")
+                return None
+            return self._accept(place_id, data)
+        headers = {"X-Goog-Api-Key": self.api_key, "X-Goog-FieldMask": DETAILS_FIELD_MASK}
+        try:
+            async with self._slots:
+                status, content_type, data = await self.scheduler.request(
+                    self.session, "GET", PLACE_DETAILS_URL.format(place_id=place_id), label="details",
+                    headers=headers
+                )
+        except Exception as e:
+            (self.log_cb or logger_util.log_error)(f"❌ Wyjątek Place Details [{place_id}]: {e}")
+            return None
+        finally:
+            if self.progress is not None:
+                self.progress.done(DETAILS)
+        if status != 200 or content_type != "application/json":
+            (self.log_cb or logger_util.log_error)(f"❌ Błąd Place Details [{place_id}] ({status}): {data}")
+            return None
+        self.fetched += 1
+        if self.cache is not None:
+            self.cache.put(key, data)
+        return self._accept(place_id, data)
+
+    def _accept(self, place_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        if not data.get("internationalPhoneNumber") or not data.get("websiteUri"):
+            self.skipped.append(place_id)
+        return data
+
+    async def __call__(self, place_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """Pełne dane dla nieznanych ID z jednej strony wyników (kolejność zachowana)."""
+        ids = [p for p in dict.fromkeys(place_ids) if p and p not in self._requested]
+        self._requested.update(ids)
+        if ids and self.known is not None:
+            known = self.known(ids)
+            self.known_hits += len(known)
+            ids = [p for p in ids if p not in known]
+        if self.progress is not None:
+            self.progress.plan(DETAILS, len(ids))
+        places = await asyncio.gather(*(self._one(p) for p in ids))
+        return [p for p in places if p is not None]
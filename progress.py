@@ -0,0 +1,171 @@
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import logger_util
+
+
+# rodzaje zapytań liczonych w postępie
+GEOCODE, PAGE, TILE, DETAILS = "geocode", "page", "tile", "details"
+KINDS = (GEOCODE, PAGE, TILE, DETAILS)
+# kafel to nie zapytanie (jego strony liczą się jako PAGE) — pokazywany tylko informacyjnie
+REQUEST_KINDS = (GEOCODE, PAGE, DETAILS)
+
+RATE_WINDOW_S = 30.0        # przepustowość liczona z ostatnich tylu sekund
+DEFAULT_INTERVAL_S = 0.25   # najczęściej tyle razy na sekundę wywoływany jest callback
+
+
+@dataclass
+class ProgressSnapshot:
+    """Stan postępu przekazywany do callbacku (GUI, tryb wsadowy)."""
+    completed: int                    # wykonane zapytania (geokodowanie, strony, Place Details)
+    planned: int                      # zaplanowane, łącznie z szacunkiem dla nierozpoczętych miast
+    done: Dict[str, int]              # wykonane wg rodzaju (geocode/page/tile/details)
+    pending: Dict[str, int]           # znane, jeszcze niewykonane wg rodzaju
+    cities_done: int
+    cities_total: int
+    places: int                       # firmy z telefonem i stroną (przed dedup)
+    elapsed: float                    # [s]
+    rate: float                       # zapytania/s (okno RATE_WINDOW_S)
+    eta: Optional[float]              # [s]; None — brak danych do oszacowania
+    finished: bool = False
+
+    @property
+    def fraction(self) -> float:
+        if self.finished:
+            return 1.0
+        return min(1.0, self.completed / self.planned) if self.planned else 0.0
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "–"
+    seconds = int(round(seconds))
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}"
+
+
+def format_progress(snap: ProgressSnapshot) -> str:
+    """Jedna linia postępu, np. do logu trybu wsadowego."""
+    cities = f", miasta {snap.cities_done}/{snap.cities_total}" if snap.cities_total > 1 else ""
+    return (f"⏳ {snap.fraction * 100:.0f}% — zapytania {snap.completed}/{snap.planned}{cities}, "
+            f"firmy {snap.places}, {snap.rate:.1f} zap./s, ETA {format_eta(snap.eta)}")
+
+
+class ProgressTracker:
+    """
+    Model postępu oparty na zapytaniach: każde zapytanie jest najpierw planowane (plan),
+    potem odhaczane (done) albo wycofywane (drop — np. przerwana paginacja).
+    Strona z nextPageToken planuje następną, nasycony prostokąt — swoje kafle, a Place Details —
+    po jednym zapytaniu na nieznaną firmę, więc mianownik rośnie razem z wiedzą o obszarze.
+    Dla miast jeszcze nierozpoczętych (expect_cities) doliczana jest średnia liczba zapytań
+    na rozpoczęte miasto. Przepustowość i ETA z okna ostatnich RATE_WINDOW_S sekund.
+    callback dostaje ProgressSnapshot najwyżej co `interval` sekund (oraz zawsze przy finish).
+    """
+
+    def __init__(self, callback: Optional[Callable[[ProgressSnapshot], None]] = None,
+                 interval: float = DEFAULT_INTERVAL_S):
+        self.callback = callback
+        self.interval = interval
+        self.started = time.monotonic()
+        self.planned: Dict[str, int] = dict.fromkeys(KINDS, 0)
+        self.done_: Dict[str, int] = dict.fromkeys(KINDS, 0)
+        self.places = 0
+        self.cities_total = 0
+        self.cities_started = 0
+        self.cities_done = 0
+        self._samples = deque()        # (czas, wykonane zapytania)
+        self._last_emit = 0.0
+        self._finished = False
+
+    # ----- zdarzenia -----
+    def expect_cities(self, count: int) -> None:
+        self.cities_total = max(self.cities_total, count)
+
+    def city_started(self) -> None:
+        self.cities_started += 1
+        self.cities_total = max(self.cities_total, self.cities_started)
+
+    def city_finished(self) -> None:
+        self.cities_done += 1
+        self._emit()
+
+    def plan(self, kind: str, count: int = 1) -> None:
+        if count > 0:
+            self.planned[kind] += count
+            self._emit()
+
+    def drop(self, kind: str, count: int = 1) -> None:
+        self.planned[kind] = max(self.done_[kind], self.planned[kind] - count)
+        self._emit()
+
+    def done(self, kind: str, count: int = 1) -> None:
+        self.done_[kind] += count
+        self.planned[kind] = max(self.planned[kind], self.done_[kind])
+        self._emit()
+
+    def found(self, count: int) -> None:
+        self.places += count
+
+    def finish(self) -> None:
+        self._finished = True
+        self._emit(force=True)
+
+    # ----- stan -----
+    def completed(self) -> int:
+        return sum(self.done_[k] for k in REQUEST_KINDS)
+
+    def _known_planned(self) -> int:
+        return sum(self.planned[k] for k in REQUEST_KINDS)
+
+    def _estimated_planned(self) -> int:
+        unstarted = self.cities_total - self.cities_started
+        if unstarted <= 0:
+            return self._known_planned()
+        per_city = self._known_planned() / max(1, self.cities_started)
+        return self._known_planned() + int(unstarted * per_city)
+
+    def _rate(self, now: float, completed: int) -> float:
+        self._samples.append((now, completed))
+        while len(self._samples) > 2 and now - self._samples[0][0] > RATE_WINDOW_S:
+            self._samples.popleft()
+        t0, c0 = self._samples[0]
+        if now - t0 <= 0:
+            return 0.0
+        return (completed - c0) / (now - t0)
+
+    def snapshot(self) -> ProgressSnapshot:
+        now = time.monotonic()
+        completed = self.completed()
+        planned = max(completed, self._estimated_planned())
+        rate = self._rate(now, completed)
+        remaining = planned - completed
+        eta = 0.0 if self._finished else (remaining / rate if rate > 0 else None)
+        return ProgressSnapshot(
+            completed=completed,
+            planned=planned,
+            done=dict(self.done_),
+            pending={k: self.planned[k] - self.done_[k] for k in KINDS},
+            cities_done=self.cities_done,
+            cities_total=self.cities_total,
+            places=self.places,
+            elapsed=now - self.started,
+            rate=rate,
+            eta=eta,
+            finished=self._finished,
+        )
+
+    def _emit(self, force: bool = False) -> None:
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_emit < self.interval:
+            return
+        self._last_emit = now
+        try:
+            self.callback(self.snapshot())
+        except Exception as e:
+            # błąd widoku postępu nie może przerwać pobierania
+            logger_util.log_warning(f"⚠ Błąd callbacku postępu: {e}")
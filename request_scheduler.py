@@ -0,0 +1,239 @@
+import time
+import random
+import asyncio
+import aiohttp
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+import logger_util
+from metrics import RunMetrics
+from run_control import RunControl
+
+if TYPE_CHECKING:
+    from key_pool import KeyPool
+
+
+# ===== Domyślne limity =====
+DEFAULT_MAX_CONCURRENCY = 8     # maks. równoległych zapytań HTTP
+DEFAULT_QPS = 10.0              # średnia liczba zapytań na sekundę
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 1.0      # [s] pierwsze opóźnienie po 429/5xx
+DEFAULT_BACKOFF_MAX = 60.0      # [s] górny limit pojedynczego opóźnienia
+
+RETRY_STATUSES = frozenset({429, 502, 503})
+KEY_FAILOVER_STATUSES = frozenset({403, 429})
+# Geocoding API zgłasza limity w treści odpowiedzi (HTTP 200)
+_BODY_KEY_STATUSES = {"OVER_QUERY_LIMIT": 429, "OVER_DAILY_LIMIT": 403, "REQUEST_DENIED": 403}
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parsuje nagłówek Retry-After (sekundy albo data HTTP). Zwraca None, gdy brak/niepoprawny."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _key_status(status: int, body: Any) -> int:
+    """Status z punktu widzenia klucza API: 403/429 także, gdy API podaje je tylko w treści."""
+    if status == 200 and isinstance(body, dict):
+        return _BODY_KEY_STATUSES.get(body.get("status"), status)
+    return status
+
+
+def _with_key(kwargs: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """Podmienia klucz w nagłówku X-Goog-Api-Key (Places) lub parametrze key (Geocoding)."""
+    kwargs = dict(kwargs)
+    headers = kwargs.get("headers")
+    if headers and "X-Goog-Api-Key" in headers:
+        kwargs["headers"] = {**headers, "X-Goog-Api-Key": key}
+    params = kwargs.get("params")
+    if params and "key" in params:
+        kwargs["params"] = {**params, "key": key}
+    return kwargs
+
+
+class TokenBucket:
+    """Kubełek żetonów: średnio `rate` zapytań/s, chwilowo do `capacity` naraz."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        # Lock zapewnia kolejność FIFO — czekający nie wyprzedzają się nawzajem
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    def ready(self) -> bool:
+        """Czy jest wolny żeton (bez pobierania go)."""
+        self._refill()
+        return self._tokens >= 1.0
+
+    def drain(self) -> None:
+        """Opróżnia kubełek (po 429 — nie wysyłamy od razu całej serii)."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+
+
+class RequestScheduler:
+    """
+    Wspólny harmonogram zapytań HTTP: limit równoległości, limit QPS (token bucket)
+    oraz ponawianie 429/502/503 z wykładniczym opóźnieniem, jitterem i obsługą Retry-After.
+    control — pauza/przerwanie przebiegu (RunControl): sprawdzane przed każdym wysłaniem zapytania.
+    keys — pula kluczy API (KeyPool): każde zapytanie dostaje klucz z największym zapasem, limit QPS
+    liczony jest na klucz (qps schedulera nie obowiązuje), a 403/429 przełącza zapytanie na inny klucz
+    bez wstrzymywania pozostałych. Gdy żaden klucz nie ma już limitu, przebieg jest przerywany (control).
+    """
+
+    def __init__(self,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 qps: float = DEFAULT_QPS,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE,
+                 backoff_max: float = DEFAULT_BACKOFF_MAX,
+                 metrics: Optional[RunMetrics] = None,
+                 control: Optional[RunControl] = None,
+                 keys: Optional["KeyPool"] = None):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._bucket = TokenBucket(qps) if qps and qps > 0 and keys is None else None
+        # globalna pauza po 429 — wszystkie zadania czekają do tego momentu
+        self._paused_until = 0.0
+        self.requests_sent = 0
+        self.retries = 0
+        # pomiary przebiegu (czasy zapytań wg etykiety, ponowienia, statusy)
+        self.metrics = metrics
+        self.control = control
+        self.keys = keys
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        # "full jitter": losowo z [0, base * 2^attempt], nie mniej niż Retry-After
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    async def _wait_for_slot(self) -> None:
+        if self.control is not None:
+            await self.control.checkpoint()
+        while True:
+            wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        if self._bucket:
+            await self._bucket.acquire()
+
+    async def _acquire_key(self):
+        from key_pool import KeyPoolExhausted
+        try:
+            return await self.keys.acquire()
+        except KeyPoolExhausted as e:
+            if self.control is None:
+                raise
+            if not self.control.cancelled:
+                logger_util.log_error(f"⛔ {e} — przerywam przebieg (pobrane wyniki zostaną zapisane)")
+                self.control.cancel()
+            raise asyncio.CancelledError()
+
+    async def request(self, session: aiohttp.ClientSession, method: str, url: str,
+                      label: str = "http", on_sent: Optional[Callable[[float], None]] = None,
+                      **kwargs: Any) -> Tuple[int, str, Any]:
+        """
+        Wysyła zapytanie z limitami i ponowieniami.
+        Zwraca (status, content_type, treść) — treść to dict dla JSON, w przeciwnym razie tekst.
+        label — nazwa operacji w pomiarach (np. "geocode", "search", "details").
+        on_sent — wywoływane z time.monotonic() w chwili faktycznego wysłania (po czekaniu na limit
+        i slot; przy ponowieniach — każdej próby), np. do pomiaru gotowości pageToken bez kolejki i opóźnienia sieci.
+        Wyjątki sieciowe (aiohttp.ClientError, timeout) przepuszcza do wywołującego.
+        """
+        attempt = 0
+        while True:
+            await self._wait_for_slot()
+            key = await self._acquire_key() if self.keys is not None else None
+            send_kwargs = _with_key(kwargs, key.key) if key is not None else kwargs
+            sent = False
+            try:
+                async with self._semaphore:
+                    if self.control is not None:
+                        # pauza/przerwanie mogły przyjść w trakcie czekania na limit lub slot
+                        await self.control.checkpoint()
+                    if key is not None and not self.keys.available(key):
+                        # w trakcie czekania na slot klucz dostał 403/429 — wybór klucza od nowa
+                        self.keys.release(key)
+                        continue
+                    self.requests_sent += 1
+                    started = time.perf_counter()
+                    sent = True
+                    if on_sent is not None:
+                        on_sent(time.monotonic())
+                    async with session.request(method, url, **send_kwargs) as response:
+                        status = response.status
+                        content_type = response.content_type
+                        if content_type == "application/json":
+                            body = await response.json()
+                        else:
+                            body = await response.text()
+                        retry_after = _retry_after_seconds(response.headers.get("Retry-After"))
+            except BaseException as e:
+                # przerwanie (checkpoint, anulowanie) albo błąd połączenia, zanim zapytanie wyszło —
+                # przydział klucza wraca do puli, inaczej przepadałby z dziennego limitu
+                if key is not None and (not sent or isinstance(e, aiohttp.ClientConnectorError)):
+                    self.keys.release(key)
+                raise
+            if self.metrics is not None:
+                self.metrics.observe(label, time.perf_counter() - started)
+                self.metrics.incr("requests")
+                if status >= 400:
+                    self.metrics.incr(f"http_{status}")
+
+            key_status = _key_status(status, body) if key is not None else status
+            if key is not None and self.keys.report(key, key_status, retry_after):
+                # 403/429 tego klucza — od razu innym kluczem (429 liczy się do limitu ponowień)
+                if self.metrics is not None:
+                    self.metrics.incr("key_failovers")
+                if key_status != 429 or attempt < self.max_retries:
+                    attempt += key_status == 429
+                    continue
+
+            if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                return status, content_type, body
+
+            delay = self._backoff(attempt, retry_after)
+            attempt += 1
+            self.retries += 1
+            if self.metrics is not None:
+                self.metrics.incr("retries")
+            if status == 429:
+                # przekroczony limit — wstrzymaj wszystkich, nie tylko to zadanie
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                if self._bucket:
+                    self._bucket.drain()
+            logger_util.log_warning(
+                f"⏳ {status} dla {url} — ponowienie {attempt}/{self.max_retries} za {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
@@ -0,0 +1,122 @@
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Any, Dict, Optional
+
+import logger_util
+
+
+DEFAULT_CACHE_FILE = "places_cache.sqlite"
+DEFAULT_TTL_SECONDS = 6 * 3600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def cache_key(params: Dict[str, Any], field_mask: str) -> str:
+    """
+    Adres treści: sha256 z (textQuery, rectangle, pageToken, field mask).
+    Współrzędne zaokrąglamy, żeby drobne różnice float nie psuły trafień. Klucz API nie wchodzi do klucza.
+    """
+    rect = (params.get("locationRestriction") or {}).get("rectangle") or {}
+    rect_norm = {
+        corner: {k: round(float(v), 6) for k, v in sorted((rect.get(corner) or {}).items())}
+        for corner in ("low", "high")
+    }
+    payload = {
+        "textQuery": params.get("textQuery", ""),
+        "rectangle": rect_norm,
+        "pageToken": params.get("pageToken") or "",
+        "fieldMask": ",".join(sorted(f.strip() for f in field_mask.split(","))),
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def details_cache_key(place_id: str, field_mask: str) -> str:
+    """Adres treści odpowiedzi Place Details: sha256 z (place ID, field mask)."""
+    payload = {"placeId": place_id, "fieldMask": ",".join(sorted(f.strip() for f in field_mask.split(",")))}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache odpowiedzi places:searchText (klucz = cache_key) i Place Details (details_cache_key) w SQLite.
+    - ttl_seconds: po tym czasie wpis jest ignorowany (None = bez limitu)
+    - max_bytes: po przekroczeniu usuwane są najdawniej używane wpisy
+    - replay=True: tryb offline — odpowiedzi tylko z cache (bez TTL), brak zapytań sieciowych
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_FILE,
+                 ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 replay: bool = False):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, created REAL NOT NULL, accessed REAL NOT NULL,"
+            " size INTEGER NOT NULL, body TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT created, body FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (not self.replay and self.ttl_seconds is not None
+                           and now - row[0] > self.ttl_seconds):
+            self.misses += 1
+            return None
+        self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self.hits += 1
+        return json.loads(row[1])
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        if self.replay:
+            return
+        body = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        self._total_bytes += len(body) - (old[0] if old else 0)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses(key, created, accessed, size, body) VALUES (?, ?, ?, ?, ?)",
+            (key, now, now, len(body), body)
+        )
+        self._conn.commit()
+        self._evict()
+
+    def _evict(self) -> None:
+        if self._total_bytes <= self.max_bytes:
+            return
+        total = self._total_bytes
+        # usuń najdawniej używane, aż zejdziemy do 90% limitu
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            removed += 1
+        self._conn.commit()
+        self._total_bytes = total
+        logger_util.log_info(f"🧹 Cache odpowiedzi: usunięto {removed} najstarszych wpisów")
+
+    def purge_expired(self) -> int:
+        if self.ttl_seconds is None:
+            return 0
+        cur = self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return cur.rowcount
+
+    def close(self) -> None:
+        self._conn.close()
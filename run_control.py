@@ -0,0 +1,55 @@
+import asyncio
+from typing import Optional, Set
+
+
+class RunControl:
+    """
+    Sterowanie trwającym przebiegiem z zewnątrz (GUI, Ctrl+C w trybie wsadowym).
+    pause() — nowe zapytania czekają w RequestScheduler (checkpoint), zapytania w toku kończą się normalnie.
+    cancel() — przerywa zadania pobierania (attach): zapytania w toku są anulowane, łańcuchy
+    paginacji nie idą dalej, a strony już pobrane przechodzą przez dedup i zapis (Pipeline).
+    Dziennik przebiegu nie jest czyszczony — przerwane miasto można później wznowić.
+    """
+
+    def __init__(self):
+        self._running = asyncio.Event()
+        self._running.set()
+        self._tasks: Set[asyncio.Future] = set()
+        self.cancelled = False
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def attach(self, task: asyncio.Future) -> asyncio.Future:
+        """Zadanie pobierania anulowane przy cancel() (także, gdy cancel() padło wcześniej)."""
+        if self.cancelled:
+            task.cancel()
+        else:
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return task
+
+    def pause(self) -> None:
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self) -> None:
+        self._running.set()
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        self._running.set()  # wstrzymane zadania mają dojść do anulowania
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def checkpoint(self) -> None:
+        """Przed każdym zapytaniem: czeka w pauzie; po cancel() przerywa bieżące zadanie."""
+        if self.paused:
+            await self._running.wait()
+        if self.cancelled:
+            raise asyncio.CancelledError()
+
+
+def is_cancelled(control: Optional[RunControl]) -> bool:
+    return control is not None and control.cancelled
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import logger_util
+
+
+DEFAULT_JOURNAL_FILE = "run_journal.jsonl"
+DEFAULT_MAX_AGE = 15 * 60.0  # [s] starszy stan miasta nie jest wznawiany (tokeny stron wygasają, wyniki się starzeją)
+
+
+def rect_key(bounds: Dict[str, Dict[str, float]]) -> str:
+    """Stały identyfikator prostokąta (kafla) — współrzędne zaokrąglone do ~1 m."""
+    lo, hi = bounds["low"], bounds["high"]
+    return (f"{lo['latitude']:.5f},{lo['longitude']:.5f},"
+            f"{hi['latitude']:.5f},{hi['longitude']:.5f}")
+
+
+class PageRecord:
+    """Jedna ukończona strona: numer, wiersze, liczba wszystkich wyników, token następnej strony i czas zapisu."""
+    __slots__ = ("page", "rows", "raw", "next_token", "ts")
+
+    def __init__(self, page: int, rows: List[List[str]], raw: int, next_token: Optional[str], ts: float = 0.0):
+        self.page = page
+        self.rows = rows
+        self.raw = raw
+        self.next_token = next_token
+        self.ts = ts
+
+
+class RunJournal:
+    """
+    Dziennik przebiegu (JSON Lines, tylko dopisywanie): każda ukończona strona
+    (miasto, promień, fraza, kafel, numer strony) z wierszami i tokenem następnej strony.
+    Po przerwaniu (awaria, brak sieci, zamknięcie okna) wznowienie pomija ukończone strony
+    i kontynuuje paginację od zapisanego tokenu. Wpisy miasta są usuwane dopiero po zapisaniu
+    jego wyników (discard), więc dziennik zawiera wyłącznie niedokończone przebiegi.
+    Stan miasta, którego ostatnia strona jest starsza niż max_age sekund, jest usuwany zamiast
+    wznawiany (wpisy bez znacznika czasu — z wcześniejszych wersji — też).
+    Uszkodzona ostatnia linia (przerwany zapis) jest pomijana.
+    """
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_FILE, max_age: float = DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        # (miasto, promień, fraza, kafel) -> strony w kolejności
+        self._pages: Dict[Tuple[str, int, str, str], List[PageRecord]] = {}
+        self._file = None
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        bad = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    e = json.loads(line)
+                    key = (e["city"], int(e["radius"]), e["term"], e["rect"])
+                    if e.get("reset"):
+                        # paginacja prostokąta zaczęta od nowa (wygasły token) — poprzednie strony nieaktualne
+                        self._pages[key] = []
+                        continue
+                    record = PageRecord(int(e["page"]), e["rows"], int(e["raw"]), e.get("next"),
+                                        float(e.get("ts", 0.0)))
+                except (ValueError, KeyError, TypeError):
+                    bad += 1
+                    continue
+                pages = self._pages.setdefault(key, [])
+                if record.page == len(pages):
+                    pages.append(record)
+        if bad:
+            logger_util.log_warning(f"⚠ Pominięto {bad} uszkodzonych wpisów dziennika {self.path}")
+        self._pages = {k: pages for k, pages in self._pages.items() if pages}
+        self.expire()
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def _rewrite(self) -> None:
+        """Kompaktuje plik do bieżącego stanu (atomowo: plik tymczasowy + os.replace)."""
+        self.close()
+        if not self._pages:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for (city, radius, term, rect), pages in self._pages.items():
+                for r in pages:
+                    f.write(json.dumps({"city": city, "radius": radius, "term": term, "rect": rect,
+                                        "page": r.page, "rows": r.rows, "raw": r.raw, "next": r.next_token,
+                                        "ts": r.ts},
+                                       ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+
+    def _updated(self, city: str, radius_m: int) -> float:
+        """Czas zapisu najnowszej strony miasta (0.0 — brak stanu)."""
+        return max((r.ts for k, pages in self._pages.items() if k[0] == city and k[1] == radius_m
+                    for r in pages), default=0.0)
+
+    def expire(self, city: Optional[str] = None, radius_m: Optional[int] = None) -> None:
+        """Usuwa stan miast starszy niż max_age (tylko podanego miasta, gdy city/radius_m)."""
+        cutoff = time.time() - self.max_age
+        stale = {(k[0], k[1]) for k in self._pages if city is None or (k[0] == city and k[1] == radius_m)}
+        stale = {c for c in stale if self._updated(*c) < cutoff}
+        for city, radius_m in stale:
+            logger_util.log_info(f"🗑 Dziennik: stan przebiegu {city} ({radius_m // 1000} km) starszy niż "
+                                 f"{self.max_age / 60:.0f} min — nie będzie wznawiany")
+        if stale:
+            self._pages = {k: pages for k, pages in self._pages.items() if (k[0], k[1]) not in stale}
+            self._rewrite()
+
+    # ----- API -----
+    def has_city(self, city: str, radius_m: int) -> bool:
+        """Czy jest aktualny (nie starszy niż max_age) stan miasta do wznowienia."""
+        self.expire(city, radius_m)
+        return any(k[0] == city and k[1] == radius_m for k in self._pages)
+
+    def updated_at(self, city: str, radius_m: int) -> Optional[float]:
+        """Czas (time.time) ostatniej strony zapisanej dla miasta; None — brak stanu."""
+        return self._updated(city, radius_m) or None
+
+    def pages(self, city: str, radius_m: int, term: str, rect: str) -> List[PageRecord]:
+        return self._pages.get((city, radius_m, term, rect), [])
+
+    def record(self, city: str, radius_m: int, term: str, rect: str,
+               rows: List[List[str]], raw: int, next_token: Optional[str]) -> None:
+        pages = self._pages.setdefault((city, radius_m, term, rect), [])
+        record = PageRecord(len(pages), [list(r) for r in rows], raw, next_token, time.time())
+        pages.append(record)
+        self._append({"city": city, "radius": radius_m, "term": term, "rect": rect, "page": record.page,
+                      "rows": record.rows, "raw": raw, "next": next_token, "ts": record.ts})
+
+    def reset(self, city: str, radius_m: int, term: str, rect: str) -> None:
+        """Paginacja prostokąta od pierwszej strony (token z dziennika wygasł)."""
+        self._pages.pop((city, radius_m, term, rect), None)
+        self._append({"city": city, "radius": radius_m, "term": term, "rect": rect, "reset": True,
+                      "ts": time.time()})
+
+    def discard(self, city: str, radius_m: int) -> None:
+        """Usuwa stan miasta (nowy przebieg bez wznawiania albo po zapisaniu wyników)."""
+        keys = [k for k in self._pages if k[0] == city and k[1] == radius_m]
+        if not keys:
+            return
+        for k in keys:
+            del self._pages[k]
+        self._rewrite()
+
+    def for_city(self, city: str, radius_m: int) -> "CityJournal":
+        return CityJournal(self, city, radius_m)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CityJournal:
+    """Widok dziennika dla jednego (miasta, promienia) — przekazywany do crawl_term."""
+
+    def __init__(self, journal: RunJournal, city: str, radius_m: int):
+        self.journal = journal
+        self.city = city
+        self.radius_m = radius_m
+
+    def pages(self, term: str, rect: str) -> List[PageRecord]:
+        return self.journal.pages(self.city, self.radius_m, term, rect)
+
+    def record(self, term: str, rect: str, rows: List[List[str]], raw: int, next_token: Optional[str]) -> None:
+        self.journal.record(self.city, self.radius_m, term, rect, rows, raw, next_token)
+
+    def reset(self, term: str, rect: str) -> None:
+        self.journal.reset(self.city, self.radius_m, term, rect)
@@ -0,0 +1,325 @@
+import os
+import glob
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import pandas as pd
+
+import logger_util
+from excel_saver import save_to_excel, save_sharded, shard_for, shard_index
+from phone_index import PhoneIndex
+from metrics import RunMetrics, maybe_span
+from normalization import canonical_phones
+
+
+# (miasto, promień_m) — jedno zadanie przebiegu; to samo miasto z innym promieniem to osobne zadanie
+CityKey = Tuple[str, int]
+
+# Kolumny wspólne dla wyjść kolumnowych
+COLUMNS = ["term", "website", "name", "address", "phone", "place_id", "phone_norm", "city", "collected_at"]
+
+
+def rows_to_frame(rows: Sequence[Sequence[str]], city: str = "") -> pd.DataFrame:
+    """Wiersze [branża, www, nazwa, adres, telefon, (place_id)] → DataFrame o kolumnach COLUMNS."""
+    df = pd.DataFrame([list(r[:6]) + [""] * (6 - len(r)) for r in rows], columns=COLUMNS[:6])
+    df = df.fillna("").astype(str)
+    df["phone_norm"] = canonical_phones(df["phone"]).to_numpy()
+    df["city"] = city
+    df["collected_at"] = datetime.now().isoformat(timespec="seconds")
+    return df
+
+
+class Sink:
+    """
+    Wyjście dla zdeduplikowanych wsadów.
+    write() zapisuje od razu i zwraca liczbę dopisanych rekordów.
+    per_city=True — przy wielu miastach wsad przychodzi osobno dla każdego miasta (kolumna city).
+    keeps_history=True — wyjście pamięta zapisane firmy (known_place_ids) i może być magazynem
+    znanych ID dla pobierania dwufazowego.
+    """
+    name = "sink"
+    per_city = True
+    keeps_history = False
+
+    def write(self, rows: List[List[str]], city: str = "") -> int:
+        raise NotImplementedError
+
+    def known_place_ids(self, place_ids: List[str]) -> Set[str]:
+        """Place ID firm już zapisanych w tym wyjściu (tylko przy keeps_history)."""
+        return set()
+
+    def close(self) -> None:
+        pass
+
+
+class ExcelSink(Sink):
+    """Dotychczasowy zapis do firmy.xlsx (lub append-only do shardów, gdy shard_by)."""
+    name = "excel"
+    keeps_history = True
+
+    def __init__(self, filename: str = "firmy.xlsx", shard_by: Optional[str] = None):
+        self.filename = filename
+        self.shard_by = shard_by
+        # jeden plik / shard miesięczny — cały batch w jednym zapisie
+        self.per_city = shard_by == "city"
+        self._index: Optional[PhoneIndex] = None
+
+    def write(self, rows: List[List[str]], city: str = "") -> int:
+        if not rows:
+            return 0
+        if self.shard_by:
+            return save_sharded(rows, os.path.splitext(self.filename)[0], shard_for(self.shard_by, city))
+        return save_to_excel(rows, filename=self.filename)
+
+    def index(self) -> PhoneIndex:
+        """Indeks zapisanych firm (place ID) — źródło znanych ID dla pobierania dwufazowego."""
+        if self._index is None:
+            if self.shard_by:
+                directory = os.path.splitext(self.filename)[0]
+                os.makedirs(directory, exist_ok=True)
+                self._index = shard_index(directory)
+            else:
+                self._index = PhoneIndex(self.filename)
+        return self._index
+
+    def known_place_ids(self, place_ids: List[str]) -> Set[str]:
+        # także niedawno odrzucone (bez telefonu/strony) — PhoneIndex.record_skipped
+        return self.index().known_or_skipped(place_ids)
+
+    def close(self) -> None:
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+
+class KeyedSink(Sink):
+    """
+    Wyjście dopisujące (CSV, Parquet) z pamięcią zapisanych kluczy — znormalizowanych numerów
+    i place ID, wczytywanych raz z istniejących danych przy pierwszym użyciu. Firmy już zapisane
+    (kolejny przebieg, wznowienie z dziennika) nie są dopisywane ponownie, a write() zwraca
+    liczbę faktycznie dopisanych — jak ExcelSink i SqliteSink.
+    """
+    keeps_history = True
+
+    def __init__(self):
+        self._phones: Optional[Set[str]] = None
+        self._place_ids: Set[str] = set()
+        # klucze czyta wątek zapisu (write) i pętla zdarzeń (known_place_ids)
+        self._keys_lock = threading.Lock()
+
+    def _read_keys(self) -> pd.DataFrame:
+        """Kolumny phone_norm i place_id z dotychczas zapisanych danych."""
+        raise NotImplementedError
+
+    def _load_keys(self) -> None:
+        with self._keys_lock:
+            if self._phones is not None:
+                return
+            df = self._read_keys()
+            self._phones = {k for k in df.get("phone_norm", pd.Series(dtype=str)).dropna().astype(str) if k}
+            self._place_ids = {k for k in df.get("place_id", pd.Series(dtype=str)).dropna().astype(str) if k}
+
+    def _new_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Wiersze spoza historii (i bez powtórzeń w samym wsadzie)."""
+        self._load_keys()
+        batch_phones: Set[str] = set()
+        batch_place_ids: Set[str] = set()
+        fresh: List[bool] = []
+        for phone, place_id in zip(df["phone_norm"], df["place_id"]):
+            new = not ((phone and (phone in self._phones or phone in batch_phones))
+                       or (place_id and (place_id in self._place_ids or place_id in batch_place_ids)))
+            fresh.append(new)
+            if new:
+                batch_phones.add(phone)
+                batch_place_ids.add(place_id)
+        return df[fresh]
+
+    def _remember(self, df: pd.DataFrame) -> None:
+        """Po udanym zapisie — klucze dopisanych wierszy trafiają do historii."""
+        with self._keys_lock:
+            self._phones.update(k for k in df["phone_norm"] if k)
+            self._place_ids.update(k for k in df["place_id"] if k)
+
+    def known_place_ids(self, place_ids: List[str]) -> Set[str]:
+        self._load_keys()
+        return {p for p in place_ids if p and p in self._place_ids}
+
+    def write(self, rows: List[List[str]], city: str = "") -> int:
+        if not rows:
+            return 0
+        df = self._new_rows(rows_to_frame(rows, city))
+        if df.empty:
+            return 0
+        self._append(df)
+        self._remember(df)
+        return len(df)
+
+    def _append(self, df: pd.DataFrame) -> None:
+        raise NotImplementedError
+
+
+class CsvSink(KeyedSink):
+    """Dopisywanie do jednego pliku CSV (UTF-8 z BOM — otwiera się poprawnie w Excelu)."""
+    name = "csv"
+
+    def __init__(self, path: str = "firmy.csv"):
+        super().__init__()
+        self.path = path
+
+    def _read_keys(self) -> pd.DataFrame:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return pd.DataFrame()
+        return pd.read_csv(self.path, dtype=str, encoding="utf-8-sig",
+                           usecols=lambda c: c in ("phone_norm", "place_id"))
+
+    def _append(self, df: pd.DataFrame) -> None:
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        df.to_csv(self.path, mode="a", header=not exists, index=False,
+                  encoding="utf-8" if exists else "utf-8-sig")
+
+
+class ParquetSink(KeyedSink):
+    """
+    Zbiór Parquet: każdy wsad to nowy plik part-*.parquet w katalogu (czytany jako jeden dataset,
+    np. pd.read_parquet(katalog)). Wymaga pyarrow.
+    """
+    name = "parquet"
+
+    def __init__(self, directory: str = "firmy_parquet"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("ParquetSink wymaga pakietu pyarrow (pip install pyarrow)") from e
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _read_keys(self) -> pd.DataFrame:
+        parts = sorted(glob.glob(os.path.join(self.directory, "part-*.parquet")))
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat([pd.read_parquet(p, columns=["phone_norm", "place_id"]) for p in parts],
+                         ignore_index=True)
+
+    def _append(self, df: pd.DataFrame) -> None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        df.to_parquet(os.path.join(self.directory, f"part-{stamp}.parquet"), index=False)
+
+
+class SqliteSink(Sink):
+    """Tabela `companies` z kluczem na znormalizowanym numerze — duplikaty z historii są pomijane."""
+    name = "sqlite"
+    keeps_history = True
+
+    def __init__(self, path: str = "firmy.sqlite"):
+        self.path = path
+        # zapisy idą w wątku zapisu (pipeline.SAVE_EXECUTOR) — po jednym naraz
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS companies ("
+            " phone_norm TEXT PRIMARY KEY, place_id TEXT, term TEXT, website TEXT, name TEXT,"
+            " address TEXT, phone TEXT, city TEXT, collected_at TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_companies_place ON companies(place_id)")
+        self._conn.commit()
+
+    def write(self, rows: List[List[str]], city: str = "") -> int:
+        if not rows:
+            return 0
+        df = rows_to_frame(rows, city)
+        before = self._conn.total_changes
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO companies(phone_norm, place_id, term, website, name, address, phone,"
+                " city, collected_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                df[["phone_norm", "place_id", "term", "website", "name", "address", "phone",
+                    "city", "collected_at"]].itertuples(index=False, name=None)
+            )
+        return self._conn.total_changes - before
+
+    def known_place_ids(self, place_ids: List[str]) -> Set[str]:
+        ids = list({p for p in place_ids if p})
+        found: Set[str] = set()
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            q = f"SELECT place_id FROM companies WHERE place_id IN ({','.join('?' * len(chunk))})"
+            found.update(r[0] for r in self._conn.execute(q, chunk))
+        return found
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+SINK_TYPES = {cls.name: cls for cls in (ExcelSink, CsvSink, ParquetSink, SqliteSink)}
+
+
+def make_sinks(names: Sequence[str], filename: str = "firmy.xlsx",
+               shard_by: Optional[str] = None) -> List[Sink]:
+    """Buduje wyjścia z nazw (np. z config.json: "SINKS": ["excel", "sqlite"]). Nazwy plików od `filename`."""
+    base = os.path.splitext(filename)[0]
+    sinks: List[Sink] = []
+    for name in names:
+        if name == "excel":
+            sinks.append(ExcelSink(filename, shard_by))
+        elif name == "csv":
+            sinks.append(CsvSink(base + ".csv"))
+        elif name == "parquet":
+            sinks.append(ParquetSink(base + "_parquet"))
+        elif name == "sqlite":
+            sinks.append(SqliteSink(base + ".sqlite"))
+        else:
+            logger_util.log_warning(f"⚠ Nieznane wyjście: {name} (dostępne: {', '.join(SINK_TYPES)})")
+    return sinks
+
+
+def write_all(sinks: Sequence[Sink], rows: List[List[str]], city: str = "",
+              errors: Optional[List[str]] = None) -> int:
+    """
+    Zapisuje wsad do wszystkich wyjść. Błąd jednego wyjścia nie blokuje pozostałych.
+    Zwraca liczbę dopisanych w pierwszym (głównym) wyjściu.
+    errors — dopisywane są tu nazwy wyjść, których zapis się nie udał.
+    """
+    added: List[int] = []
+    for sink in sinks:
+        try:
+            added.append(sink.write(rows, city))
+        except Exception as e:
+            logger_util.log_error(f"❌ Błąd zapisu do wyjścia {sink.name}: {e}")
+            added.append(0)
+            if errors is not None:
+                errors.append(sink.name)
+    return added[0] if added else 0
+
+
+def write_grouped(sinks: Sequence[Sink], by_city: Dict[CityKey, List[List[str]]],
+                  metrics: Optional[RunMetrics] = None,
+                  failed_cities: Optional[Set[CityKey]] = None) -> int:
+    """
+    Zapisuje wsady pogrupowane po (mieście, promieniu): wyjścia per_city dostają osobny zapis dla
+    każdej grupy, pozostałe — jeden zapis na całość. Zwraca liczbę dopisanych w pierwszym wyjściu.
+    metrics — czas zapisu każdego wyjścia (save_<nazwa>).
+    failed_cities — dopisywane są tu grupy, których rekordy nie trafiły do któregoś wyjścia.
+    """
+    first = 0
+    for i, sink in enumerate(sinks):
+        with maybe_span(metrics, f"save_{sink.name}"):
+            if sink.per_city:
+                added = 0
+                for key, rows in by_city.items():
+                    if not rows:
+                        continue
+                    errors: List[str] = []
+                    added += write_all([sink], rows, key[0], errors)
+                    if errors and failed_cities is not None:
+                        failed_cities.add(key)
+            else:
+                rows = [r for city_rows in by_city.values() for r in city_rows]
+                errors = []
+                added = write_all([sink], rows, errors=errors) if rows else 0
+                if errors and failed_cities is not None:
+                    failed_cities.update(key for key, city_rows in by_city.items() if city_rows)
+        if i == 0:
+            first = added
+    return first
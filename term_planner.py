@@ -0,0 +1,174 @@
+import os
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import logger_util
+from geocode_cache import normalize_city
+
+
+DEFAULT_STATS_FILE = "term_yield.json"
+
+# ===== Decyzje planera =====
+FULL, REDUCED, SKIP = "full", "reduced", "skip"
+
+MIN_RUNS = 2            # tyle obserwacji frazy w regionie, zanim planner zacznie ją przycinać
+REDUCED_SHARE = 0.10    # < 10% firm nieznalezionych przez frazy wyżej w kolejności — tylko pierwsza strona, bez kafli
+SKIP_SHARE = 0.02       # < 2% — fraza pomijana
+RECHECK_EVERY = 5       # przycięta/pominięta fraza co tyle przebiegów idzie w pełni (wydajność się zmienia)
+REDUCED_PAGES = 1       # limit stron na prostokąt dla fraz przyciętych
+SMOOTHING = 0.5         # waga najnowszego przebiegu w średniej kroczącej
+
+
+@dataclass
+class TermPlan:
+    """Plan fraz dla jednego miasta: kolejność, limity stron i zapytania pobrane w tym przebiegu."""
+    city: str
+    terms: List[str]                                        # frazy do pobrania, najwydajniejsze najpierw
+    decisions: Dict[str, str]                               # fraza -> FULL / REDUCED / SKIP
+    expected_saved: float = 0.0                             # szacowane zaoszczędzone zapytania
+    pages: Dict[str, int] = field(default_factory=dict)     # wykonane strony wg frazy
+
+    @property
+    def skipped(self) -> List[str]:
+        return [t for t, d in self.decisions.items() if d == SKIP]
+
+    @property
+    def reduced(self) -> List[str]:
+        return [t for t, d in self.decisions.items() if d == REDUCED]
+
+    def max_pages(self, term: str) -> Optional[int]:
+        """Limit stron na prostokąt (None — pełna paginacja)."""
+        return REDUCED_PAGES if self.decisions.get(term) == REDUCED else None
+
+    def count_page(self, term: str) -> None:
+        self.pages[term] = self.pages.get(term, 0) + 1
+
+    def summary(self) -> str:
+        full = len(self.terms) - len(self.reduced)
+        return (f"🧭 Planer fraz [{self.city}]: pełne {full}, przycięte {len(self.reduced)}, "
+                f"pominięte {len(self.skipped)} — oszczędność ~{self.expected_saved:.0f} zapytań")
+
+
+class TermPlanner:
+    """
+    Planer fraz oparty na wydajności z poprzednich przebiegów (plik JSON, wpis na region i frazę).
+    Po każdym ukończonym mieście zapisuje dla frazy: ile stron kosztowała, ile firm znalazła
+    i ilu z nich nie znalazła żadna fraza wyżej w kolejności planu (wydajność krańcowa,
+    pipeline.TermYield). Przy kolejnym przebiegu w tym regionie frazy idą od najwydajniejszej
+    (firmy krańcowe na zapytanie), a frazy, które prawie zawsze dublują wyższe, są przycinane
+    do pierwszej strony (REDUCED_SHARE) albo pomijane (SKIP_SHARE) — z dwóch frazy-duplikatów
+    zostaje ta wyżej w kolejności. Co RECHECK_EVERY przebiegów taka fraza idzie znowu w pełni,
+    żeby statystyka nie zastygła. Nowe frazy i regiony bez historii zawsze idą w pełni.
+    prune=False — tylko kolejność i pomiar (plan podaje, ile dałoby się zaoszczędzić).
+    """
+
+    def __init__(self, path: str = DEFAULT_STATS_FILE, prune: bool = True):
+        self.path = path
+        self.prune = prune
+        self._stats: Optional[Dict[str, Dict[str, Dict[str, float]]]] = None  # wczytywane leniwie
+
+    # ----- dysk -----
+    def _load(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        if self._stats is None:
+            self._stats = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._stats = json.load(f)
+                except Exception as e:
+                    logger_util.log_warning(f"⚠ Nie udało się wczytać {self.path}: {e}")
+        return self._stats
+
+    def save(self) -> None:
+        """Zapis atomowy (plik tymczasowy + os.replace)."""
+        if self._stats is None:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._stats, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            logger_util.log_error(f"Błąd zapisu {self.path}: {e}")
+
+    # ----- statystyki -----
+    def stats(self, city: str, term: str) -> Optional[Dict[str, float]]:
+        return self._load().get(normalize_city(city), {}).get(term)
+
+    def _global_rate(self, term: str) -> Optional[float]:
+        """Średnia liczba firm krańcowych na zapytanie we wszystkich regionach (kolejność w nowym regionie)."""
+        rates = [_rate(terms[term]) for terms in self._load().values() if term in terms]
+        return sum(rates) / len(rates) if rates else None
+
+    def _decide(self, entry: Optional[Dict[str, float]]) -> str:
+        if entry is None or entry["runs"] < MIN_RUNS or entry.get("since_full", 0) >= RECHECK_EVERY:
+            return FULL
+        if entry["share"] < SKIP_SHARE:
+            return SKIP
+        if entry["share"] < REDUCED_SHARE:
+            return REDUCED
+        return FULL
+
+    # ----- API -----
+    def plan(self, city: str, categories: Iterable[str]) -> TermPlan:
+        categories = list(dict.fromkeys(categories))
+        entries = {t: self.stats(city, t) for t in categories}
+        decisions = {t: self._decide(entries[t]) for t in categories}
+
+        def _order(item: Tuple[int, str]) -> Tuple[int, float, int]:
+            i, term = item
+            entry = entries[term]
+            rate = _rate(entry) if entry is not None else self._global_rate(term)
+            # malejąco wg wydajności; frazy bez historii na końcu — mierzone względem znanych
+            return (1 if rate is None else 0, -(rate or 0.0), i)
+
+        ordered = [t for _, t in sorted(enumerate(categories), key=_order)]
+        saved = 0.0
+        for term, decision in decisions.items():
+            requests = entries[term]["requests"] if entries[term] is not None else 0.0
+            if decision == SKIP:
+                saved += requests
+            elif decision == REDUCED:
+                saved += max(0.0, requests - REDUCED_PAGES)
+        if not self.prune:
+            return TermPlan(city, ordered, dict.fromkeys(categories, FULL), saved)
+        return TermPlan(city, [t for t in ordered if decisions[t] != SKIP], decisions, saved)
+
+    def record(self, plan: TermPlan, found: Dict[str, int], marginal: Dict[str, int]) -> None:
+        """
+        Wyniki ukończonego miasta: found/marginal — firmy znalezione / krańcowe wg frazy (TermYield).
+        Wywoływać tylko dla miast pobranych do końca (przerwane zaniżałyby wydajność).
+        """
+        region = self._load().setdefault(normalize_city(plan.city), {})
+        for term, decision in plan.decisions.items():
+            entry = region.get(term)
+            if decision == SKIP:
+                if entry is not None:
+                    entry["since_full"] = entry.get("since_full", 0) + 1
+                continue
+            n_found = found.get(term, 0)
+            share = marginal.get(term, 0) / n_found if n_found else 0.0
+            if entry is None:
+                region[term] = entry = {"runs": 0, "share": share, "marginal": float(marginal.get(term, 0)),
+                                        "requests": float(plan.pages.get(term, 0))}
+            else:
+                entry["share"] = _smooth(entry["share"], share)
+            entry["runs"] += 1
+            entry["ts"] = time.time()
+            if decision == FULL:
+                # koszt i wynik pełnej paginacji — tylko z przebiegów bez limitu stron
+                entry["requests"] = _smooth(entry["requests"], plan.pages.get(term, 0))
+                entry["marginal"] = _smooth(entry["marginal"], marginal.get(term, 0))
+                entry["since_full"] = 0
+            else:
+                entry["since_full"] = entry.get("since_full", 0) + 1
+
+
+def _smooth(old: float, new: float) -> float:
+    return (1 - SMOOTHING) * old + SMOOTHING * new
+
+
+def _rate(entry: Dict[str, float]) -> float:
+    return entry["marginal"] / max(1.0, entry["requests"])
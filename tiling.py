@@ -0,0 +1,47 @@
+import math
+from typing import Dict, List
+
+# Places API (searchText) zwraca maks. 3 strony po 20 wyników
+SATURATION_RESULTS = 60
+DEFAULT_MIN_TILE_M = 1000   # [m] krótszy bok kafla, poniżej którego nie dzielimy
+
+M_PER_DEG_LAT = 111000
+
+Bounds = Dict[str, Dict[str, float]]
+
+
+def tile_size_m(bounds: Bounds) -> float:
+    """Krótszy bok prostokąta w metrach."""
+    low, high = bounds["low"], bounds["high"]
+    mid_lat = (low["latitude"] + high["latitude"]) / 2
+    h = (high["latitude"] - low["latitude"]) * M_PER_DEG_LAT
+    w = (high["longitude"] - low["longitude"]) * M_PER_DEG_LAT * abs(math.cos(math.radians(mid_lat)))
+    return min(h, w)
+
+
+def split_bounds(bounds: Bounds) -> List[Bounds]:
+    """Dzieli prostokąt na 4 ćwiartki (quadtree)."""
+    low, high = bounds["low"], bounds["high"]
+    mid_lat = (low["latitude"] + high["latitude"]) / 2
+    mid_lng = (low["longitude"] + high["longitude"]) / 2
+    lats = [(low["latitude"], mid_lat), (mid_lat, high["latitude"])]
+    lngs = [(low["longitude"], mid_lng), (mid_lng, high["longitude"])]
+    return [
+        {"low": {"latitude": la0, "longitude": lo0}, "high": {"latitude": la1, "longitude": lo1}}
+        for la0, la1 in lats for lo0, lo1 in lngs
+    ]
+
+
+def intersects_circle(bounds: Bounds, lat: float, lng: float, radius_m: float) -> bool:
+    """Czy prostokąt ma część wspólną z kołem (lat, lng, radius_m)? Przybliżenie równoodległościowe."""
+    low, high = bounds["low"], bounds["high"]
+    near_lat = min(max(lat, low["latitude"]), high["latitude"])
+    near_lng = min(max(lng, low["longitude"]), high["longitude"])
+    dy = (near_lat - lat) * M_PER_DEG_LAT
+    dx = (near_lng - lng) * M_PER_DEG_LAT * abs(math.cos(math.radians(lat)))
+    return dx * dx + dy * dy <= radius_m * radius_m
+
+
+def is_saturated(raw_results: int) -> bool:
+    """Zapytanie trafiło w limit wyników — w kaflu najpewniej jest więcej firm."""
+    return raw_results >= SATURATION_RESULTS